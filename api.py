@@ -0,0 +1,230 @@
+import time
+from flask import Response, render_template, request, url_for, jsonify
+from flask_login import login_required, current_user
+from sqlalchemy.orm import load_only
+from app import app, db
+from models import User, Appointment, Message, MedicalRecord
+from events import broker, format_sse, get_unread_counts, stream_slots, KEEPALIVE_SECONDS, STREAM_MAX_SECONDS
+from cart import CartError, add_item, cart_summary, set_quantity
+from uploads import CHUNK_SIZE, UploadError, append_chunk, start_upload, upload_status
+from utils import appointment_history, get_first_available_slot, mark_read, medical_record_history, notification_history, parse_datetime_arg
+
+@login_required
+def staff_calendar_events():
+    if not current_user.is_staff():
+        return jsonify([])
+
+    # Only the visible window, as sent by FullCalendar
+    query = db.session.query(
+        Appointment.appointment_date,
+        Appointment.patient_id,
+        User.first_name,
+        User.last_name
+    ).join(User, User.id == Appointment.patient_id)\
+     .filter(Appointment.doctor_id == current_user.id)
+    
+    start = parse_datetime_arg('start')
+    end = parse_datetime_arg('end')
+    if start:
+        query = query.filter(Appointment.appointment_date >= start)
+    if end:
+        query = query.filter(Appointment.appointment_date < end)
+    
+    events = []
+    for appt in query.order_by(Appointment.appointment_date):
+        events.append({
+            'title': f'Appointment with {appt.first_name} {appt.last_name}',
+            'start': appt.appointment_date.isoformat(),
+            'url': url_for('staff.patient_profile', patient_id=appt.patient_id)
+        })
+    return jsonify(events)
+
+@login_required
+def first_available():
+    doctors = User.query.filter_by(user_type='doctor', is_active=True)
+    specialty = request.args.get('specialty', '')
+    if specialty:
+        doctors = doctors.filter(User.specialty == specialty)
+    doctors = {d.id: d for d in doctors.options(load_only(User.id, User.first_name, User.last_name))}
+    
+    days_ahead = min(max(request.args.get('days', 7, type=int), 1), 60)
+    first = get_first_available_slot(list(doctors), days_ahead=days_ahead)
+    if first is None:
+        return jsonify({'available': False})
+    
+    slot, doctor_id = first
+    return jsonify({
+        'available': True,
+        'doctor_id': doctor_id,
+        'doctor_name': f'Dr. {doctors[doctor_id].full_name}',
+        'slot': slot.isoformat()
+    })
+
+@login_required
+def add_to_cart():
+    data = request.get_json(silent=True) or {}
+    try:
+        medicine_id = int(data['medicine_id'])
+        quantity = int(data.get('quantity', 1))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'A medicine_id is required'}), 400
+    if quantity < 1:
+        return jsonify({'error': 'Quantity must be at least 1'}), 400
+    try:
+        cart, item = add_item(current_user.id, medicine_id, quantity)
+    except CartError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status
+    db.session.commit()
+    return jsonify(cart_summary(cart, item))
+
+@login_required
+def cart_item(medicine_id):
+    if request.method == 'DELETE':
+        quantity = 0
+    else:
+        quantity = (request.get_json(silent=True) or {}).get('quantity')
+        if not isinstance(quantity, int):
+            return jsonify({'error': 'A whole-number quantity is required'}), 400
+    try:
+        cart, item = set_quantity(current_user.id, medicine_id, quantity)
+    except CartError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status
+    db.session.commit()
+    return jsonify(cart_summary(cart, item))
+
+@login_required
+def unread_messages_count():
+    return jsonify({'count': current_user.unread_messages_count})
+
+@login_required
+def unread_notifications_count():
+    return jsonify({'count': current_user.unread_notifications_count})
+
+@login_required
+def event_stream():
+    # Past the limit the browser gives up on the stream and the page polls instead
+    if not stream_slots.acquire():
+        return jsonify({'error': 'Too many open streams'}), 503
+    try:
+        user_id = current_user.id
+        counts = get_unread_counts([user_id])[user_id]
+    except Exception:
+        stream_slots.release()
+        raise
+    # Hand the connection back to the pool; the stream itself never touches the DB
+    db.session.close()
+
+    def generate():
+        yield 'retry: 5000\n'
+        yield format_sse('counts', counts)
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        for item in broker.listen(user_id, timeout=KEEPALIVE_SECONDS):
+            if item is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield format_sse(*item)
+            if time.monotonic() > deadline:
+                break
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Runs when the server closes the response, even if the client left before the first event
+    response.call_on_close(stream_slots.release)
+    return response
+
+@login_required
+def get_message(message_id):
+    try:
+        message = Message.query.get_or_404(message_id)
+        if message.sender_id != current_user.id and message.recipient_id != current_user.id:
+            app.logger.warning(f"Unauthorized API access attempt by user {current_user.id} to message {message_id}")
+            return jsonify({'error': 'Unauthorized access'}), 403
+        return jsonify({
+            'id': message.id,
+            'subject': message.subject,
+            'content': message.content,
+            'sender_full_name': message.sender.full_name if message.sender else 'Unknown',
+            'sender_user_type': message.sender.user_type.title() if message.sender else 'Unknown',
+            'created_at': message.created_at.strftime('%B %d, %Y at %I:%M %p')
+        })
+    except Exception as e:
+        app.logger.error(f"Error fetching message {message_id}: {e}")
+        return jsonify({'error': 'Failed to fetch message details'}), 500
+
+@login_required
+def mark_message_read(message_id):
+    try:
+        message = Message.query.get_or_404(message_id)
+        if message.recipient_id != current_user.id:
+            app.logger.warning(f"Unauthorized mark-read attempt by user {current_user.id} on message {message_id}")
+            return jsonify({'error': 'Unauthorized access'}), 403
+        if not message.is_read:
+            mark_read(message, current_user.id, messages=-1)
+            db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        app.logger.error(f"Error marking message {message_id} as read: {e}")
+        return jsonify({'error': 'Failed to mark message as read'}), 500
+
+@login_required
+def patient_history(patient_id, kind):
+    if not current_user.is_staff() and current_user.id != patient_id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+    
+    cursor = request.args.get('cursor')
+    if kind == 'appointments':
+        history = appointment_history(patient_id, cursor)
+        html = render_template('_appointment_history_rows.html', appointments=history.items)
+    elif kind == 'records':
+        history = medical_record_history(patient_id, cursor)
+        html = render_template('_medical_record_items.html', medical_records=history.items)
+    else:
+        return jsonify({'error': 'Unknown history'}), 404
+    
+    return jsonify({'html': html, 'next': history.next_num})
+
+@login_required
+def notifications():
+    notifications = notification_history(current_user.id, request.args.get('cursor'))
+    html = render_template('_notification_items.html', notifications=notifications.items)
+    return jsonify({'html': html, 'next': notifications.next_num})
+
+@login_required
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    try:
+        upload_id = start_upload(current_user.id, str(data.get('filename', ''))[:100],
+                                 int(data.get('size', -1)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'A filename and size are required'}), 400
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify(dict(upload_status(upload_id, current_user.id), chunk_size=CHUNK_SIZE)), 201
+
+@login_required
+def upload_chunk(upload_id):
+    try:
+        if request.method == 'GET':
+            return jsonify(upload_status(upload_id, current_user.id))
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'An offset is required'}), 400
+        # Read the raw body incrementally instead of letting Werkzeug buffer a form
+        return jsonify(append_chunk(upload_id, current_user.id, offset, request.stream))
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status
+
+@login_required
+def medical_record(record_id):
+    record = MedicalRecord.query.get_or_404(record_id)
+    if not current_user.is_staff() and record.patient_id != current_user.id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+    return jsonify({
+        'id': record.id,
+        'symptoms': record.symptoms,
+        'treatment': record.treatment
+    })
@@ -15,9 +15,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from database import engine_options
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL=DEBUG restores the verbose development output
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 class Base(DeclarativeBase):
     pass
@@ -32,21 +33,43 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool size, timeouts and driver settings follow the database and the gunicorn worker model
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # File upload configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# '' serves uploads from Python; 'x-accel' (nginx) or 'x-sendfile' (Apache) hands them to the web server
+app.config['UPLOAD_OFFLOAD'] = os.environ.get('UPLOAD_OFFLOAD', '')
+app.config['UPLOAD_ACCEL_PREFIX'] = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+
+# IANA zone of the clinic; appointment times are its wall-clock time and "today" is its calendar day
+app.config['CLINIC_TIMEZONE'] = os.environ.get('CLINIC_TIMEZONE', 'UTC')
+
+# Slow and periodic work runs in `flask run-worker`; JOBS_EAGER=true runs queued jobs inside the
+# caller instead. Anything a page shows live (notifications, counters) is written in the request
+app.config['JOBS_EAGER'] = os.environ.get('JOBS_EAGER', 'false').lower() == 'true'
+
+# /metrics answers requests bearing this token, or logged-in admins; unset, only admins
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Statements slower than this are logged and counted
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 200))
+# The same statement this many times in one request is flagged as an N+1 pattern
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+
+# Route areas this process serves, comma-separated (e.g. "api" or "pharmacy,lab"); unset serves all of them.
+# Links into the other areas still build, but their URLs answer 404 and their views are never imported
+app.config['ROUTE_AREAS'] = [area.strip() for area in os.environ.get('ROUTE_AREAS', '').split(',') if area.strip()]
+
+# db.create_all() at startup inspects every table; set false where the schema is already in place
+app.config['AUTO_CREATE_TABLES'] = os.environ.get('AUTO_CREATE_TABLES', 'true').lower() == 'true'
 
 # Initialize extensions
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
@@ -54,14 +77,40 @@ def load_user(user_id):
     from models import User
     return User.query.get(int(user_id))
 
-# Create tables
-with app.app_context():
-    # Import models to register them
-    import models  # noqa: F401
-    import routes  # Import routes to register all route handlers
-    db.create_all()
-    logging.info("Database tables created")
+_app_ready = False
 
-# Create upload directory
-import os
-os.makedirs('uploads', exist_ok=True)
+def create_app(cli=None):
+    """Register models, instrumentation and routes on the app and create missing tables; safe to call twice.
+
+    Migrations, maintenance and benchmark commands are only loaded for the flask CLI.
+    Under gunicorn --preload this runs once in the master, and nothing it
+    opens is carried into the forked workers.
+    """
+    global _app_ready
+    if _app_ready:
+        return app
+    if cli is None:
+        # Set by the flask command for every subcommand, never by gunicorn
+        cli = os.environ.get('FLASK_RUN_FROM_CLI') == 'true'
+
+    with app.app_context():
+        import models  # noqa: F401
+        import metrics  # noqa: F401  Request and SQL instrumentation
+        import routes  # Register the URL rules of every area
+        if cli:
+            from flask_migrate import Migrate
+            Migrate(app, db)
+            import commands  # noqa: F401  Maintenance and worker commands
+            import bench_commands  # noqa: F401  Benchmarks and the data seeder
+        else:
+            # Shared with the workers under --preload; the CLI imports views as they are used
+            routes.load_views()
+        if app.config['AUTO_CREATE_TABLES']:
+            db.create_all()
+            logging.info("Database tables created")
+        # Connections must not be shared with forked workers
+        db.engine.dispose()
+
+    os.makedirs('uploads', exist_ok=True)
+    _app_ready = True
+    return app
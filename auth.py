@@ -0,0 +1,81 @@
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy import or_
+from app import db
+from models import User
+from forms import LoginForm, RegistrationForm
+from utils import create_notifications
+
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+    
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=form.username.data).first()
+        if user and user.check_password(form.password.data) and user.is_active:
+            login_user(user, remember=True)
+            flash('Login successful!', 'success')
+            next_page = request.args.get('next')
+            # Security check for next_page to prevent open redirect attacks
+            if next_page and next_page.startswith('/'):
+                return redirect(next_page)
+            return redirect(url_for('index'))
+        else:
+            flash('Invalid username or password', 'danger')
+    
+    return render_template('login.html', form=form)
+
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for('index'))
+    
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        # Check if username or email already exists
+        existing_user = User.query.filter(
+            or_(User.username == form.username.data, User.email == form.email.data)
+        ).first()
+        
+        if existing_user:
+            flash('Username or email already exists', 'danger')
+            return render_template('register.html', form=form)
+        
+        # Create new user
+        user = User(
+            username=form.username.data,
+            email=form.email.data,
+            first_name=form.first_name.data,
+            last_name=form.last_name.data,
+            phone=form.phone.data,
+            date_of_birth=form.date_of_birth.data,
+            gender=form.gender.data,
+            user_type=form.user_type.data,
+            specialty=form.specialty.data if form.user_type.data in ['doctor', 'nurse'] else None,
+            license_number=form.license_number.data if form.user_type.data in ['doctor', 'nurse'] else None,
+            department=form.department.data if form.user_type.data in ['doctor', 'nurse'] else None
+        )
+        user.set_password(form.password.data)
+        
+        db.session.add(user)
+        db.session.flush()  # Get user ID
+        
+        # Create welcome notification
+        create_notifications([(
+            user.id,
+            'Welcome to Healthcare24/7!',
+            'Thank you for registering with us. Your account has been created successfully.',
+            'system'
+        )])
+        db.session.commit()
+        
+        flash('Registration successful! Please login.', 'success')
+        return redirect(url_for('auth.login'))
+    
+    return render_template('register.html', form=form)
+
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out.', 'info')
+    return redirect(url_for('index'))
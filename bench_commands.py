@@ -0,0 +1,332 @@
+import gc
+import os
+import sys
+import json
+import time
+import click
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import and_, create_engine, insert
+from app import app, db
+from benchmark import SCENARIOS, compare_reports, count_queries, run_benchmarks
+from database import engine_options
+from models import Appointment, Notification, User
+from seeding import SEED_PASSWORD, seed_database
+from utils import cleanup_old_notifications, get_dashboard_stats, send_appointment_reminder
+
+
+def require_empty(command, model):
+    """Stop `command` unless `model`'s table is empty, so seeded rows never mix with real ones"""
+    if db.session.query(model.id).first() is not None:
+        raise SystemExit(f'{command} seeds its own data; run it against an empty scratch database')
+
+
+@app.cli.command('bench-dashboard')
+@click.option('--runs', default=200, help='Number of times to compute each dashboard.')
+def bench_dashboard(runs):
+    """Report query count and latency of get_dashboard_stats per role."""
+    for user_type in ['patient', 'doctor', 'nurse']:
+        user = User.query.filter_by(user_type=user_type).first()
+        if user is None:
+            click.echo(f'{user_type:8} no user of this type, skipped')
+            continue
+
+        with count_queries() as statements:
+            get_dashboard_stats(user)
+        start = time.perf_counter()
+        for _ in range(runs):
+            get_dashboard_stats(user)
+        elapsed = (time.perf_counter() - start) / runs * 1000
+
+        click.echo(f'{user_type:8} {len(statements)} queries  {elapsed:.2f} ms/dashboard')
+
+
+@app.cli.command('bench-reminders')
+@click.option('--appointments', default=10000, help='Appointments to schedule for tomorrow.')
+def bench_reminders(appointments):
+    """Measure reminder throughput. Seeds data, so use an empty scratch database."""
+    require_empty('bench-reminders', Appointment)
+
+    doctors = max(1, appointments // 16)
+    users = [{'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': '-',
+              'first_name': 'Bench', 'last_name': str(i),
+              'user_type': 'doctor' if i < doctors else 'patient'}
+             for i in range(doctors + appointments)]
+    db.session.execute(insert(User), users)
+    ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+    tomorrow = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    db.session.execute(insert(Appointment), [
+        {'patient_id': ids[doctors + i], 'doctor_id': ids[i % doctors],
+         'appointment_date': tomorrow + timedelta(minutes=30 * (i // doctors)), 'status': 'scheduled'}
+        for i in range(appointments)
+    ])
+    db.session.commit()
+
+    with count_queries() as statements:
+        start = time.perf_counter()
+        created = send_appointment_reminder()
+        elapsed = time.perf_counter() - start
+
+    click.echo(f'{appointments} appointments -> {created} reminders in {elapsed:.2f}s '
+               f'({created / elapsed:,.0f} notifications/s, {len(statements)} statements)')
+
+
+def _seed_notifications(user_id, rows):
+    # 80% old and read (purged), the rest unread or recent (kept)
+    old = datetime.utcnow() - timedelta(days=90)
+    recent = datetime.utcnow()
+    for start in range(0, rows, 50000):
+        db.session.execute(insert(Notification), [
+            {'user_id': user_id, 'title': 'Bench', 'message': f'Notification {i}', 'notification_type': 'system',
+             'is_read': i % 10 != 0, 'created_at': recent if i % 10 == 9 else old + timedelta(seconds=i)}
+            for i in range(start, min(start + 50000, rows))
+        ])
+        db.session.commit()
+    return sum(1 for i in range(rows) if i % 10 not in (0, 9))
+
+
+def _measure(purge):
+    tracemalloc.start()
+    start = time.perf_counter()
+    removed = purge()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return removed, elapsed, peak
+
+
+@app.cli.command('bench-notification-cleanup')
+@click.option('--rows', default=5000000, help='Notifications to seed for the batched purge.')
+@click.option('--legacy-rows', default=100000, help='Notifications to seed for the old one-by-one purge (0 to skip).')
+@click.option('--batch-size', default=5000, help='Rows deleted per transaction.')
+def bench_notification_cleanup(rows, legacy_rows, batch_size):
+    """Compare batched notification purging with the old ORM loop. Seeds data, so use an empty scratch database."""
+    require_empty('bench-notification-cleanup', Notification)
+    user = User(username='purge-bench', email='purge-bench@example.com', password_hash='-',
+                first_name='Purge', last_name='Bench', user_type='patient')
+    db.session.add(user)
+    db.session.commit()
+
+    def legacy():
+        # The pre-batching implementation: every row loaded and deleted through the ORM
+        cutoff = datetime.utcnow() - timedelta(days=30)
+        old = Notification.query.filter(and_(Notification.is_read == True, Notification.created_at < cutoff)).all()
+        for notification in old:
+            db.session.delete(notification)
+        db.session.commit()
+        return len(old)
+
+    batch_times = []
+
+    def batched():
+        last = [time.perf_counter()]
+
+        def progress(removed):
+            now = time.perf_counter()
+            batch_times.append(now - last[0])
+            last[0] = now
+        return cleanup_old_notifications(30, batch_size, progress=progress)
+
+    for label, count, purge in [('legacy', legacy_rows, legacy), ('batched', rows, batched)]:
+        if not count:
+            continue
+        expected = _seed_notifications(user.id, count)
+        removed, elapsed, peak = _measure(purge)
+        kept = Notification.query.count()
+        click.echo(f'{label:8} {count:>10,} rows: removed {removed:,} in {elapsed:.2f}s '
+                   f'({removed / elapsed:,.0f} rows/s), peak Python memory {peak / 2**20:.1f} MiB, kept {kept:,}')
+        if label == 'batched' and batch_times:
+            batch_times.sort()
+            click.echo(f'         {len(batch_times)} batches of {batch_size}: median {batch_times[len(batch_times) // 2] * 1000:.0f}ms, '
+                       f'slowest {batch_times[-1] * 1000:.0f}ms per transaction')
+        if removed != expected:
+            raise SystemExit(f'{label} purge removed {removed:,} rows, expected {expected:,}')
+        Notification.query.delete()
+        db.session.commit()
+
+    db.session.delete(user)
+    db.session.commit()
+
+
+@app.cli.command('seed-data')
+@click.option('--scale', default=1.0, help='Multiplier for SEED_VOLUMES; 1 is 100k patients, 1k doctors, 5M appointments, 20M messages and notifications.')
+@click.option('--seed', default=42, help='Random seed; the same seed and scale give the same data.')
+@click.option('--batch-size', default=50000, help='Rows per INSERT.')
+def seed_data(scale, seed, batch_size):
+    """Fill an empty database with realistic synthetic data for benchmarks."""
+    require_empty('seed-data', User)
+    start = time.perf_counter()
+
+    def progress(table, done, total):
+        # Every million rows, and when a table is complete
+        if done == total or done % 1000000 < batch_size:
+            click.echo(f'{table:20} {done:>12,}/{total:,}  {time.perf_counter() - start:7.1f}s')
+
+    volumes = seed_database(scale, seed, batch_size, progress)
+    click.echo(f'Seeded {sum(volumes.values()):,} rows in {time.perf_counter() - start:.1f}s; '
+               f'every account logs in with password {SEED_PASSWORD!r}')
+
+
+@app.cli.command('bench-endpoints')
+@click.option('--requests', 'count', default=200, help='Timed requests per scenario.')
+@click.option('--concurrency', default=4, help='Requests in flight at once.')
+@click.option('--warmup', default=20, help='Untimed requests per scenario before measuring.')
+@click.option('--users', default=20, help='Distinct users per role to spread requests over.')
+@click.option('--scenario', 'names', multiple=True, type=click.Choice(list(SCENARIOS)), help='Run only this scenario; repeatable.')
+@click.option('--url', 'base_url', default=None, help='Drive a running server, e.g. a local gunicorn at http://127.0.0.1:8000, instead of the test client.')
+@click.option('--seed', default=42, help='Random seed for users and request parameters.')
+@click.option('--save', 'save_path', default=None, help='Write the report to this JSON file, e.g. to use as the next baseline.')
+@click.option('--baseline', 'baseline_path', default=None, help='Compare with a saved report and fail on regressions.')
+@click.option('--tolerance', default=0.2, help='Relative change in p95, throughput or queries per request counted as a regression.')
+def bench_endpoints(count, concurrency, warmup, users, names, base_url, seed, save_path, baseline_path, tolerance):
+    """Load-test the key pages and report latency percentiles, throughput and queries per request.
+
+    Booking and checkout write, so run this against a database filled by
+    seed-data.  With --url, query counts come from the server's /metrics,
+    which needs the same METRICS_TOKEN in this environment.
+    """
+    if base_url is None:
+        # Forms are posted without a token by the in-process client
+        app.config['WTF_CSRF_ENABLED'] = False
+    click.echo(f"{'scenario':18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8} {'errors':>6}")
+
+    def progress(name, result):
+        queries = '-' if result['queries'] is None else result['queries']
+        click.echo(f"{name:18} {result['p50_ms']:8} {result['p95_ms']:8} {result['p99_ms']:8} "
+                   f"{result['rps']:8} {queries:>8} {result['errors']:6}")
+
+    report = run_benchmarks(list(names or SCENARIOS), count, concurrency, warmup, users, seed, base_url, progress)
+    if save_path:
+        with open(save_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f'Saved report to {save_path}')
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = 0
+        click.echo(f"\nCompared with {baseline_path} ({baseline['created_at']}, {baseline['driver']})")
+        for name, metric, old, new, regressed in compare_reports(baseline, report, tolerance):
+            change = (new - old) / old * 100 if old else 0
+            regressions += regressed
+            click.echo(f"{'FAIL' if regressed else 'ok  '} {name:18} {metric:8} {old:>10} -> {new:<10} {change:+6.1f}%")
+        if regressions:
+            raise SystemExit(f'{regressions} regressions beyond {tolerance:.0%}')
+
+
+# Run in a fresh interpreter: how long importing the app takes, startup work included, and peak memory after
+STARTUP_PROBE = ('import time, resource; start = time.perf_counter(); import main; '
+                 'print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)')
+
+
+def _cold_start(env, runs):
+    """Median (process seconds, import seconds, peak KiB) over fresh interpreters that load the app"""
+    walls, imports, peaks = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', STARTUP_PROBE], env=env, cwd=app.root_path,
+                                capture_output=True, text=True, check=True)
+        walls.append(time.perf_counter() - start)
+        imported, peak = result.stdout.split()[-2:]
+        imports.append(float(imported))
+        peaks.append(int(peak))
+    return statistics.median(walls), statistics.median(imports), statistics.median(peaks)
+
+
+def _private_dirty():
+    # Bytes this process wrote to its own copies of pages, or None off Linux
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Private_Dirty:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _fork_worker(freeze):
+    """(seconds until a forked child runs, bytes its first full collection copied) for this loaded process"""
+    if freeze:
+        gc.freeze()
+    read_end, write_end = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        ready = time.perf_counter() - start
+        before = _private_dirty()
+        gc.collect()
+        after = _private_dirty()
+        os.write(write_end, f'{ready} {after - before if before is not None else -1}'.encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        ready, copied = f.read().split()
+    os.waitpid(pid, 0)
+    gc.unfreeze()
+    return float(ready), int(copied)
+
+
+@app.cli.command('bench-startup')
+@click.option('--runs', default=5, help='Interpreters started or workers forked per configuration.')
+def bench_startup(runs):
+    """Compare cold start of the old eager startup with the lazy one, worker boot with --preload and the footprint of route-area pools."""
+    env = {key: value for key, value in os.environ.items() if key != 'FLASK_RUN_FROM_CLI'}
+    configurations = [
+        ('before: CLI modules + create_all', {**env, 'FLASK_RUN_FROM_CLI': 'true', 'AUTO_CREATE_TABLES': 'true'}),
+        ('after: create_all', {**env, 'AUTO_CREATE_TABLES': 'true'}),
+        ('after: AUTO_CREATE_TABLES=false', {**env, 'AUTO_CREATE_TABLES': 'false'}),
+    ]
+    click.echo(f'Cold start, paid by every worker without --preload (median of {runs})')
+    for label, environment in configurations:
+        wall, imported, peak = _cold_start(environment, runs)
+        click.echo(f'  {label:34} {wall * 1000:7.0f} ms  ({imported * 1000:.0f} ms loading the app, {peak / 1024:.1f} MiB)')
+
+    click.echo(f'Worker pools by ROUTE_AREAS, tables not checked (median of {runs})')
+    for areas in ['', 'api', 'pharmacy', 'auth,patient', 'staff']:
+        wall, imported, peak = _cold_start({**env, 'AUTO_CREATE_TABLES': 'false', 'ROUTE_AREAS': areas}, runs)
+        click.echo(f"  {areas or 'all areas':34} {wall * 1000:7.0f} ms  ({imported * 1000:.0f} ms loading the app, {peak / 1024:.1f} MiB)")
+
+    click.echo(f'Worker boot with --preload, forked from a loaded master (median of {runs})')
+    for label, freeze in [('without gc.freeze()', False), ('with gc.freeze()', True)]:
+        results = [_fork_worker(freeze) for _ in range(runs)]
+        ready = statistics.median(result[0] for result in results)
+        copied = statistics.median(result[1] for result in results)
+        memory = 'unknown on this platform' if copied < 0 else f'{copied / 2 ** 20:.1f} MiB'
+        click.echo(f'  {label:34} {ready * 1000:7.1f} ms  (first full collection copies {memory})')
+
+
+def _checkout_seconds(engine, count):
+    """Median seconds to check a connection out of the engine's pool and return it"""
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        with engine.connect():
+            pass
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+@app.cli.command('bench-db-checkout')
+@click.option('--checkouts', default=2000, help='Checkouts timed with and without a pre-ping.')
+def bench_db_checkout(checkouts):
+    """Show the pool chosen per worker class and time a checkout with and without pre-ping."""
+    # As Flask-SQLAlchemy resolved it, relative SQLite paths included
+    url = db.engine.url
+    click.echo(f'Pool per worker process on {db.engine.dialect.name}')
+    for worker_class, threads in [('sync', 1), ('gthread', 8), ('gevent', 1), ('', 1)]:
+        options = engine_options(url, {'WORKER_CLASS': worker_class, 'WORKER_THREADS': str(threads)})
+        label = f'{worker_class} x{threads}' if worker_class else 'CLI and job worker'
+        click.echo(f"  {label:20} {options.get('poolclass', type(db.engine.pool)).__name__:22} "
+                   f"size {options.get('pool_size', '-')} overflow {options.get('max_overflow', '-')} "
+                   f"timeout {options.get('pool_timeout', '-')} pre-ping {options.get('pool_pre_ping', False)}")
+
+    click.echo(f'Checkout from a warm pool (median of {checkouts})')
+    for pre_ping in [True, False]:
+        engine = create_engine(url, **engine_options(url, {'WORKER_CLASS': 'gthread', 'WORKER_THREADS': '8',
+                                                           'DB_POOL_PRE_PING': str(pre_ping)}))
+        seconds = _checkout_seconds(engine, checkouts)
+        engine.dispose()
+        click.echo(f"  {'with pre-ping' if pre_ping else 'without pre-ping':20} {seconds * 1e6:8.1f} us")
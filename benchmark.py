@@ -0,0 +1,255 @@
+import re
+import json
+import math
+import time
+import queue
+import random
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import app, db
+from dates import clinic_today, date_window
+from metrics import registry
+from models import Appointment, Medicine, User
+from seeding import LAST_NAMES, SEED_PASSWORD, SLOTS_PER_DAY
+
+PERCENTILES = (50, 95, 99)
+CSRF_TOKEN = re.compile(r'id="csrf_token"[^>]*value="([^"]+)"')
+QUERY_METRIC = re.compile(r'^health_request_queries_(sum|count)\{endpoint="([^"]*)"\} (\S+)$', re.M)
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements sent to the database inside the block, from any thread"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class ClientSession:
+    """A user driving the app in-process through the Flask test client"""
+
+    def __init__(self, user):
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+
+    def request(self, method, path, form=None, payload=None):
+        return self.client.open(path, method=method, data=form, json=payload).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time the request itself, not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """A user driving a running server over HTTP, logged in with the seeded password"""
+
+    def __init__(self, base_url, user):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        with self.opener.open(self.base_url + '/login') as response:
+            match = CSRF_TOKEN.search(response.read().decode())
+        self.csrf_token = match.group(1) if match else ''
+        status = self.request('POST', '/login', form={'username': user.username, 'password': SEED_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Could not log in as {user.username} (HTTP {status}); is the database seeded?')
+
+    def request(self, method, path, form=None, payload=None):
+        body, headers = None, {}
+        if payload is not None:
+            body, headers = json.dumps(payload).encode(), {'Content-Type': 'application/json'}
+        elif form is not None:
+            body = urllib.parse.urlencode({**form, 'csrf_token': self.csrf_token}).encode()
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def _calendar_events(session, context, rng):
+    start, end = date_window('month')
+    return 'GET', f'/api/staff/calendar-events?start={start:%Y-%m-%dT%H:%M:%S}Z&end={end:%Y-%m-%dT%H:%M:%S}Z', {}
+
+
+def _book_appointment(session, context, rng):
+    # After every existing booking, so repeated runs on one database still find free slots
+    day = context['first_free_day'] + timedelta(days=rng.randrange(3650))
+    slot = datetime.combine(day, datetime.min.time()) + timedelta(hours=9, minutes=30 * rng.randrange(SLOTS_PER_DAY))
+    return 'POST', '/book-appointment', {'form': {
+        'doctor_id': rng.choice(context['doctor_ids']), 'appointment_date': f'{slot:%Y-%m-%dT%H:%M}',
+        'reason': 'Benchmark visit'}}
+
+
+def _checkout(session, context, rng):
+    # Filling the cart is setup, only the checkout itself is timed
+    session.request('POST', '/api/cart/items', payload={'medicine_id': rng.choice(context['medicine_ids'])})
+    return 'POST', '/checkout', {'form': {'delivery_address': '1 Benchmark Street'}}
+
+
+# name -> (role, function(session, context, rng) returning (method, path, request options))
+SCENARIOS = {
+    'patient-dashboard': ('patient', lambda session, context, rng: ('GET', '/patient/dashboard', {})),
+    'staff-dashboard': ('doctor', lambda session, context, rng: ('GET', '/staff/dashboard', {})),
+    'patient-inbox': ('patient', lambda session, context, rng: ('GET', '/patient/messages', {})),
+    'staff-inbox': ('doctor', lambda session, context, rng: ('GET', '/staff/messages', {})),
+    'calendar-events': ('doctor', _calendar_events),
+    'search': ('doctor', lambda session, context, rng: ('GET', f'/search?query={rng.choice(LAST_NAMES)}', {})),
+    'book-appointment': ('patient', _book_appointment),
+    'checkout': ('patient', _checkout),
+}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _query_totals(base_url):
+    """{endpoint: [queries, requests]} from the metrics of the process serving the benchmark"""
+    if base_url is None:
+        text = registry.render()
+    else:
+        request = urllib.request.Request(base_url.rstrip('/') + '/metrics',
+                                         headers={'Authorization': f"Bearer {app.config['METRICS_TOKEN']}"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                text = response.read().decode()
+        except urllib.error.URLError:
+            return None
+    totals = {}
+    for kind, endpoint, value in QUERY_METRIC.findall(text):
+        totals.setdefault(endpoint, [0.0, 0.0])[kind == 'count'] = float(value)
+    return totals
+
+
+def _endpoint(method, path):
+    return app.url_map.bind('localhost').match(path.split('?', 1)[0], method=method)[0]
+
+
+def run_scenario(name, sessions, context, count, concurrency, warmup, seed, base_url=None):
+    """Send `warmup` untimed then `count` timed requests for one scenario; returns its statistics"""
+    role, build = SCENARIOS[name]
+    latencies, errors, requested = [], [], []
+
+    def send(index, timed):
+        rng = random.Random(f'{seed}:{name}:{index}:{timed}')
+        session = sessions[role].get()
+        try:
+            method, path, options = build(session, context, rng)
+            start = time.perf_counter()
+            status = session.request(method, path, **options)
+            elapsed = time.perf_counter() - start
+        except OSError:
+            # Connection refused or reset by the server under test
+            if timed:
+                errors.append(None)
+            return
+        finally:
+            sessions[role].put(session)
+        if timed:
+            latencies.append(elapsed)
+            requested.append((method, path))
+            if status >= 400:
+                errors.append(status)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda index: send(index, False), range(warmup)))
+        before = _query_totals(base_url)
+        start = time.perf_counter()
+        list(executor.map(lambda index: send(index, True), range(count)))
+        elapsed = time.perf_counter() - start
+    after = _query_totals(base_url)
+
+    queries = None
+    endpoint = _endpoint(*requested[0]) if requested else None
+    if before is not None and after is not None and endpoint in after:
+        done = after[endpoint][1] - before.get(endpoint, [0, 0])[1]
+        if done:
+            queries = round((after[endpoint][0] - before.get(endpoint, [0, 0])[0]) / done, 2)
+
+    result = {'requests': count, 'errors': len(errors), 'rps': round(count / elapsed, 1), 'queries': queries}
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 2) if latencies else None
+    return result
+
+
+def run_benchmarks(names, count=200, concurrency=4, warmup=20, users=20, seed=42, base_url=None, progress=None):
+    """Run the named scenarios one after another and return a report that can be saved as a baseline.
+
+    Booking and checkout write to the database, so point this at a
+    seeded scratch database rather than real data.
+    """
+    rng = random.Random(seed)
+    latest = db.session.query(db.func.max(Appointment.appointment_date)).scalar()
+    context = {
+        'first_free_day': max(clinic_today(), latest.date() if latest else clinic_today()) + timedelta(days=1),
+        'doctor_ids': [row.id for row in db.session.query(User.id).filter_by(user_type='doctor', is_active=True)
+                       .order_by(User.id).limit(1000)],
+        'medicine_ids': [row.id for row in db.session.query(Medicine.id)
+                         .filter(Medicine.is_active == True, Medicine.stock_quantity > 0)
+                         .order_by(Medicine.id).limit(1000)],
+    }
+    sessions = {}
+    for role in sorted({SCENARIOS[name][0] for name in names}):
+        ids = [row.id for row in db.session.query(User.id).filter_by(user_type=role, is_active=True).order_by(User.id)]
+        if not ids:
+            raise RuntimeError(f'No active {role} to benchmark with; run seed-data first')
+        sessions[role] = queue.Queue()
+        # At least one user per thread, so no session is shared by two requests at once
+        for user_id in rng.sample(ids, min(max(users, concurrency), len(ids))):
+            user = db.session.get(User, user_id)
+            sessions[role].put(HttpSession(base_url, user) if base_url else ClientSession(user))
+        if sessions[role].qsize() < concurrency:
+            raise RuntimeError(f'Only {len(ids)} active {role}s; lower --concurrency')
+
+    report = {'created_at': datetime.utcnow().isoformat(timespec='seconds'), 'driver': base_url or 'test-client',
+              'database': db.engine.dialect.name, 'concurrency': concurrency, 'scenarios': {}}
+    for name in names:
+        report['scenarios'][name] = run_scenario(name, sessions, context, count, concurrency, warmup, seed, base_url)
+        if progress:
+            progress(name, report['scenarios'][name])
+    return report
+
+
+def compare_reports(baseline, report, tolerance=0.2):
+    """(scenario, metric, before, after, regressed) per metric in both reports; p95, throughput and queries can regress"""
+    rows = []
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric in ['p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries']:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == 'rps':
+                regressed = new < old * (1 - tolerance)
+            elif metric == 'queries':
+                # Ignore fractional drift from requests that take another branch
+                regressed = new > old * (1 + tolerance) and new - old >= 1
+            else:
+                regressed = metric == 'p95_ms' and new > old * (1 + tolerance)
+            rows.append((name, metric, old, new, regressed))
+    return rows
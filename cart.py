@@ -0,0 +1,206 @@
+from datetime import datetime
+from decimal import Decimal
+from flask import session
+from sqlalchemy import case, delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app import db
+from models import Cart, CartItem, Medicine, MedicineOrder, MedicineOrderItem
+
+DELIVERY_FEE = Decimal('5.00')
+TAX_RATE = Decimal('0.08')
+# Most units of one medicine a cart may hold
+MAX_ITEM_QUANTITY = 99
+# Tries at a cart change that keeps losing to concurrent changes of the same item
+CART_CHANGE_ATTEMPTS = 3
+
+
+class CartError(Exception):
+    """A cart change that cannot be made, with the HTTP status to answer"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_cart(user_id, create=False):
+    """The user's cart, or None if they have none and `create` is False"""
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if cart is None and create:
+        cart = Cart(user_id=user_id, item_count=0, subtotal=0)
+        try:
+            with db.session.begin_nested():
+                db.session.add(cart)
+        except IntegrityError:
+            # Another request created it first
+            cart = Cart.query.filter_by(user_id=user_id).one()
+    return cart
+
+
+def current_cart(user_id):
+    """The user's cart, first moving in any cart an older version left in the session cookie"""
+    legacy = session.pop('cart', None)
+    for item in (legacy or {}).values():
+        try:
+            add_item(user_id, item['id'], item['quantity'])
+        except (CartError, KeyError, TypeError):
+            pass
+    if legacy:
+        db.session.commit()
+    return get_cart(user_id)
+
+
+def _adjust_totals(cart, quantity, amount):
+    # Relative update, so changes from two tabs at once both count
+    db.session.execute(
+        update(Cart).where(Cart.id == cart.id)
+        .values(item_count=Cart.item_count + quantity, subtotal=Cart.subtotal + amount,
+                updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(cart, ['item_count', 'subtotal', 'updated_at'])
+
+
+class _ItemChanged(Exception):
+    """Another request changed the same cart item between our read and our write"""
+
+
+def _change_item(user_id, medicine_id, target):
+    """Set a cart item to target(its current quantity), 0 removing it; returns (cart, item or None)"""
+    cart = get_cart(user_id, create=target(0) > 0)
+    if cart is None:
+        return None, None
+
+    # Fresh from the database, not the session's copy, so a retry sees the row the other request wrote
+    item = CartItem.query.filter_by(cart_id=cart.id, medicine_id=medicine_id)\
+        .options(joinedload(CartItem.medicine)).populate_existing().first()
+    previous = item.quantity if item else 0
+    quantity = target(previous)
+    if not 0 <= quantity <= MAX_ITEM_QUANTITY:
+        raise CartError(f'Quantity must be between 0 and {MAX_ITEM_QUANTITY}')
+    if item is None and quantity == 0:
+        return cart, None
+    medicine = item.medicine if item else Medicine.query.filter_by(id=medicine_id, is_active=True).first()
+    if medicine is None:
+        raise CartError('Medicine not found', 404)
+    if quantity > previous and quantity > (medicine.stock_quantity or 0):
+        raise CartError(f'Only {medicine.stock_quantity or 0} of {medicine.name} in stock', 409)
+
+    if item is None:
+        item = CartItem(cart_id=cart.id, medicine_id=medicine.id, quantity=quantity, unit_price=medicine.price)
+        item.medicine = medicine
+        try:
+            with db.session.begin_nested():
+                db.session.add(item)
+        except IntegrityError:
+            raise _ItemChanged()
+    else:
+        # Only if the quantity is still the one read above, so two tabs cannot overwrite each other
+        statement = delete(CartItem) if quantity == 0 else update(CartItem).values(quantity=quantity)
+        if db.session.execute(statement.where(CartItem.id == item.id, CartItem.quantity == previous)).rowcount != 1:
+            raise _ItemChanged()
+    _adjust_totals(cart, quantity - previous, (quantity - previous) * item.unit_price)
+    return cart, item if quantity else None
+
+
+def _change_item_retrying(user_id, medicine_id, target):
+    for attempt in range(CART_CHANGE_ATTEMPTS):
+        try:
+            return _change_item(user_id, medicine_id, target)
+        except _ItemChanged:
+            # Start over from the row the other request wrote
+            continue
+    raise CartError('The cart was changed elsewhere at the same time, please try again', 409)
+
+
+def set_quantity(user_id, medicine_id, quantity):
+    """Put exactly `quantity` of a medicine in the cart, 0 to remove it; returns (cart, item or None)"""
+    if not 0 <= quantity <= MAX_ITEM_QUANTITY:
+        raise CartError(f'Quantity must be between 0 and {MAX_ITEM_QUANTITY}')
+    return _change_item_retrying(user_id, medicine_id, lambda previous: quantity)
+
+
+def add_item(user_id, medicine_id, quantity=1):
+    """Add units of a medicine to the cart; returns (cart, item)"""
+    return _change_item_retrying(user_id, medicine_id, lambda previous: previous + quantity)
+
+
+def cart_items(cart):
+    """Items of a cart with their medicine names, in the order they were added"""
+    if cart is None:
+        return []
+    return CartItem.query.filter_by(cart_id=cart.id)\
+        .options(joinedload(CartItem.medicine).load_only(Medicine.name))\
+        .order_by(CartItem.id).all()
+
+
+def clear_cart(cart):
+    """Empty a cart inside the current transaction"""
+    db.session.execute(delete(CartItem).where(CartItem.cart_id == cart.id))
+    db.session.execute(
+        update(Cart).where(Cart.id == cart.id)
+        .values(item_count=0, subtotal=0, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(cart)
+
+
+def cart_summary(cart, item=None):
+    """Counts and totals for the cart badge and order summary, plus one item's line if given"""
+    subtotal = cart.subtotal if cart else Decimal('0.00')
+    tax = (subtotal * TAX_RATE).quantize(Decimal('0.01'))
+    summary = {
+        'count': cart.item_count if cart else 0,
+        'subtotal': float(subtotal),
+        'delivery_fee': float(DELIVERY_FEE),
+        'tax': float(tax),
+        'total': float(subtotal + DELIVERY_FEE + tax),
+    }
+    if item is not None:
+        summary['item'] = {'medicine_id': item.medicine_id, 'quantity': item.quantity,
+                           'total': float(item.unit_price * item.quantity)}
+    return summary
+
+
+def place_order(user_id, cart, items, delivery_address):
+    """Turn a cart into an order inside the current transaction; raises CartError if stock ran out.
+
+    Stock for every line is taken in one conditional UPDATE, so concurrent
+    checkouts can never oversell: a line only matches while enough stock
+    is left, and a short line leaves the caller to roll back the rest.
+    """
+    quantities = {item.medicine_id: item.quantity for item in items}
+    wanted = case(quantities, value=Medicine.id)
+    taken = db.session.execute(
+        update(Medicine)
+        .where(Medicine.id.in_(list(quantities)), Medicine.is_active == True,
+               Medicine.stock_quantity >= wanted)
+        .values(stock_quantity=Medicine.stock_quantity - wanted)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if taken != len(quantities):
+        short = db.session.query(Medicine.name).filter(
+            Medicine.id.in_(list(quantities)),
+            or_(Medicine.is_active != True, Medicine.stock_quantity < wanted)
+        ).order_by(Medicine.name)
+        names = ', '.join(row.name for row in short) or 'some items'
+        raise CartError(f'Not enough stock left for {names}. Please update your cart.', 409)
+
+    order = MedicineOrder(
+        user_id=user_id,
+        delivery_address=delivery_address,
+        total_amount=sum(item.unit_price * item.quantity for item in items)
+    )
+    db.session.add(order)
+    db.session.flush()
+    # Derived from the primary key, so two checkouts in the same second cannot collide
+    order.order_number = f'ORD{datetime.utcnow():%Y%m%d}{order.id:06d}'
+
+    db.session.execute(insert(MedicineOrderItem), [
+        {'order_id': order.id, 'medicine_id': item.medicine_id, 'quantity': item.quantity,
+         'unit_price': item.unit_price, 'total_price': item.unit_price * item.quantity}
+        for item in items
+    ])
+    clear_cart(cart)
+    # Stock is read live by the catalog pages, so the cached catalog stays valid
+    return order
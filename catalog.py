@@ -0,0 +1,165 @@
+import os
+import copy
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from sqlalchemy import event, func, select
+from app import app, db
+from models import Medicine, LabTest
+from pagination import keyset_paginate
+
+# Seconds a cached facet list or page is served before it is recomputed
+CATALOG_CACHE_TTL = 300
+CATALOG_CACHE_MAX_ENTRIES = 256
+# Columns every checkout changes: left out of cached pages and read for each request instead,
+# so orders do not empty the cache
+LIVE_COLUMNS = {Medicine: (Medicine.stock_quantity,)}
+
+
+class CatalogCache:
+    """In-process TTL/LRU cache, emptied whenever any worker bumps the shared generation file"""
+
+    def __init__(self, generation_path, max_entries=CATALOG_CACHE_MAX_ENTRIES, ttl=CATALOG_CACHE_TTL):
+        self.generation_path = generation_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def _current_generation(self):
+        # Every invalidation replaces the file, so its identity is the generation
+        try:
+            stat = os.stat(self.generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def get_or_set(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss"""
+        generation = self._current_generation()
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = compute()
+        # Skip storing a value that may predate an invalidation made meanwhile
+        if self._current_generation() == generation:
+            with self._lock:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Drop cached entries in this and every other worker"""
+        os.makedirs(os.path.dirname(self.generation_path), exist_ok=True)
+        temporary = f'{self.generation_path}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporary, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temporary, self.generation_path)
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_cache = CatalogCache(os.path.join(app.instance_path, 'catalog.generation'))
+
+
+def _snapshot(row, skip=()):
+    # Plain attribute copies are safe to share between threads and sessions
+    return SimpleNamespace(**{attr.key: getattr(row, attr.key) for attr in row.__mapper__.column_attrs
+                              if attr.key not in skip})
+
+
+def _with_live_columns(model, page):
+    """A copy of a cached page with the model's live columns read from the database"""
+    columns = LIVE_COLUMNS.get(model)
+    if not columns or not page.items:
+        return page
+    rows = db.session.execute(select(model.id, *columns).where(model.id.in_([item.id for item in page.items])))
+    live = {row.id: row._mapping for row in rows}
+    fresh = copy.copy(page)
+    # A row deleted since the page was cached shows as out of stock until the cache catches up
+    fresh.items = [SimpleNamespace(**vars(item), **{column.key: live[item.id][column.key] if item.id in live else 0
+                                                   for column in columns})
+                   for item in page.items]
+    return fresh
+
+
+def catalog_facets(model):
+    """Active rows per category for Medicine or LabTest, as {category: count}"""
+    def load():
+        rows = db.session.execute(
+            select(model.category, func.count())
+            .where(model.is_active == True)
+            .group_by(model.category)
+        )
+        return dict(rows.all())
+    return catalog_cache.get_or_set((model.__tablename__, 'facets'), load)
+
+
+def catalog_categories(model):
+    """Sorted category names that have active rows"""
+    return sorted(category for category in catalog_facets(model) if category is not None)
+
+
+def catalog_page(model, category='', cursor=None, per_page=12):
+    """One keyset page of active catalog rows, optionally within a category, served from the cache"""
+    facets = catalog_facets(model)
+    total = facets.get(category, 0) if category else sum(facets.values())
+
+    def load():
+        query = model.query.filter_by(is_active=True)
+        if category:
+            query = query.filter_by(category=category)
+        page = keyset_paginate(query, [(model.id, False)], cursor=cursor, per_page=per_page)
+        live = {column.key for column in LIVE_COLUMNS.get(model, ())}
+        page.items = [_snapshot(row, skip=live) for row in page.items]
+        # The cached facet count is exact, so the total costs no extra query
+        page.total = total
+        return page
+
+    page = catalog_cache.get_or_set((model.__tablename__, 'page', category, cursor, per_page), load)
+    return _with_live_columns(model, page)
+
+
+def invalidate_catalog():
+    """Invalidate once the current transaction commits; for writes that bypass the ORM"""
+    db.session.info['catalog_changed'] = True
+
+
+def _catalog_row_changed(mapper, connection, target):
+    invalidate_catalog()
+
+
+def _catalog_row_updated(mapper, connection, target):
+    live = {column.key for column in LIVE_COLUMNS.get(type(target), ())}
+    changed = {attr.key for attr in db.inspect(target).attrs if attr.history.has_changes()}
+    if changed - live:
+        invalidate_catalog()
+
+
+for model in (Medicine, LabTest):
+    event.listen(model, 'after_insert', _catalog_row_changed)
+    event.listen(model, 'after_update', _catalog_row_updated)
+    event.listen(model, 'after_delete', _catalog_row_changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('catalog_changed', None)
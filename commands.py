@@ -0,0 +1,81 @@
+import os
+import time
+import click
+import signal
+import multiprocessing
+from sqlalchemy import text
+from app import app, db
+from jobs import work
+from search import rebuild_search_index
+from uploads import cleanup_stale_uploads
+from utils import cleanup_old_notifications, reconcile_unread_counts
+
+
+@app.cli.command('reconcile-unread-counts')
+def reconcile_unread_counts_command():
+    """Rebuild per-user unread counters from messages and notifications."""
+    fixed = reconcile_unread_counts()
+    click.echo(f'Reconciled unread counters for {fixed} users')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index all searchable rows (run after bulk loads that bypass the ORM)."""
+    rebuild_search_index()
+    count = db.session.execute(text('SELECT count(*) FROM search_index')).scalar()
+    click.echo(f'Indexed {count} rows')
+
+
+@app.cli.command('cleanup-uploads')
+@click.option('--max-age-hours', default=24, help='Remove unfinished or unclaimed uploads older than this.')
+def cleanup_uploads_command(max_age_hours):
+    """Delete abandoned chunked uploads."""
+    removed = cleanup_stale_uploads(max_age_hours)
+    click.echo(f'Removed {removed} abandoned uploads')
+
+
+@app.cli.command('cleanup-notifications')
+@click.option('--days-old', default=30, help='Remove read notifications older than this.')
+@click.option('--batch-size', default=5000, help='Rows deleted per transaction.')
+@click.option('--archive', 'archive_path', default=None, help='Append removed rows to this gzipped JSON-lines file first.')
+def cleanup_notifications_command(days_old, batch_size, archive_path):
+    """Purge old read notifications in small batches."""
+    start = time.perf_counter()
+
+    def progress(removed):
+        click.echo(f'{removed:,} removed ({removed / (time.perf_counter() - start):,.0f}/s)')
+
+    removed = cleanup_old_notifications(days_old, batch_size, archive_path, progress)
+    click.echo(f'Removed {removed:,} notifications in {time.perf_counter() - start:.1f}s')
+
+
+def _work_process(once):
+    with app.app_context():
+        work(once=once)
+
+
+@app.cli.command('run-worker')
+@click.option('--processes', default=1, help='Worker processes to run.')
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of waiting for more.')
+def run_worker(processes, once):
+    """Run queued and periodic background jobs until stopped."""
+    if processes == 1:
+        click.echo(f'Ran {work(once=once)} jobs')
+        return
+
+    # Children must open their own connections rather than share the parent's
+    db.engine.dispose()
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_work_process, args=(once,)) for _ in range(processes)]
+    for child in children:
+        child.start()
+
+    def stop(signum, frame):
+        # Each child finishes its current job before exiting
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for child in children:
+        child.join()
@@ -0,0 +1,126 @@
+import os
+import time
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Connections kept open per worker process, by gunicorn worker class: (pool_size, max_overflow).
+# A sync worker serves one request at a time and a gthread worker one per thread; the
+# overflow covers the short second connection that publishing events after a commit takes
+POOL_SIZES = {
+    'sync': lambda threads: (1, 1),
+    'gthread': lambda threads: (threads, max(2, threads // 4)),
+    'gevent': lambda threads: (10, 10),
+    'eventlet': lambda threads: (10, 10),
+}
+# The flask CLI, dev server and job worker keep SQLAlchemy's defaults
+DEFAULT_POOL_SIZE = (5, 10)
+# Seconds a request waits for a free connection before failing, well under gunicorn's timeout
+POOL_TIMEOUT = 10
+# Seconds before a connection is replaced, ahead of server and proxy idle timeouts
+POOL_RECYCLE = 300
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the single writer,
+# and with it synchronous=NORMAL cannot corrupt the database while syncing only at checkpoints
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'temp_store': 'MEMORY',
+}
+
+# Called with (seconds, timed out) after every checkout through an instrumented pool
+checkout_listeners = []
+
+
+class TimedCheckout:
+    """Pool mixin that reports how long each checkout took, waiting and connecting included"""
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            for listener in checkout_listeners:
+                listener(time.perf_counter() - start, timed_out)
+
+
+class InstrumentedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(TimedCheckout, NullPool):
+    pass
+
+
+def _flag(environ, name, default):
+    return environ.get(name, str(default)).lower() == 'true'
+
+
+def engine_options(database_url, environ=os.environ):
+    """SQLAlchemy engine options for this database and the worker model serving it.
+
+    Pool sizes follow WORKER_CLASS and WORKER_THREADS, which gunicorn.conf.py
+    exports; DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and
+    DB_POOL_PRE_PING override the choice. DB_PGBOUNCER=true leaves pooling to
+    PgBouncer in transaction mode, so each checkout opens a fresh client
+    connection to it and nothing depends on session state.
+    """
+    if not database_url:
+        return {}
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Flask-SQLAlchemy keeps an in-memory database on one shared connection
+        return {}
+
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {'connect_timeout': 10, 'keepalives': 1, 'keepalives_idle': 60,
+                        'keepalives_interval': 10, 'keepalives_count': 3}
+        if _flag(environ, 'DB_PGBOUNCER', False):
+            if url.get_driver_name() == 'psycopg':
+                # Server-side prepared statements would land on another client's server connection
+                connect_args['prepare_threshold'] = None
+            return {'poolclass': InstrumentedNullPool, 'connect_args': connect_args}
+
+    size = POOL_SIZES.get(environ.get('WORKER_CLASS', ''), lambda threads: DEFAULT_POOL_SIZE)
+    pool_size, max_overflow = size(int(environ.get('WORKER_THREADS', 1)))
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', POOL_TIMEOUT)),
+        # The most recently used connection first, so spare ones idle out and get recycled
+        'pool_use_lifo': True,
+        # A ping is a round trip on every checkout; recycling and TCP keepalives catch
+        # dropped connections instead, and a disconnect error invalidates the whole pool
+        'pool_pre_ping': _flag(environ, 'DB_POOL_PRE_PING', False),
+    }
+    if connect_args:
+        options['pool_recycle'] = int(environ.get('DB_POOL_RECYCLE', POOL_RECYCLE))
+        options['connect_args'] = connect_args
+    return options
+
+
+def pool_capacity(options):
+    """Connections a pool built from these options can hand out at once, or None if unbounded"""
+    if options.get('poolclass') is not InstrumentedQueuePool or options['max_overflow'] < 0:
+        return None
+    return options['pool_size'] + options['max_overflow']
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
@@ -0,0 +1,53 @@
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_
+from app import app
+
+
+def clinic_timezone():
+    return ZoneInfo(app.config['CLINIC_TIMEZONE'])
+
+
+def clinic_now():
+    """Current wall-clock time at the clinic, naive like appointment_date"""
+    return datetime.now(clinic_timezone()).replace(tzinfo=None)
+
+
+def clinic_today():
+    """Today's date at the clinic"""
+    return clinic_now().date()
+
+
+def to_utc(local):
+    """Convert naive clinic wall-clock time to naive UTC, as stored by datetime.utcnow"""
+    return local.replace(tzinfo=clinic_timezone()).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def date_window(period='day', day=None, periods=1):
+    """Half-open (start, end) covering `periods` days, weeks (from Monday) or months from the one containing `day`"""
+    day = day or clinic_today()
+    if period == 'day':
+        start = day
+        end = day + timedelta(days=periods)
+    elif period == 'week':
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(weeks=periods)
+    elif period == 'month':
+        start = day.replace(day=1)
+        months = start.month - 1 + periods
+        end = date(start.year + months // 12, months % 12 + 1, 1)
+    else:
+        raise ValueError(f'Unknown period {period!r}')
+    return datetime.combine(start, time.min), datetime.combine(end, time.min)
+
+
+def in_window(column, period='day', day=None, periods=1, utc=False):
+    """`start <= column < end` for a calendar window, which an index on column can range-scan.
+
+    Windows are clinic calendar days.  appointment_date holds clinic
+    wall-clock time; pass utc=True for columns filled by datetime.utcnow.
+    """
+    start, end = date_window(period, day, periods)
+    if utc:
+        start, end = to_utc(start), to_utc(end)
+    return and_(column >= start, column < end)
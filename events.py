@@ -0,0 +1,191 @@
+import os
+import json
+import queue
+import logging
+import threading
+from collections import defaultdict
+from sqlalchemy import event, select
+from app import db
+from models import User
+
+try:
+    import redis
+except ImportError:  # Optional, only needed to fan out across gunicorn workers
+    redis = None
+
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+# Streams are closed after this long and the browser reconnects, so a
+# worker is never pinned to one tab indefinitely
+STREAM_MAX_SECONDS = 300
+# Open streams one worker process serves, by gunicorn worker class. A stream holds a
+# gthread thread for up to STREAM_MAX_SECONDS, so half the threads stay free for
+# requests; one tab would pin a sync worker, so it refuses streams and pages poll
+STREAM_LIMITS = {
+    'sync': lambda threads: 0,
+    'gthread': lambda threads: threads // 2,
+    'gevent': lambda threads: 1000,
+    'eventlet': lambda threads: 1000,
+}
+# The flask dev server starts a thread per request
+DEFAULT_STREAM_LIMIT = 16
+
+
+class LocalBroker:
+    """In-process pub/sub, enough for a single worker"""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, event_name, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_name, data))
+            except queue.Full:
+                # A stalled tab just misses events; counts are resent on reconnect
+                pass
+
+    def listen(self, user_id, timeout):
+        """Yield (event, data) tuples for a user, or None after `timeout` idle seconds"""
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=timeout)
+                except queue.Empty:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+
+class StreamSlots:
+    """Counts this process's open streams against its limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.open = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot, or return False if every slot is in use"""
+        with self._lock:
+            if self.open >= self.limit:
+                self.refused += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+class RedisBroker:
+    """Pub/sub through a Redis-compatible server, shared by all workers"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def _channel(self, user_id):
+        return f'health_web:user:{user_id}'
+
+    def publish(self, user_id, event_name, data):
+        self.client.publish(self._channel(user_id), json.dumps([event_name, data]))
+
+    def listen(self, user_id, timeout):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel(user_id))
+        try:
+            while True:
+                message = pubsub.get_message(timeout=timeout)
+                yield tuple(json.loads(message['data'])) if message else None
+        finally:
+            pubsub.close()
+
+
+def _create_broker():
+    url = os.environ.get('REDIS_URL')
+    if url and redis is not None:
+        return RedisBroker(url)
+    if url:
+        logging.warning('REDIS_URL is set but the redis package is not installed; '
+                        'events will only reach clients on the same worker')
+    return LocalBroker()
+
+
+def stream_limit(environ=os.environ):
+    """Streams one worker process may hold open; MAX_EVENT_STREAMS overrides the worker model's default"""
+    limit = STREAM_LIMITS.get(environ.get('WORKER_CLASS', ''), lambda threads: DEFAULT_STREAM_LIMIT)
+    return int(environ.get('MAX_EVENT_STREAMS', limit(int(environ.get('WORKER_THREADS', 1)))))
+
+
+broker = _create_broker()
+stream_slots = StreamSlots(stream_limit())
+
+
+def format_sse(event_name, data):
+    """Encode one Server-Sent Events frame"""
+    return f'event: {event_name}\ndata: {json.dumps(data)}\n\n'
+
+
+def get_unread_counts(user_ids, connection=None):
+    """Read the unread counters for a set of users"""
+    query = select(User.id, User.unread_messages_count, User.unread_notifications_count)\
+        .where(User.id.in_(list(user_ids)))
+    if connection is None:
+        rows = db.session.execute(query).all()
+    else:
+        rows = connection.execute(query).all()
+    return {row.id: {'messages': row.unread_messages_count,
+                     'notifications': row.unread_notifications_count} for row in rows}
+
+
+def queue_unread_counts(user_id):
+    """Push the user's counters to open streams once the transaction commits"""
+    db.session.info.setdefault('unread_changed', set()).add(user_id)
+
+
+def queue_notification(notification):
+    """Push a new notification to open streams once the transaction commits"""
+    db.session.info.setdefault('new_notifications', []).append((notification['user_id'], {
+        'title': notification['title'],
+        'message': notification['message'],
+        'type': notification['notification_type'],
+    }))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_after_commit(session):
+    changed = session.info.pop('unread_changed', set())
+    notifications = session.info.pop('new_notifications', [])
+    if not changed and not notifications:
+        return
+
+    try:
+        for user_id, payload in notifications:
+            broker.publish(user_id, 'notification', payload)
+        # The session cannot run SQL inside after_commit, so read on a fresh connection
+        changed = list(changed)
+        with db.engine.connect() as connection:
+            for start in range(0, len(changed), 500):
+                for user_id, counts in get_unread_counts(changed[start:start + 500], connection).items():
+                    broker.publish(user_id, 'counts', counts)
+    except Exception:
+        # Clients re-sync on reconnect or by polling, never fail the request
+        logging.exception('Failed to publish events')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('unread_changed', None)
+    session.info.pop('new_notifications', None)
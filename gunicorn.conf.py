@@ -0,0 +1,27 @@
+import gc
+import os
+
+# Worker model, exported so the app sizes its connection pool to match
+# (see database.py); set these variables instead of --worker-class/--threads
+worker_class = os.environ.setdefault('WORKER_CLASS', 'gthread')
+threads = int(os.environ.setdefault('WORKER_THREADS', '8'))
+# Each event stream holds a thread; past MAX_EVENT_STREAMS (half the threads by
+# default, see events.py) /api/stream answers 503 and pages poll instead
+
+# Import the app once in the master and fork workers from it: workers boot
+# in milliseconds, share the master's memory and skip the table check
+preload_app = True
+
+# With the collector off while the app loads, long-lived objects are packed
+# together instead of around freed holes, keeping more pages shareable
+gc.disable()
+
+
+def pre_fork(server, worker):
+    # Frozen objects are never scanned by the workers' collectors, so the
+    # pages holding them are not copied on write
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import signal
+import socket
+import logging
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import app, db
+from events import LocalBroker, broker
+from models import Job
+from thumbnails import pregenerate_thumbnails
+from uploads import cleanup_stale_uploads
+from utils import cleanup_old_notifications, send_appointment_reminder
+
+# Seconds an idle worker waits before looking for due jobs again
+JOB_POLL_SECONDS = 2
+# Seconds between a worker's checks for periodic and stalled jobs
+JOB_HOUSEKEEPING_SECONDS = 60
+# A running job not finished after this long belonged to a worker that died
+JOB_TIMEOUT_SECONDS = 15 * 60
+JOB_MAX_ATTEMPTS = 5
+# Retry n waits JOB_RETRY_BASE_SECONDS * 2**(n - 1)
+JOB_RETRY_BASE_SECONDS = 30
+# Finished jobs, and with them their idempotency keys, are kept this long
+JOB_RETENTION_DAYS = 7
+
+# name -> (function, max attempts)
+JOB_HANDLERS = {}
+
+# name -> (interval, offset into each interval).  Every worker enqueues the
+# current slot with an idempotency key, so each slot runs once however many
+# workers there are.
+PERIODIC_JOBS = {
+    'send_appointment_reminders': (timedelta(days=1), timedelta(hours=8)),
+    'cleanup_old_notifications': (timedelta(days=1), timedelta(hours=3)),
+    'cleanup_stale_uploads': (timedelta(hours=6), timedelta(0)),
+    'purge_finished_jobs': (timedelta(days=1), timedelta(hours=4)),
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+def job(name=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Register a function as a job handler; it receives the payload as keyword arguments"""
+    def register(func):
+        JOB_HANDLERS[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, run_at=None, key=None, **payload):
+    """Queue a job inside the current transaction; returns False if `key` was already queued.
+
+    The job only becomes visible to workers when the caller commits, so a
+    rolled-back request never leaves side-effects behind.  With JOBS_EAGER
+    set the handler runs immediately instead, for setups without a worker.
+    """
+    func, max_attempts = JOB_HANDLERS[name]
+    if app.config.get('JOBS_EAGER'):
+        func(**payload)
+        return True
+
+    values = {'name': name, 'payload': json.dumps(payload), 'status': 'queued',
+              'attempts': 0, 'max_attempts': max_attempts, 'idempotency_key': key,
+              'run_at': run_at or datetime.utcnow(), 'created_at': datetime.utcnow()}
+    if key is None:
+        db.session.execute(Job.__table__.insert().values(values))
+        return True
+    dialect_insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    statement = dialect_insert(Job.__table__).values(values)\
+        .on_conflict_do_nothing(index_elements=['idempotency_key'])
+    return db.session.execute(statement).rowcount == 1
+
+
+def enqueue_periodic_jobs(now=None):
+    """Queue the current slot of every periodic job that is not queued yet; returns how many"""
+    now = now or datetime.utcnow()
+    queued = 0
+    for name, (interval, offset) in PERIODIC_JOBS.items():
+        slot = EPOCH + offset + ((now - offset - EPOCH) // interval) * interval
+        queued += enqueue(name, run_at=slot, key=f'{name}@{slot.isoformat()}')
+    db.session.commit()
+    return queued
+
+
+def requeue_stalled_jobs():
+    """Return jobs left running by a dead worker to the queue; returns how many"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='queued', locked_by=None, locked_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def claim_job(worker_id):
+    """Atomically take the next due job, or None if nothing is due"""
+    now = datetime.utcnow()
+    next_due = select(Job.id).where(Job.status == 'queued', Job.run_at <= now)\
+        .order_by(Job.run_at, Job.id).limit(1)
+    if db.engine.dialect.name == 'postgresql':
+        # Concurrent workers skip each other's rows instead of queueing on the lock
+        next_due = next_due.with_for_update(skip_locked=True)
+    row = db.session.execute(
+        update(Job)
+        .where(Job.id == next_due.scalar_subquery(), Job.status == 'queued')
+        .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.session.commit()
+    return row
+
+
+def _finish(job_id, **values):
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(locked_by=None, locked_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def run_job(claimed):
+    """Run a claimed job, then mark it done or schedule a retry with exponential backoff.
+
+    The handler's writes commit together with the 'done' mark unless the
+    handler commits itself, so handlers should tolerate running twice.
+    """
+    try:
+        func = JOB_HANDLERS[claimed.name][0]
+        func(**json.loads(claimed.payload))
+        _finish(claimed.id, status='done', finished_at=datetime.utcnow(), last_error=None)
+        return True
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        logging.exception(f'Job {claimed.id} ({claimed.name}) failed on attempt {claimed.attempts}')
+        if claimed.attempts >= claimed.max_attempts:
+            _finish(claimed.id, status='failed', finished_at=datetime.utcnow(), last_error=error)
+        else:
+            delay = JOB_RETRY_BASE_SECONDS * 2 ** (claimed.attempts - 1)
+            _finish(claimed.id, status='queued', last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=delay))
+        return False
+
+
+def work(worker_id=None, once=False, poll_interval=JOB_POLL_SECONDS):
+    """Run due jobs until SIGTERM/SIGINT, or until none are due with once=True; returns jobs run"""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    stopping = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        # Finish the current job, then exit
+        signal.signal(signum, lambda *args: stopping.append(True))
+
+    if isinstance(broker, LocalBroker):
+        # No stream listens in this process; pages pick up the counters when their stream reconnects
+        logging.warning('REDIS_URL is not set; notifications created by jobs are not pushed to open pages')
+
+    ran = 0
+    last_housekeeping = None
+    while not stopping:
+        if last_housekeeping is None or time.monotonic() - last_housekeeping >= JOB_HOUSEKEEPING_SECONDS:
+            enqueue_periodic_jobs()
+            requeue_stalled_jobs()
+            last_housekeeping = time.monotonic()
+        claimed = claim_job(worker_id)
+        if claimed is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(claimed)
+        ran += 1
+    db.session.remove()
+    return ran
+
+
+@job('pregenerate_thumbnails', max_attempts=3)
+def pregenerate_thumbnails_job(filename):
+    pregenerate_thumbnails(filename)
+
+
+@job('send_appointment_reminders', max_attempts=3)
+def send_appointment_reminders_job():
+    send_appointment_reminder()
+
+
+@job('cleanup_old_notifications')
+def cleanup_old_notifications_job(days_old=30):
+    cleanup_old_notifications(days_old)
+
+
+@job('cleanup_stale_uploads')
+def cleanup_stale_uploads_job(max_age_hours=24):
+    cleanup_stale_uploads(max_age_hours)
+
+
+@job('purge_finished_jobs')
+def purge_finished_jobs(days_old=JOB_RETENTION_DAYS):
+    """Delete done and failed jobs older than days_old"""
+    cutoff = datetime.utcnow() - timedelta(days=days_old)
+    db.session.execute(delete(Job).where(Job.status.in_(['done', 'failed']), Job.finished_at < cutoff))
@@ -0,0 +1,62 @@
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from app import db
+from models import LabTest, LabTestBooking
+from forms import LabTestBookingForm
+from search import apply_search
+from catalog import catalog_categories, catalog_page
+from utils import create_notifications
+
+@login_required
+def tests():
+    search_query = request.args.get('search', '')
+    category = request.args.get('category', '')
+    
+    if search_query:
+        page = request.args.get('page', 1, type=int)
+        tests_query = apply_search(LabTest.query.filter_by(is_active=True), LabTest, 'lab_test', search_query)
+        if category:
+            tests_query = tests_query.filter_by(category=category)
+        tests = tests_query.paginate(page=page, per_page=12, error_out=False)
+    else:
+        # Browsing without a search term is served from the catalog cache
+        tests = catalog_page(LabTest, category, request.args.get('page'), per_page=12)
+    
+    # Get categories for filter
+    categories = catalog_categories(LabTest)
+    
+    return render_template('lab_tests.html', 
+                         tests=tests,
+                         categories=categories,
+                         search_query=search_query,
+                         current_category=category)
+
+@login_required
+def book_test(test_id):
+    test = LabTest.query.get_or_404(test_id)
+    form = LabTestBookingForm()
+    
+    if form.validate_on_submit():
+        booking = LabTestBooking(
+            user_id=current_user.id,
+            lab_test_id=test.id,
+            booking_date=form.booking_date.data,
+            sample_collection_date=form.sample_collection_date.data,
+            amount_paid=test.price
+        )
+        
+        db.session.add(booking)
+        
+        # Create notification
+        create_notifications([(
+            current_user.id,
+            'Lab Test Booked',
+            f'Your {test.name} test has been booked successfully.',
+            'system'
+        )])
+        db.session.commit()
+        
+        flash(f'{test.name} test booked successfully!', 'success')
+        return redirect(url_for('patient.dashboard'))
+    
+    return render_template('book_lab_test.html', form=form, test=test)
@@ -1,5 +1,6 @@
-from app import app
-import routes  # noqa: F401
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,77 @@
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from app import app, db
+from models import User, Message, Notification
+from forms import MessageForm
+from utils import adjust_unread_counts, create_notifications, mark_read
+
+@login_required
+def send_message():
+    form = MessageForm()
+    
+    # Populate recipient choices based on user type
+    if current_user.is_staff():
+        # Staff can message patients and other staff
+        recipients = User.query.filter(User.id != current_user.id, User.is_active == True).all()
+    else:
+        # Patients can message staff only
+        recipients = User.query.filter(User.user_type.in_(['doctor', 'nurse', 'admin']), User.is_active == True).all()
+    
+    form.recipient_id.choices = [(r.id, f"{r.full_name} ({r.user_type.title()})") for r in recipients]
+    
+    if form.validate_on_submit():
+        message = Message(
+            sender_id=current_user.id,
+            recipient_id=form.recipient_id.data,
+            subject=form.subject.data,
+            content=form.content.data
+        )
+        
+        db.session.add(message)
+        adjust_unread_counts(form.recipient_id.data, messages=1)
+        
+        # Create notification for recipient
+        create_notifications([(
+            form.recipient_id.data,
+            'New Message',
+            f'You have received a new message from {current_user.full_name}',
+            'message'
+        )])
+        db.session.commit()
+        
+        flash('Message sent successfully!', 'success')
+        return redirect(url_for('staff.messages') if current_user.is_staff() else url_for('patient.dashboard'))
+    
+    return render_template('send_message.html', form=form)
+
+@login_required
+def view_message(message_id):
+    message = Message.query.options(joinedload(Message.sender)).get_or_404(message_id)
+    
+    # Check if user is authorized to view this message
+    if message.sender_id != current_user.id and message.recipient_id != current_user.id:
+        app.logger.warning(f"Unauthorized access attempt by user {current_user.id} to message {message_id}")
+        flash('You are not authorized to view this message.', 'danger')
+        return redirect(url_for('staff.messages') if current_user.is_staff() else url_for('patient.dashboard'))
+    
+    # Mark as read if user is the recipient
+    if message.recipient_id == current_user.id and not message.is_read:
+        mark_read(message, current_user.id, messages=-1)
+        db.session.commit()
+    
+    return render_template('view_message.html', message=message)
+
+@login_required
+def mark_notification_read(notification_id):
+    notification = Notification.query.get_or_404(notification_id)
+    
+    if notification.user_id != current_user.id:
+        flash('You are not authorized to perform this action.', 'danger')
+        return redirect(url_for('index'))
+    
+    if not notification.is_read:
+        mark_read(notification, current_user.id, notifications=-1)
+        db.session.commit()
+    
+    return redirect(request.referrer or url_for('index'))
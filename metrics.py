@@ -0,0 +1,239 @@
+import re
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from flask import (before_render_template, g, has_request_context, request, request_finished,
+                   request_started, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app, db
+from database import checkout_listeners, pool_capacity
+from events import stream_slots
+
+# Upper bounds in seconds of the request latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+# Upper bounds in seconds of the connection pool checkout histogram; a free pooled connection takes microseconds
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+# An expanded IN list, whose length would otherwise make each call look different
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.responses = Counter()
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.pool_seconds = 0.0
+        self.n_plus_one = 0
+        self.slow_queries = 0
+
+
+class MetricsRegistry:
+    """Per-endpoint request statistics for this worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointStats)
+        self._checkouts = Histogram(POOL_WAIT_BUCKETS)
+        self._pool_timeouts = 0
+
+    def record(self, endpoint, status, seconds, profile):
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats.latency.observe(seconds)
+            stats.queries.observe(profile['queries'])
+            stats.responses[status] += 1
+            stats.db_seconds += profile['db_seconds']
+            stats.render_seconds += profile['render_seconds']
+            stats.pool_seconds += profile['pool_seconds']
+            stats.n_plus_one += profile['n_plus_one']
+            stats.slow_queries += profile['slow_queries']
+
+    def record_checkout(self, seconds, timed_out):
+        with self._lock:
+            self._checkouts.observe(seconds)
+            self._pool_timeouts += timed_out
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._checkouts = Histogram(POOL_WAIT_BUCKETS)
+            self._pool_timeouts = 0
+
+    def render(self):
+        """The statistics in the Prometheus text exposition format"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            def family(name, kind, help_text):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+            def histogram(name, attribute, help_text):
+                family(name, 'histogram', help_text)
+                for endpoint, stats in endpoints:
+                    data = getattr(stats, attribute)
+                    label = _label(endpoint)
+                    cumulative = 0
+                    for bound, count in zip(data.buckets, data.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{endpoint="{label}",le="+Inf"}} {data.count}')
+                    lines.append(f'{name}_sum{{endpoint="{label}"}} {data.sum}')
+                    lines.append(f'{name}_count{{endpoint="{label}"}} {data.count}')
+
+            def counter(name, attribute, help_text):
+                family(name, 'counter', help_text)
+                for endpoint, stats in endpoints:
+                    lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {getattr(stats, attribute)}')
+
+            family('health_requests_total', 'counter', 'Responses by endpoint and status code.')
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.responses.items()):
+                    lines.append(f'health_requests_total{{endpoint="{_label(endpoint)}",status="{status}"}} {count}')
+            histogram('health_request_duration_seconds', 'latency', 'Time to build a response.')
+            histogram('health_request_queries', 'queries', 'SQL statements per request.')
+            counter('health_request_db_seconds_total', 'db_seconds', 'Time spent waiting on SQL statements.')
+            counter('health_request_render_seconds_total', 'render_seconds', 'Time spent rendering templates.')
+            counter('health_request_pool_wait_seconds_total', 'pool_seconds', 'Time spent waiting for a database connection.')
+            counter('health_n_plus_one_total', 'n_plus_one', 'Statements repeated enough in one request to suggest an N+1 pattern.')
+            counter('health_slow_queries_total', 'slow_queries', 'Statements slower than SLOW_QUERY_MS.')
+
+            family('health_db_pool_checkout_seconds', 'histogram', 'Time to get a database connection, waiting and connecting included.')
+            cumulative = 0
+            for bound, count in zip(self._checkouts.buckets, self._checkouts.counts):
+                cumulative += count
+                lines.append(f'health_db_pool_checkout_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'health_db_pool_checkout_seconds_bucket{{le="+Inf"}} {self._checkouts.count}')
+            lines.append(f'health_db_pool_checkout_seconds_sum {self._checkouts.sum}')
+            lines.append(f'health_db_pool_checkout_seconds_count {self._checkouts.count}')
+            family('health_db_pool_timeouts_total', 'counter', 'Checkouts that gave up after the pool timeout.')
+            lines.append(f'health_db_pool_timeouts_total {self._pool_timeouts}')
+        for name, help_text, value in pool_gauges() + stream_gauges():
+            family(name, 'gauge', help_text)
+            lines.append(f'{name} {value}')
+        family('health_event_streams_refused_total', 'counter', 'Streams answered 503 because every slot was in use.')
+        lines.append(f'health_event_streams_refused_total {stream_slots.refused}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def pool_gauges():
+    """(name, help, value) for the size and use of this process's connection pool, if it has a limit"""
+    capacity = pool_capacity(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if capacity is None:
+        return []
+    checked_out = db.engine.pool.checkedout()
+    return [
+        ('health_db_pool_capacity', 'Connections the pool can hand out at once, overflow included.', capacity),
+        ('health_db_pool_checked_out', 'Connections in use.', checked_out),
+        ('health_db_pool_saturation', 'Share of the capacity in use; at 1 further checkouts wait.',
+         round(checked_out / capacity, 4)),
+    ]
+
+
+def stream_gauges():
+    """(name, help, value) for this process's event streams"""
+    return [
+        ('health_event_streams_open', 'Event streams held open.', stream_slots.open),
+        ('health_event_streams_limit', 'Event streams this process holds open at most.', stream_slots.limit),
+    ]
+
+
+registry = MetricsRegistry()
+
+
+def _profile():
+    # Only statements issued while serving a request are attributed to an endpoint
+    if has_request_context():
+        return g.get('_metrics')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    profile = _profile()
+    slow = elapsed * 1000 >= app.config['SLOW_QUERY_MS']
+    if slow:
+        logging.warning('Slow query (%.0f ms) on %s: %s', elapsed * 1000,
+                        request.endpoint if has_request_context() else 'background', statement)
+    if profile is not None:
+        profile['queries'] += 1
+        profile['db_seconds'] += elapsed
+        profile['slow_queries'] += slow
+        profile['statements'][PLACEHOLDER_LIST.sub('(?)', statement)] += 1
+
+
+def _observe_checkout(seconds, timed_out):
+    registry.record_checkout(seconds, timed_out)
+    profile = _profile()
+    if profile is not None:
+        profile['pool_seconds'] += seconds
+
+
+checkout_listeners.append(_observe_checkout)
+
+
+@request_started.connect_via(app)
+def _start_request(sender, **extra):
+    g._metrics = {'started': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0,
+                  'render_seconds': 0.0, 'render_started': [], 'pool_seconds': 0.0,
+                  'slow_queries': 0, 'n_plus_one': 0, 'statements': Counter()}
+
+
+@before_render_template.connect_via(app)
+def _start_render(sender, template, context, **extra):
+    profile = _profile()
+    if profile is not None:
+        profile['render_started'].append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _finish_render(sender, template, context, **extra):
+    profile = _profile()
+    if profile is not None and profile['render_started']:
+        profile['render_seconds'] += time.perf_counter() - profile['render_started'].pop()
+
+
+@request_finished.connect_via(app)
+def _finish_request(sender, response, **extra):
+    profile = _profile()
+    if profile is None:
+        return
+    endpoint = request.url_rule.endpoint if request.url_rule else '<unmatched>'
+    for statement, count in profile['statements'].items():
+        if count >= app.config['N_PLUS_ONE_THRESHOLD']:
+            profile['n_plus_one'] += 1
+            logging.warning('Possible N+1 on %s: statement ran %d times: %s', endpoint, count, statement)
+    registry.record(endpoint, response.status_code, time.perf_counter() - profile['started'], profile)
@@ -0,0 +1,47 @@
+"""Add composite indexes for dashboard, inbox, calendar and notification queries
+
+Revision ID: 3b1f0c2a9d41
+Revises:
+Create Date: 2026-10-17 09:12:44.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c2a9d41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns) - kept in sync with __table_args__ in models.py.
+# Fresh databases already get these from db.create_all(), so every statement is
+# guarded with IF [NOT] EXISTS.
+INDEXES = [
+    ('ix_users_type_active', 'users', ['user_type', 'is_active']),
+    ('ix_appointments_doctor_date', 'appointments', ['doctor_id', 'appointment_date']),
+    ('ix_appointments_patient_date', 'appointments', ['patient_id', 'appointment_date']),
+    ('ix_appointments_doctor_payment', 'appointments', ['doctor_id', 'payment_status']),
+    ('ix_appointments_date_status', 'appointments', ['appointment_date', 'status']),
+    ('ix_messages_recipient_created', 'messages', ['recipient_id', 'created_at']),
+    ('ix_messages_recipient_unread', 'messages', ['recipient_id', 'is_read', 'created_at']),
+    ('ix_messages_sender_created', 'messages', ['sender_id', 'created_at']),
+    ('ix_medical_records_patient_created', 'medical_records', ['patient_id', 'created_at']),
+    ('ix_medicines_active_category', 'medicines', ['is_active', 'category']),
+    ('ix_lab_tests_active_category', 'lab_tests', ['is_active', 'category']),
+    ('ix_lab_test_bookings_user_status', 'lab_test_bookings', ['user_id', 'status']),
+    ('ix_notifications_user_created', 'notifications', ['user_id', 'created_at']),
+    ('ix_notifications_user_unread', 'notifications', ['user_id', 'is_read', 'created_at']),
+    ('ix_notifications_read_created', 'notifications', ['is_read', 'created_at']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
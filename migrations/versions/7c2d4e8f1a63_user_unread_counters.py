@@ -0,0 +1,50 @@
+"""Add per-user unread message and notification counters
+
+Revision ID: 7c2d4e8f1a63
+Revises: 3b1f0c2a9d41
+Create Date: 2026-10-17 11:40:03.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e8f1a63'
+down_revision = '3b1f0c2a9d41'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ['unread_messages_count', 'unread_notifications_count']
+
+
+def _existing_columns():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+
+
+def upgrade():
+    existing = _existing_columns()
+    with op.batch_alter_table('users') as batch_op:
+        for name in COLUMNS:
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the source tables
+    op.execute("""
+        UPDATE users SET
+            unread_messages_count = (
+                SELECT count(*) FROM messages
+                WHERE messages.recipient_id = users.id AND messages.is_read = false),
+            unread_notifications_count = (
+                SELECT count(*) FROM notifications
+                WHERE notifications.user_id = users.id AND notifications.is_read = false)
+    """)
+
+
+def downgrade():
+    existing = _existing_columns()
+    with op.batch_alter_table('users') as batch_op:
+        for name in reversed(COLUMNS):
+            if name in existing:
+                batch_op.drop_column(name)
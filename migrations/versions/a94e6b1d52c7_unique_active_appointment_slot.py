@@ -0,0 +1,41 @@
+"""Allow only one active appointment per doctor and start time
+
+Revision ID: a94e6b1d52c7
+Revises: 7c2d4e8f1a63
+Create Date: 2026-10-17 14:05:21.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a94e6b1d52c7'
+down_revision = '7c2d4e8f1a63'
+branch_labels = None
+depends_on = None
+
+
+ACTIVE = sa.text("status IN ('scheduled', 'confirmed')")
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT count(*) FROM (
+            SELECT doctor_id, appointment_date FROM appointments
+            WHERE status IN ('scheduled', 'confirmed')
+            GROUP BY doctor_id, appointment_date
+            HAVING count(*) > 1
+        ) AS double_booked
+    """)).scalar()
+    if duplicates:
+        raise RuntimeError(f'{duplicates} doctor slots are double-booked; cancel the extra '
+                           'appointments before applying this migration')
+
+    op.create_index('uq_appointments_doctor_active_slot', 'appointments',
+                    ['doctor_id', 'appointment_date'], unique=True,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('uq_appointments_doctor_active_slot', table_name='appointments', if_exists=True)
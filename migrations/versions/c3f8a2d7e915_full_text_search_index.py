@@ -0,0 +1,58 @@
+"""Full-text search index over patients, doctors, medicines and lab tests
+
+Revision ID: c3f8a2d7e915
+Revises: a94e6b1d52c7
+Create Date: 2026-10-17 16:40:12.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a2d7e915'
+down_revision = 'a94e6b1d52c7'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, title, body, "
+    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+]
+
+POSTGRESQL_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_index ("
+    "kind VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL, title TEXT, body TEXT, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED, "
+    "PRIMARY KEY (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+]
+
+BACKFILL = [
+    "DELETE FROM search_index",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'patient', id, first_name || ' ' || last_name, email FROM users "
+    "WHERE user_type = 'patient'",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'doctor', id, first_name || ' ' || last_name, coalesce(specialty, '') FROM users "
+    "WHERE user_type = 'doctor' AND coalesce(is_active, true)",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'medicine', id, name, coalesce(description, '') FROM medicines "
+    "WHERE coalesce(is_active, true)",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'lab_test', id, name, coalesce(description, '') FROM lab_tests "
+    "WHERE coalesce(is_active, true)",
+]
+
+
+def upgrade():
+    ddl = SQLITE_DDL if op.get_bind().dialect.name == 'sqlite' else POSTGRESQL_DDL
+    for statement in ddl + BACKFILL:
+        op.execute(statement)
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS search_index')
@@ -0,0 +1,46 @@
+"""Background job queue
+
+Revision ID: e6b2d9a4c173
+Revises: c3f8a2d7e915
+Create Date: 2026-10-17 19:12:40.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2d9a4c173'
+down_revision = 'c3f8a2d7e915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=200), nullable=True),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key'),
+        if_not_exists=True
+    )
+    op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'], if_not_exists=True)
+    op.create_index('ix_jobs_status_finished', 'jobs', ['status', 'finished_at'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status_finished', table_name='jobs', if_exists=True)
+    op.drop_index('ix_jobs_status_run_at', table_name='jobs', if_exists=True)
+    op.drop_table('jobs', if_exists=True)
@@ -0,0 +1,49 @@
+"""Server-side shopping carts
+
+Revision ID: f4a7c1e8d352
+Revises: e6b2d9a4c173
+Create Date: 2026-10-17 20:31:05.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a7c1e8d352'
+down_revision = 'e6b2d9a4c173'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'carts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('subtotal', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id'),
+        if_not_exists=True
+    )
+    op.create_table(
+        'cart_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cart_id', sa.Integer(), nullable=False),
+        sa.Column('medicine_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(['cart_id'], ['carts.id']),
+        sa.ForeignKeyConstraint(['medicine_id'], ['medicines.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cart_id', 'medicine_id', name='uq_cart_items_cart_medicine'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('cart_items', if_exists=True)
+    op.drop_table('carts', if_exists=True)
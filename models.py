@@ -6,6 +6,10 @@ from app import db
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Doctor directory and message recipient lists
+        db.Index('ix_users_type_active', 'user_type', 'is_active'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -29,6 +33,10 @@ class User(UserMixin, db.Model):
     # Profile picture filename
     profile_picture = db.Column(db.String(200))
     
+    # Unread counters, kept in step with messages and notifications by utils.adjust_unread_counts
+    unread_messages_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    unread_notifications_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Status and timestamps
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -59,6 +67,21 @@ class User(UserMixin, db.Model):
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Doctor calendar, today's list and slot checks
+        db.Index('ix_appointments_doctor_date', 'doctor_id', 'appointment_date'),
+        # Patient appointment lists and profile history
+        db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+        # Payment info page and pending payment totals
+        db.Index('ix_appointments_doctor_payment', 'doctor_id', 'payment_status'),
+        # Daily reminder sweep across all doctors
+        db.Index('ix_appointments_date_status', 'appointment_date', 'status'),
+        # At most one active booking per doctor and start time, enforced by the
+        # database so concurrent bookings cannot double-book a slot
+        db.Index('uq_appointments_doctor_active_slot', 'doctor_id', 'appointment_date', unique=True,
+                 sqlite_where=db.text("status IN ('scheduled', 'confirmed')"),
+                 postgresql_where=db.text("status IN ('scheduled', 'confirmed')")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -86,6 +109,13 @@ class Appointment(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Inbox listings, newest first
+        db.Index('ix_messages_recipient_created', 'recipient_id', 'created_at'),
+        # Unread counts and unread lists
+        db.Index('ix_messages_recipient_unread', 'recipient_id', 'is_read', 'created_at'),
+        db.Index('ix_messages_sender_created', 'sender_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -104,6 +134,9 @@ class Message(db.Model):
 
 class MedicalRecord(db.Model):
     __tablename__ = 'medical_records'
+    __table_args__ = (
+        db.Index('ix_medical_records_patient_created', 'patient_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -138,6 +171,9 @@ class MedicalRecord(db.Model):
 
 class Medicine(db.Model):
     __tablename__ = 'medicines'
+    __table_args__ = (
+        db.Index('ix_medicines_active_category', 'is_active', 'category'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -201,8 +237,43 @@ class MedicineOrderItem(db.Model):
     # Relationships
     medicine = db.relationship('Medicine', backref='order_items')
 
+class Cart(db.Model):
+    __tablename__ = 'carts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    
+    # Running totals, kept in step with every item change so pages never re-sum the cart
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Cart {self.id}: user {self.user_id}, {self.item_count} items>'
+
+class CartItem(db.Model):
+    __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'medicine_id', name='uq_cart_items_cart_medicine'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'), nullable=False)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
+    
+    quantity = db.Column(db.Integer, nullable=False)
+    # Price when first added, as the cookie cart did
+    unit_price = db.Column(db.Numeric(10, 2), nullable=False)
+    
+    # Relationships
+    medicine = db.relationship('Medicine')
+
 class LabTest(db.Model):
     __tablename__ = 'lab_tests'
+    __table_args__ = (
+        db.Index('ix_lab_tests_active_category', 'is_active', 'category'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -226,6 +297,9 @@ class LabTest(db.Model):
 
 class LabTestBooking(db.Model):
     __tablename__ = 'lab_test_bookings'
+    __table_args__ = (
+        db.Index('ix_lab_test_bookings_user_status', 'user_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -257,6 +331,14 @@ class LabTestBooking(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Notification lists, newest first
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at'),
+        # Unread counts
+        db.Index('ix_notifications_user_unread', 'user_id', 'is_read', 'created_at'),
+        # Cleanup of old read notifications
+        db.Index('ix_notifications_read_created', 'is_read', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -277,3 +359,34 @@ class Notification(db.Model):
     
     def __repr__(self):
         return f'<Notification {self.id}: {self.title}>'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claiming the next due job
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        # Purging finished jobs
+        db.Index('ix_jobs_status_finished', 'status', 'finished_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    
+    # Status: 'queued', 'running', 'done', 'failed'
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text)
+    
+    # Enqueuing the same key again is a no-op while the job is kept
+    idempotency_key = db.Column(db.String(200), unique=True)
+    
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Job {self.id}: {self.name} {self.status}>'
@@ -0,0 +1,145 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from sqlalchemy import and_, func, or_, select, text, tuple_
+from app import db
+
+# Rows counted before an estimated total gives up and reports "at least"
+ESTIMATE_COUNT_CAP = 1000
+
+
+def encode_cursor(page, direction, values):
+    """Opaque token for the page after (direction 'next') or before ('prev') a row key"""
+    values = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps([page, direction, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (page, direction, values) from a token, or None if it is not one"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        page, direction, values = json.loads(raw)
+        if not isinstance(values, list):
+            return None
+        values = [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+                  for value in values]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        return None
+    # bool is an int subclass; anything but plain scalars would reach the database as a bad parameter
+    if direction not in ('next', 'prev') or type(page) is not int:
+        return None
+    if not all(isinstance(value, (str, int, float, datetime)) for value in values):
+        return None
+    return max(page, 1), direction, values
+
+
+def _key_filter(order, values, after):
+    """Rows strictly after (or before) the key `values` in the given sort order"""
+    descending = {desc for _, desc in order}
+    columns = [column for column, _ in order]
+    if len(descending) == 1:
+        # Uniform direction: one row-value comparison the index can range-scan
+        forward = after != descending.pop()
+        return tuple_(*columns) > tuple_(*values) if forward else tuple_(*columns) < tuple_(*values)
+
+    clauses = []
+    for i, ((column, desc), value) in enumerate(zip(order, values)):
+        forward = after != desc
+        step = column > value if forward else column < value
+        clauses.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], step))
+    return or_(*clauses)
+
+
+def estimate_count(query):
+    """Cheap row count: the planner's estimate on PostgreSQL, a capped count elsewhere"""
+    statement = query.order_by(None).statement
+    if db.engine.dialect.name == 'postgresql':
+        compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+        return int(plan[0]['Plan']['Plan Rows'])
+    capped = statement.limit(ESTIMATE_COUNT_CAP).subquery()
+    return db.session.execute(select(func.count()).select_from(capped)).scalar()
+
+
+class KeysetPagination:
+    """One page of a keyset-paginated query, usable wherever a Flask-SQLAlchemy Pagination is"""
+
+    def __init__(self, items, page, per_page, has_prev, has_next, first_key, last_key, total=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.total = total
+        self.prev_num = None
+        self.next_num = None
+        if has_prev:
+            # An empty page past the end has no key to step back from
+            self.prev_num = encode_cursor(page - 1, 'prev', first_key) if items else page - 1
+        if has_next and items:
+            self.next_num = encode_cursor(page + 1, 'next', last_key)
+
+    @property
+    def pages(self):
+        if self.total is not None:
+            return max(-(-self.total // self.per_page), self.page + self.has_next)
+        # Without a count, show navigation whenever there is somewhere to go
+        return self.page + self.has_next
+
+    def iter_pages(self, **kwargs):
+        # Cursors can only step to neighbouring pages, so only the current page is numbered
+        yield self.page
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def keyset_paginate(query, order, cursor=None, per_page=10, count=None):
+    """Page through `query` ordered by `order`, a list of (column, descending) pairs.
+
+    The last column must be unique (usually the primary key).  `cursor` is a
+    token from a previous page's prev_num/next_num; a plain page number is
+    also accepted and served with OFFSET.  `count` is None, 'exact' or 'estimate'.
+    """
+    page, direction, values = 1, 'next', None
+    if cursor is not None and str(cursor).isdigit():
+        page = max(int(cursor), 1)
+    elif cursor:
+        decoded = decode_cursor(str(cursor))
+        # A tampered token keyed on other columns falls back to the first page
+        if decoded is not None and len(decoded[2]) == len(order):
+            page, direction, values = decoded
+
+    backwards = direction == 'prev'
+    ordering = [column.desc() if desc != backwards else column.asc() for column, desc in order]
+    page_query = query.order_by(*ordering)
+    if values is not None:
+        page_query = page_query.filter(_key_filter(order, values, after=not backwards))
+    elif page > 1:
+        page_query = page_query.offset((page - 1) * per_page)
+
+    rows = page_query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        if not more:
+            # Reached the start of the list, whatever page the token claimed
+            page = 1
+        has_prev, has_next = more, bool(rows)
+    else:
+        has_prev, has_next = page > 1, more
+
+    def key(row):
+        return [getattr(row, column.key) for column, _ in order]
+
+    total = None
+    if count == 'exact':
+        total = query.order_by(None).count()
+    elif count == 'estimate':
+        total = estimate_count(query)
+
+    return KeysetPagination(rows, page, per_page, has_prev, has_next,
+                            key(rows[0]) if rows else None, key(rows[-1]) if rows else None, total)
@@ -0,0 +1,182 @@
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app import db
+from models import User, Appointment, Message, Notification
+from forms import AppointmentForm, ProfileForm
+from dates import clinic_now
+from search import apply_search
+from pagination import keyset_paginate
+from jobs import enqueue
+from uploads import UploadError, claim_upload, store_file
+from utils import create_notifications, get_dashboard_stats, reserve_appointment
+
+@login_required
+def dashboard():
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+    
+    # Get recent appointments
+    recent_appointments = Appointment.query.filter_by(patient_id=current_user.id)\
+        .options(joinedload(Appointment.doctor))\
+        .order_by(Appointment.appointment_date.desc()).limit(5).all()
+    
+    # Get unread messages
+    unread_messages = Message.query.filter_by(recipient_id=current_user.id, is_read=False)\
+        .options(joinedload(Message.sender))\
+        .order_by(Message.created_at.desc()).limit(5).all()
+    
+    # Get recent notifications
+    notifications = Notification.query.filter_by(user_id=current_user.id)\
+        .order_by(Notification.created_at.desc()).limit(5).all()
+    
+    stats = get_dashboard_stats(current_user)
+    
+    return render_template('patient_dashboard.html', 
+                         appointments=recent_appointments,
+                         messages=unread_messages,
+                         notifications=notifications,
+                         stats=stats)
+
+@login_required
+def profile():
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+    
+    # History is shown on the appointments and health records pages, not here
+    return render_template('patient_profile.html')
+
+@login_required
+def settings():
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+
+    form = ProfileForm(obj=current_user)
+    if form.validate_on_submit():
+        try:
+            form.populate_obj(current_user)
+            # Handle profile picture upload, already sent in chunks by the browser when possible
+            upload_id = request.form.get('profile_picture_upload_id')
+            if upload_id:
+                try:
+                    stored_name, original_name = claim_upload(upload_id, current_user.id)
+                except UploadError:
+                    stored_name = original_name = None
+                if not original_name or original_name.rsplit('.', 1)[-1].lower() not in ('jpg', 'jpeg', 'png'):
+                    db.session.rollback()
+                    flash('Profile picture upload failed. Please choose the image again.', 'danger')
+                    return redirect(url_for('patient.settings'))
+                current_user.profile_picture = stored_name
+            elif form.profile_picture.data and not isinstance(form.profile_picture.data, str):
+                file = form.profile_picture.data
+                # Save only the stored filename string, not the FileStorage object
+                current_user.profile_picture = store_file(file.stream, secure_filename(file.filename))
+            if current_user.profile_picture:
+                # Resizing every variant takes a while, so the worker makes them; once per picture
+                enqueue('pregenerate_thumbnails', key=f'thumbnails:{current_user.profile_picture}',
+                        filename=current_user.profile_picture)
+            db.session.commit()
+            flash('Profile updated successfully!', 'success')
+            return redirect(url_for('patient.settings'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('Email address already exists. Please use a different email.', 'danger')
+            return redirect(url_for('patient.settings'))
+
+    return render_template('patient_settings.html', form=form)
+
+@login_required
+def messages():
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+    
+    messages = keyset_paginate(
+        Message.query.filter_by(recipient_id=current_user.id).options(joinedload(Message.sender)),
+        [(Message.created_at, True), (Message.id, True)],
+        cursor=request.args.get('page'), per_page=10
+    )
+    
+    return render_template('patient_messages.html', messages=messages)
+
+@login_required
+def appointment_detail(appointment_id):
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+    
+    appointment = Appointment.query.filter_by(id=appointment_id, patient_id=current_user.id)\
+        .options(joinedload(Appointment.doctor)).first_or_404()
+    
+    return render_template('patient_appointment_detail.html', appointment=appointment)
+
+@login_required
+def appointments():
+    if current_user.is_staff():
+        return redirect(url_for('staff.dashboard'))
+    
+    filter_type = request.args.get('filter', 'all')
+    query = Appointment.query.filter_by(patient_id=current_user.id)
+    
+    if filter_type == 'upcoming':
+        query = query.filter(Appointment.appointment_date > clinic_now())
+    
+    appointments = query.options(joinedload(Appointment.doctor))\
+        .order_by(Appointment.appointment_date.desc()).all()
+    
+    return render_template('patient_appointments.html', appointments=appointments)
+
+@login_required
+def book_appointment():
+    # Removed staff user redirect to allow access
+    # if current_user.is_staff():
+    #     return redirect(url_for('staff.dashboard'))
+    
+    form = AppointmentForm()
+    
+    # Populate doctor choices
+    doctors = User.query.filter_by(user_type='doctor', is_active=True).all()
+    form.doctor_id.choices = [(d.id, f"Dr. {d.full_name} - {d.specialty or 'General'}") for d in doctors]
+    
+    if form.validate_on_submit():
+        # Insert straight away; the database rejects a slot that is already booked
+        appointment = reserve_appointment(
+            patient_id=current_user.id,
+            doctor_id=form.doctor_id.data,
+            appointment_date=form.appointment_date.data,
+            reason=form.reason.data,
+            notes=form.notes.data,
+            fee_amount=150.00  # Default fee
+        )
+        
+        if appointment is None:
+            flash('This appointment slot is not available. Please choose a different time.', 'danger')
+        else:
+            # Create notifications
+            doctor = User.query.get(form.doctor_id.data)
+            create_notifications([
+                (doctor.id,
+                 'New Appointment Scheduled',
+                 f'New appointment with {current_user.full_name} on {form.appointment_date.data.strftime("%B %d, %Y at %I:%M %p")}',
+                 'appointment'),
+                (current_user.id,
+                 'Appointment Confirmation',
+                 f'Your appointment with Dr. {doctor.full_name} has been scheduled for {form.appointment_date.data.strftime("%B %d, %Y at %I:%M %p")}',
+                 'appointment')
+            ])
+            db.session.commit()
+            
+            flash('Appointment booked successfully!', 'success')
+            return redirect(url_for('patient.dashboard'))
+    
+    return render_template('find_doctors.html', form=form, doctors=doctors)
+
+@login_required
+def find_doctors():
+    search_query = request.args.get('search', '')
+    doctors_query = User.query.filter_by(user_type='doctor', is_active=True)
+    if search_query:
+        doctors_query = apply_search(doctors_query, User, 'doctor', search_query)
+    doctors = doctors_query.all()
+    # Remove redirect to staff_dashboard to prevent redirection
+    return render_template('find_doctors.html', doctors=doctors)
@@ -0,0 +1,86 @@
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from app import db
+from models import Medicine
+from forms import MedicineOrderForm
+from search import apply_search
+from cart import CartError, add_item, cart_items, cart_summary, current_cart, place_order
+from catalog import catalog_categories, catalog_page
+from utils import create_notifications
+
+@login_required
+def buy_medicines():
+    search_query = request.args.get('search', '')
+    category = request.args.get('category', '')
+    
+    if search_query:
+        page = request.args.get('page', 1, type=int)
+        medicines_query = apply_search(Medicine.query.filter_by(is_active=True), Medicine, 'medicine', search_query)
+        if category:
+            medicines_query = medicines_query.filter_by(category=category)
+        medicines = medicines_query.paginate(page=page, per_page=12, error_out=False)
+    else:
+        # Browsing without a search term is served from the catalog cache
+        medicines = catalog_page(Medicine, category, request.args.get('page'), per_page=12)
+    
+    # Get categories for filter
+    categories = catalog_categories(Medicine)
+    
+    cart = current_cart(current_user.id)
+    
+    return render_template('buy_medicines.html', 
+                         medicines=medicines,
+                         categories=categories,
+                         search_query=search_query,
+                         current_category=category,
+                         cart_count=cart.item_count if cart else 0)
+
+@login_required
+def add_to_cart(medicine_id):
+    # Fallback for browsers without JavaScript; the page itself posts to /api/cart/items
+    medicine = Medicine.query.get_or_404(medicine_id)
+    try:
+        add_item(current_user.id, medicine.id)
+        db.session.commit()
+        flash(f'{medicine.name} added to cart!', 'success')
+    except CartError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+    
+    return redirect(url_for('pharmacy.buy_medicines'))
+
+@login_required
+def view_cart():
+    cart = current_cart(current_user.id)
+    return render_template('cart.html', items=cart_items(cart), summary=cart_summary(cart))
+
+@login_required
+def checkout():
+    cart = current_cart(current_user.id)
+    if cart is None or not cart.item_count:
+        flash('Your cart is empty!', 'warning')
+        return redirect(url_for('pharmacy.buy_medicines'))
+    
+    items = cart_items(cart)
+    form = MedicineOrderForm()
+    if form.validate_on_submit():
+        try:
+            order = place_order(current_user.id, cart, items, form.delivery_address.data)
+        except CartError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('pharmacy.view_cart'))
+        
+        # Create notification
+        create_notifications([(
+            current_user.id,
+            'Order Confirmation',
+            f'Your medicine order #{order.order_number} has been placed successfully.',
+            'system'
+        )])
+        db.session.commit()
+        
+        flash(f'Order placed successfully! Order number: {order.order_number}', 'success')
+        return redirect(url_for('patient.dashboard'))
+    
+    return render_template('checkout.html', form=form, items=items, summary=cart_summary(cart))
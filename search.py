@@ -0,0 +1,178 @@
+import re
+from sqlalchemy import Float, Integer, String, bindparam, event, func, inspect, select, text
+from app import db
+from models import User, Medicine, LabTest
+
+# One full-text index over everything /search can return.  SQLite uses an
+# FTS5 virtual table, PostgreSQL a tsvector column with a GIN index; both
+# expose the same (kind, ref_id, title, body) rows.
+SEARCH_KINDS = ('patient', 'doctor', 'medicine', 'lab_test')
+
+# Columns whose changes require re-indexing a row
+INDEXED_ATTRIBUTES = {
+    User: ('first_name', 'last_name', 'email', 'specialty', 'user_type', 'is_active'),
+    Medicine: ('name', 'description', 'is_active'),
+    LabTest: ('name', 'description', 'is_active'),
+}
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, title, body, "
+    "prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+]
+
+POSTGRESQL_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_index ("
+    "kind VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL, title TEXT, body TEXT, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED, "
+    "PRIMARY KEY (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+]
+
+# Repopulates the index from the source tables; valid on both dialects
+REBUILD_SQL = [
+    "DELETE FROM search_index",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'patient', id, first_name || ' ' || last_name, email FROM users "
+    "WHERE user_type = 'patient'",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'doctor', id, first_name || ' ' || last_name, coalesce(specialty, '') FROM users "
+    "WHERE user_type = 'doctor' AND coalesce(is_active, true)",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'medicine', id, name, coalesce(description, '') FROM medicines "
+    "WHERE coalesce(is_active, true)",
+    "INSERT INTO search_index (kind, ref_id, title, body) "
+    "SELECT 'lab_test', id, name, coalesce(description, '') FROM lab_tests "
+    "WHERE coalesce(is_active, true)",
+]
+
+
+def _is_sqlite(bind):
+    return bind.dialect.name == 'sqlite'
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Create the search index alongside the regular tables"""
+    for statement in SQLITE_DDL if _is_sqlite(connection) else POSTGRESQL_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index():
+    """Re-index every searchable row, e.g. after bulk loads that bypass the ORM"""
+    for statement in REBUILD_SQL:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def _document(obj):
+    """The (kind, title, body) to index for a row, or None if it is not searchable"""
+    if isinstance(obj, User):
+        if obj.user_type == 'patient':
+            return 'patient', obj.full_name, obj.email
+        if obj.user_type == 'doctor' and obj.is_active is not False:
+            return 'doctor', obj.full_name, obj.specialty or ''
+        return None
+    if obj.is_active is False:
+        return None
+    return _catalog_kind(obj), obj.name, obj.description or ''
+
+
+def _catalog_kind(obj):
+    return 'medicine' if isinstance(obj, Medicine) else 'lab_test'
+
+
+def _kinds_for(obj):
+    return ('patient', 'doctor') if isinstance(obj, User) else (_catalog_kind(obj),)
+
+
+def _remove(connection, obj):
+    connection.execute(
+        text("DELETE FROM search_index WHERE ref_id = :ref_id AND kind IN :kinds")
+        .bindparams(bindparam('kinds', expanding=True)),
+        {'ref_id': obj.id, 'kinds': list(_kinds_for(obj))}
+    )
+
+
+def _after_insert(mapper, connection, obj):
+    document = _document(obj)
+    if document:
+        kind, title, body = document
+        connection.execute(
+            text("INSERT INTO search_index (kind, ref_id, title, body) VALUES (:kind, :ref_id, :title, :body)"),
+            {'kind': kind, 'ref_id': obj.id, 'title': title, 'body': body}
+        )
+
+
+def _after_update(mapper, connection, obj):
+    state = inspect(obj)
+    if not any(state.attrs[name].history.has_changes() for name in INDEXED_ATTRIBUTES[type(obj)]):
+        return
+    _remove(connection, obj)
+    _after_insert(mapper, connection, obj)
+
+
+def _after_delete(mapper, connection, obj):
+    _remove(connection, obj)
+
+
+# Keep the index in step with ORM writes, inside the same transaction
+for model in INDEXED_ATTRIBUTES:
+    event.listen(model, 'after_insert', _after_insert)
+    event.listen(model, 'after_update', _after_update)
+    event.listen(model, 'after_delete', _after_delete)
+
+
+def _match_expression(terms, sqlite):
+    """Turn free text into an all-words, prefix-matching full-text query"""
+    tokens = re.findall(r'\w+', terms.lower())
+    if sqlite:
+        return ' '.join(f'"{token}"*' for token in tokens)
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def search_matches(terms, kinds=SEARCH_KINDS):
+    """Subquery of (kind, ref_id, rank) for rows matching terms; lower rank is a better match"""
+    sqlite = _is_sqlite(db.engine)
+    match = _match_expression(terms, sqlite) or None
+    if sqlite:
+        # Weights per column: kind, ref_id, title, body
+        sql = ("SELECT kind, ref_id, bm25(search_index, 0, 0, 10.0, 1.0) AS rank FROM search_index "
+               "WHERE search_index MATCH :match AND kind IN :kinds")
+    else:
+        sql = ("SELECT kind, ref_id, -ts_rank(document, to_tsquery('simple', :match)) AS rank "
+               "FROM search_index WHERE document @@ to_tsquery('simple', :match) AND kind IN :kinds")
+    if match is None:
+        # Nothing searchable in the input: match no rows
+        sql = "SELECT kind, ref_id, 0.0 AS rank FROM search_index WHERE 1 = 0 AND kind IN :kinds"
+    statement = text(sql).bindparams(bindparam('kinds', list(kinds), expanding=True))
+    if match is not None:
+        statement = statement.bindparams(match=match)
+    return statement.columns(kind=String, ref_id=Integer, rank=Float).subquery('search_matches')
+
+
+def apply_search(query, model, kind, terms):
+    """Restrict an ORM query to rows of `model` matching terms, best matches first"""
+    matches = search_matches(terms, [kind])
+    return query.join(matches, matches.c.ref_id == model.id).order_by(matches.c.rank)
+
+
+def search_all(terms, kinds=SEARCH_KINDS, limit=10):
+    """Best `limit` ids per kind from a single index query, as {kind: [ref_id, ...]}"""
+    matches = search_matches(terms, kinds)
+    ranked = select(
+        matches.c.kind,
+        matches.c.ref_id,
+        func.row_number().over(partition_by=matches.c.kind, order_by=matches.c.rank).label('position')
+    ).subquery()
+    rows = db.session.execute(
+        select(ranked.c.kind, ranked.c.ref_id)
+        .where(ranked.c.position <= limit)
+        .order_by(ranked.c.kind, ranked.c.position)
+    )
+    results = {kind: [] for kind in kinds}
+    for kind, ref_id in rows:
+        results[kind].append(ref_id)
+    return results
@@ -0,0 +1,193 @@
+import math
+import random
+from datetime import datetime, time, timedelta
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+from app import db
+from dates import clinic_today
+from models import Appointment, LabTest, LabTestBooking, MedicalRecord, Medicine, Message, Notification, User
+from search import rebuild_search_index
+from utils import reconcile_unread_counts
+
+# Rows per table at --scale 1, sized like a large multi-clinic deployment
+SEED_VOLUMES = {
+    'patients': 100_000,
+    'doctors': 1_000,
+    'nurses': 200,
+    'appointments': 5_000_000,
+    'messages': 20_000_000,
+    'notifications': 20_000_000,
+    'medical_records': 500_000,
+    'medicines': 2_000,
+    'lab_tests': 300,
+    'lab_test_bookings': 200_000,
+}
+# Every seeded account, including `admin`, logs in with this password
+SEED_PASSWORD = 'password123'
+# Appointments start every 30 minutes from 09:00, so a doctor has 16 a day
+SLOTS_PER_DAY = 16
+# Share of each doctor's calendar that lies in the past
+PAST_SHARE = 2 / 3
+HISTORY_DAYS = 730
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+               'Priya', 'Arjun', 'Ananya', 'Rahul', 'Wei', 'Mei', 'Hiroshi', 'Yuki', 'Omar', 'Fatima',
+               'Carlos', 'Sofia', 'Mateo', 'Lucia', 'Ivan', 'Olga', 'Kwame', 'Amara', 'Liam', 'Emma']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee',
+              'Sharma', 'Patel', 'Reddy', 'Iyer', 'Chen', 'Wang', 'Tanaka', 'Sato', 'Haddad', 'Rahman',
+              'Silva', 'Santos', 'Rossi', 'Novak', 'Petrov', 'Mensah', 'Okafor', 'Murphy', 'Kelly', 'Walsh']
+SPECIALTIES = ['Cardiology', 'Dermatology', 'Pediatrics', 'Neurology', 'Orthopedics', 'General Medicine',
+               'Gynecology', 'Psychiatry', 'Ophthalmology', 'ENT', 'Oncology', 'Endocrinology']
+REASONS = ['Routine check-up', 'Follow-up visit', 'Chest pain', 'Persistent cough', 'Skin rash', 'Back pain',
+           'Headache', 'Blood pressure review', 'Vaccination', 'Lab results discussion']
+MEDICINE_NAMES = ['Paracetamol', 'Ibuprofen', 'Amoxicillin', 'Metformin', 'Atorvastatin', 'Omeprazole', 'Amlodipine',
+                  'Cetirizine', 'Azithromycin', 'Losartan', 'Salbutamol', 'Levothyroxine', 'Pantoprazole', 'Aspirin']
+MEDICINE_CATEGORIES = ['Pain Relief', 'Antibiotics', 'Diabetes', 'Cardiac', 'Gastro', 'Allergy', 'Respiratory', 'Thyroid']
+DOSAGE_FORMS = ['tablet', 'capsule', 'syrup', 'injection', 'inhaler']
+LAB_TESTS = ['Complete Blood Count', 'Lipid Profile', 'Thyroid Panel', 'HbA1c', 'Liver Function Test',
+             'Kidney Function Test', 'Vitamin D', 'Urinalysis', 'Iron Studies', 'CRP']
+LAB_CATEGORIES = ['Blood', 'Urine', 'Hormone', 'Vitamin', 'Metabolic']
+NOTIFICATION_TYPES = ['appointment', 'message', 'system', 'payment']
+
+
+def seed_volumes(scale=1.0):
+    """SEED_VOLUMES multiplied by scale, with at least one row per table"""
+    return {table: max(1, round(rows * scale)) for table, rows in SEED_VOLUMES.items()}
+
+
+def _insert(model, total, make_row, batch_size, progress):
+    for start in range(0, total, batch_size):
+        # The table's insert, unlike the ORM bulk path, sends each batch as one executemany
+        db.session.execute(model.__table__.insert(), [make_row(i) for i in range(start, min(start + batch_size, total))])
+        db.session.commit()
+        if progress:
+            progress(model.__tablename__, min(start + batch_size, total), total)
+
+
+def seed_database(scale=1.0, seed=42, batch_size=50_000, progress=None):
+    """Fill an empty database with synthetic data; returns the row count per table.
+
+    The same scale and seed always produce the same rows, dated relative
+    to today so dashboards, reminders and calendars have current data.
+    Bulk inserts bypass the ORM hooks, so the unread counters and search
+    index are rebuilt at the end.
+    """
+    volumes = seed_volumes(scale)
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    now = datetime.utcnow()
+    today = clinic_today()
+
+    def person(i, username, user_type):
+        return {'username': username, 'email': f'{username}@example.com', 'password_hash': password_hash,
+                'first_name': rng.choice(FIRST_NAMES), 'last_name': rng.choice(LAST_NAMES),
+                'phone': f'555-{rng.randrange(10000):04d}', 'user_type': user_type,
+                'date_of_birth': today - timedelta(days=rng.randrange(18 * 365, 90 * 365)),
+                'gender': rng.choice(['male', 'female']), 'is_active': True,
+                'created_at': now - timedelta(days=rng.randrange(HISTORY_DAYS))}
+
+    def doctor(i):
+        row = person(i, f'doctor{i}', 'doctor')
+        row.update(specialty=rng.choice(SPECIALTIES), license_number=f'LIC{i:06d}')
+        return row
+
+    def nurse(i):
+        row = person(i, f'nurse{i}', 'nurse')
+        row.update(department=rng.choice(SPECIALTIES), license_number=f'RN{i:06d}')
+        return row
+
+    _insert(User, 1, lambda i: person(i, 'admin', 'admin'), batch_size, progress)
+    _insert(User, volumes['doctors'], doctor, batch_size, progress)
+    _insert(User, volumes['nurses'], nurse, batch_size, progress)
+    _insert(User, volumes['patients'], lambda i: person(i, f'patient{i}', 'patient'), batch_size, progress)
+    doctor_ids = [row.id for row in db.session.query(User.id).filter_by(user_type='doctor').order_by(User.id)]
+    patient_ids = [row.id for row in db.session.query(User.id).filter_by(user_type='patient').order_by(User.id)]
+    user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+
+    # Doctor i % D takes slot i // D, so no two active bookings share a doctor and time
+    days = math.ceil(volumes['appointments'] / len(doctor_ids) / SLOTS_PER_DAY)
+    first_day = datetime.combine(today - timedelta(days=int(days * PAST_SHARE)), time(9))
+
+    def appointment(i):
+        slot = i // len(doctor_ids)
+        start = first_day + timedelta(days=slot // SLOTS_PER_DAY, minutes=30 * (slot % SLOTS_PER_DAY))
+        past = start < now
+        status = ('cancelled' if rng.random() < 0.08 else 'completed') if past else 'scheduled'
+        return {'patient_id': rng.choice(patient_ids), 'doctor_id': doctor_ids[i % len(doctor_ids)],
+                'appointment_date': start, 'duration_minutes': 30, 'reason': rng.choice(REASONS),
+                'status': status, 'fee_amount': rng.choice([100, 150, 200]),
+                'payment_status': 'paid' if status == 'completed' and rng.random() < 0.85 else 'pending',
+                'created_at': start - timedelta(days=rng.randrange(1, 30))}
+
+    _insert(Appointment, volumes['appointments'], appointment, batch_size, progress)
+
+    def message(i):
+        patient_id, doctor_id = rng.choice(patient_ids), rng.choice(doctor_ids)
+        sender_id, recipient_id = (patient_id, doctor_id) if rng.random() < 0.5 else (doctor_id, patient_id)
+        created = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+        read = now - created > timedelta(days=14) or rng.random() < 0.7
+        return {'sender_id': sender_id, 'recipient_id': recipient_id, 'subject': rng.choice(REASONS),
+                'content': f'Message {i} about {rng.choice(REASONS).lower()}.', 'is_read': read,
+                'read_at': created + timedelta(hours=rng.randrange(1, 72)) if read else None, 'created_at': created}
+
+    _insert(Message, volumes['messages'], message, batch_size, progress)
+
+    def notification(i):
+        created = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+        read = now - created > timedelta(days=7) or rng.random() < 0.5
+        kind = rng.choice(NOTIFICATION_TYPES)
+        return {'user_id': rng.choice(user_ids), 'title': f'{kind.title()} update', 'message': f'Notification {i}',
+                'notification_type': kind, 'is_read': read,
+                'read_at': created + timedelta(hours=rng.randrange(1, 48)) if read else None, 'created_at': created}
+
+    _insert(Notification, volumes['notifications'], notification, batch_size, progress)
+
+    def medical_record(i):
+        return {'patient_id': rng.choice(patient_ids), 'doctor_id': rng.choice(doctor_ids),
+                'diagnosis': rng.choice(REASONS), 'symptoms': rng.choice(REASONS), 'treatment': 'Rest and fluids',
+                'blood_pressure': f'{rng.randrange(100, 150)}/{rng.randrange(60, 95)}',
+                'heart_rate': rng.randrange(55, 110), 'temperature': round(rng.uniform(36.0, 39.0), 1),
+                'created_at': now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))}
+
+    _insert(MedicalRecord, volumes['medical_records'], medical_record, batch_size, progress)
+
+    def medicine(i):
+        name = rng.choice(MEDICINE_NAMES)
+        return {'name': f'{name} {rng.choice([5, 10, 25, 50, 100, 250, 500])}mg #{i}',
+                'description': f'{name} for {rng.choice(REASONS).lower()}',
+                'manufacturer': f'{rng.choice(LAST_NAMES)} Pharma', 'price': round(rng.uniform(2, 80), 2),
+                'stock_quantity': rng.randrange(1000, 100000), 'dosage_form': rng.choice(DOSAGE_FORMS),
+                'category': rng.choice(MEDICINE_CATEGORIES), 'is_prescription_required': rng.random() < 0.4,
+                'is_active': True}
+
+    _insert(Medicine, volumes['medicines'], medicine, batch_size, progress)
+
+    def lab_test(i):
+        name = rng.choice(LAB_TESTS)
+        return {'name': f'{name} #{i}', 'description': f'{name} panel', 'category': rng.choice(LAB_CATEGORIES),
+                'price': round(rng.uniform(10, 200), 2), 'sample_type': rng.choice(['blood', 'urine']),
+                'fasting_required': rng.random() < 0.3, 'result_time_hours': rng.choice([6, 24, 48]),
+                'is_active': True}
+
+    _insert(LabTest, volumes['lab_tests'], lab_test, batch_size, progress)
+    lab_test_ids = [row.id for row in db.session.query(LabTest.id).order_by(LabTest.id)]
+
+    def lab_test_booking(i):
+        booked = now + timedelta(days=rng.randrange(-HISTORY_DAYS, 30))
+        done = booked < now
+        return {'user_id': rng.choice(patient_ids), 'lab_test_id': rng.choice(lab_test_ids),
+                'booking_date': booked, 'status': 'completed' if done else 'booked',
+                'payment_status': 'paid' if done else 'pending', 'amount_paid': round(rng.uniform(10, 200), 2),
+                'created_at': booked - timedelta(days=rng.randrange(1, 14))}
+
+    _insert(LabTestBooking, volumes['lab_test_bookings'], lab_test_booking, batch_size, progress)
+
+    reconcile_unread_counts()
+    rebuild_search_index()
+    # Fresh planner statistics, or the first benchmarks run against guesses
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    volumes['admins'] = 1
+    return volumes
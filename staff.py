@@ -0,0 +1,243 @@
+import os
+from flask import render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from sqlalchemy import or_, and_, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app import app, db
+from models import User, Appointment, Message, MedicalRecord
+from forms import MedicalRecordForm, ProfileForm
+from dates import in_window
+from pagination import keyset_paginate
+from uploads import UploadError, claim_upload, store_file
+from utils import allowed_file, appointment_history, create_notifications, get_dashboard_stats, medical_record_history, notification_history
+
+@login_required
+def dashboard():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    stats = get_dashboard_stats(current_user)
+    
+    # Get today's appointments
+    todays_appointments = Appointment.query.filter(
+        and_(Appointment.doctor_id == current_user.id,
+             in_window(Appointment.appointment_date, 'day'))
+    ).options(joinedload(Appointment.patient))\
+     .order_by(Appointment.appointment_date).all()
+    
+    # Get recent messages
+    recent_messages = Message.query.filter_by(recipient_id=current_user.id)\
+        .options(joinedload(Message.sender))\
+        .order_by(Message.created_at.desc()).limit(5).all()
+    
+    return render_template('staff_dashboard.html', 
+                         stats=stats,
+                         appointments=todays_appointments,
+                         messages=recent_messages)
+
+@login_required
+def calendar():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    return render_template('staff_calendar.html')
+
+@login_required
+def appointments():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    appointments = keyset_paginate(
+        Appointment.query.filter_by(doctor_id=current_user.id).options(joinedload(Appointment.patient)),
+        [(Appointment.appointment_date, True), (Appointment.id, True)],
+        cursor=request.args.get('page'), per_page=10
+    )
+    
+    return render_template('staff_appointments.html', appointments=appointments)
+
+@login_required
+def patients():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    search_query = request.args.get('search', '')
+    
+    # Get patients who have appointments with this doctor
+    patients_query = User.query.filter(
+        User.user_type == 'patient',
+        User.id.in_(db.session.query(Appointment.patient_id).filter(Appointment.doctor_id == current_user.id))
+    )
+    
+    if search_query:
+        patients_query = patients_query.filter(
+            or_(User.first_name.contains(search_query),
+                User.last_name.contains(search_query),
+                User.email.contains(search_query))
+        )
+    
+    patients = keyset_paginate(patients_query, [(User.id, False)],
+                               cursor=request.args.get('page'), per_page=10, count='estimate')
+    
+    return render_template('staff_patients.html', patients=patients, search_query=search_query)
+
+@login_required
+def patient_profile(patient_id):
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    patient = User.query.get_or_404(patient_id)
+    if patient.user_type != 'patient':
+        flash('Invalid patient ID', 'danger')
+        return redirect(url_for('staff.patients'))
+    
+    # Most recent window of each history; older rows load through api.patient_history
+    medical_records = medical_record_history(patient.id)
+    appointments = appointment_history(patient.id)
+    
+    return render_template('staff_profile.html', 
+                         patient=patient,
+                         medical_records=medical_records.items,
+                         medical_records_next=medical_records.next_num,
+                         appointments=appointments.items,
+                         appointments_next=appointments.next_num)
+
+@login_required
+def messages():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    messages = keyset_paginate(
+        Message.query.filter_by(recipient_id=current_user.id).options(joinedload(Message.sender)),
+        [(Message.created_at, True), (Message.id, True)],
+        cursor=request.args.get('page'), per_page=10
+    )
+    
+    return render_template('staff_messages.html', messages=messages)
+
+@login_required
+def notifications():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    notifications = notification_history(current_user.id)
+    
+    return render_template('staff_notifications.html',
+                         notifications=notifications.items,
+                         next_cursor=notifications.next_num)
+
+@login_required
+def payment_info():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    # Get payment statistics
+    recent_payments = Appointment.query.filter(
+        and_(Appointment.doctor_id == current_user.id,
+             Appointment.payment_status == 'paid')
+    ).options(joinedload(Appointment.patient))\
+     .order_by(Appointment.updated_at.desc()).limit(10).all()
+    
+    pending_payments = Appointment.query.filter(
+        and_(Appointment.doctor_id == current_user.id,
+             Appointment.payment_status == 'pending')
+    ).options(joinedload(Appointment.patient))\
+     .order_by(Appointment.appointment_date.desc()).limit(10).all()
+    
+    # Monthly summary, for the clinic's current calendar month
+    monthly_collected = db.session.query(func.sum(Appointment.fee_amount)).filter(
+        and_(Appointment.doctor_id == current_user.id,
+             Appointment.payment_status == 'paid',
+             in_window(Appointment.updated_at, 'month', utc=True))
+    ).scalar() or 0
+    
+    monthly_pending = db.session.query(func.sum(Appointment.fee_amount)).filter(
+        and_(Appointment.doctor_id == current_user.id,
+             Appointment.payment_status == 'pending',
+             in_window(Appointment.created_at, 'month', utc=True))
+    ).scalar() or 0
+    
+    # Fix template name to plural
+    return render_template('staff_payments_info.html', 
+                         recent_payments=recent_payments,
+                         pending_payments=pending_payments,
+                         monthly_collected=monthly_collected,
+                         monthly_pending=monthly_pending)
+
+@login_required
+def settings():
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+
+    form = ProfileForm(obj=current_user)
+    if form.validate_on_submit():
+        try:
+            form.populate_obj(current_user)
+            db.session.commit()
+            flash('Profile updated successfully!', 'success')
+            return redirect(url_for('staff.settings'))
+        except IntegrityError:
+            db.session.rollback()
+            flash('Email address already exists. Please use a different email.', 'danger')
+            return redirect(url_for('staff.settings'))
+
+    return render_template('staff_settings.html', form=form)
+
+@login_required
+def add_medical_record(patient_id):
+    if not current_user.is_staff():
+        return redirect(url_for('patient.dashboard'))
+    
+    patient = User.query.get_or_404(patient_id)
+    # The patient comes from the URL, so the form's patient field is fixed to it
+    form = MedicalRecordForm(patient_id=patient.id)
+    form.patient_id.choices = [(patient.id, patient.full_name)]
+    
+    if form.validate_on_submit():
+        record = MedicalRecord(
+            patient_id=patient.id,
+            doctor_id=current_user.id,
+            diagnosis=form.diagnosis.data,
+            symptoms=form.symptoms.data,
+            treatment=form.treatment.data,
+            prescription=form.prescription.data,
+            blood_pressure=form.blood_pressure.data,
+            heart_rate=form.heart_rate.data,
+            temperature=form.temperature.data,
+            weight=form.weight.data,
+            height=form.height.data
+        )
+        
+        # Handle file upload, already sent in chunks by the browser when possible
+        upload_id = request.form.get('file_upload_id')
+        if upload_id:
+            try:
+                stored_name, original_name = claim_upload(upload_id, current_user.id)
+            except UploadError:
+                flash('The attachment did not finish uploading. Please attach it again.', 'danger')
+                return render_template('add_medical_record.html', form=form, patient=patient)
+            record.file_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+            record.file_name = original_name
+        elif form.file_upload.data:
+            file = form.file_upload.data
+            if allowed_file(file.filename):
+                stored_name = store_file(file.stream, secure_filename(file.filename))
+                record.file_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+                record.file_name = file.filename
+        
+        db.session.add(record)
+        
+        # Create notification for patient
+        create_notifications([(
+            patient.id,
+            'Medical Record Updated',
+            f'Dr. {current_user.full_name} has added a new medical record to your profile.',
+            'system'
+        )])
+        db.session.commit()
+        
+        flash('Medical record added successfully!', 'success')
+        return redirect(url_for('staff.patient_profile', patient_id=patient.id))
+    
+    return render_template('add_medical_record.html', form=form, patient=patient)
@@ -9,6 +9,8 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeDateTimeInputs();
     initializeModalHandlers();
     initializeAutoRefresh();
+    initializeHistoryLoading();
+    initializeChunkedUploads();
 });
 
 // Form Validation
@@ -111,36 +113,73 @@ function initializeNotifications() {
         }, 5000);
     });
     
-    // Update notification counts periodically
+    // Keep notification counts live, pushed by the server when possible
     if (document.querySelector('[data-user-authenticated="true"]')) {
-        updateNotificationCounts();
-        setInterval(updateNotificationCounts, 60000); // Update every minute
+        if (window.EventSource) {
+            connectEventStream();
+        } else {
+            startCountPolling();
+        }
+    }
+}
+
+let countPollingTimer = null;
+
+function startCountPolling() {
+    if (countPollingTimer) {
+        return;
     }
+    updateNotificationCounts();
+    countPollingTimer = setInterval(updateNotificationCounts, 60000); // Update every minute
+}
+
+function stopCountPolling() {
+    clearInterval(countPollingTimer);
+    countPollingTimer = null;
+}
+
+function connectEventStream() {
+    const stream = new EventSource('/api/stream');
+    
+    stream.addEventListener('open', stopCountPolling);
+    
+    stream.addEventListener('counts', event => {
+        const counts = JSON.parse(event.data);
+        renderCount('.message-count, #message-count', counts.messages);
+        renderCount('.notification-count, #notification-count', counts.notifications);
+    });
+    
+    stream.addEventListener('notification', event => {
+        const notification = JSON.parse(event.data);
+        showToast(notification.title, 'info');
+    });
+    
+    stream.addEventListener('error', () => {
+        // The browser reconnects on its own unless the server refused the stream
+        if (stream.readyState === EventSource.CLOSED) {
+            startCountPolling();
+        }
+    });
+}
+
+function renderCount(selector, count) {
+    document.querySelectorAll(selector).forEach(element => {
+        element.textContent = count || 0;
+        element.style.display = count > 0 ? 'inline' : 'none';
+    });
 }
 
 function updateNotificationCounts() {
     // Update unread message count
     fetch('/api/unread-messages-count')
         .then(response => response.json())
-        .then(data => {
-            const messageCountElements = document.querySelectorAll('.message-count, #message-count');
-            messageCountElements.forEach(element => {
-                element.textContent = data.count || 0;
-                element.style.display = data.count > 0 ? 'inline' : 'none';
-            });
-        })
+        .then(data => renderCount('.message-count, #message-count', data.count))
         .catch(error => console.log('Error updating message count:', error));
     
     // Update notification count
     fetch('/api/unread-notifications-count')
         .then(response => response.json())
-        .then(data => {
-            const notificationCountElements = document.querySelectorAll('.notification-count, #notification-count');
-            notificationCountElements.forEach(element => {
-                element.textContent = data.count || 0;
-                element.style.display = data.count > 0 ? 'inline' : 'none';
-            });
-        })
+        .then(data => renderCount('.notification-count, #notification-count', data.count))
         .catch(error => console.log('Error updating notification count:', error));
 }
 
@@ -233,41 +272,58 @@ function initializeCartFunctionality() {
         button.addEventListener('click', function(event) {
             event.preventDefault();
             
-            const url = this.href;
-            
             // Show loading state
             const originalText = this.innerHTML;
             this.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Adding...';
             this.disabled = true;
             
-            // Simulate adding to cart (in real implementation, this would be a fetch request)
-            setTimeout(() => {
-                this.innerHTML = '<i class="fas fa-check me-1"></i>Added';
-                this.classList.remove('btn-primary');
-                this.classList.add('btn-success');
-                
-                // Update cart count
-                updateCartCount();
-                
-                showToast('Item added to cart successfully!', 'success');
-                
-                // Reset button after 2 seconds
-                setTimeout(() => {
+            changeCart('/api/cart/items', 'POST', {medicine_id: parseInt(this.dataset.medicineId), quantity: 1})
+                .then(summary => {
+                    this.innerHTML = '<i class="fas fa-check me-1"></i>Added';
+                    this.classList.remove('btn-primary');
+                    this.classList.add('btn-success');
+                    updateCartCount(summary.count);
+                    showToast('Item added to cart successfully!', 'success');
+                })
+                .catch(error => {
                     this.innerHTML = originalText;
-                    this.classList.remove('btn-success');
-                    this.classList.add('btn-primary');
-                    this.disabled = false;
-                }, 2000);
-            }, 1000);
+                    showToast(error.message, 'warning');
+                })
+                .finally(() => {
+                    // Reset button after 2 seconds
+                    setTimeout(() => {
+                        this.innerHTML = originalText;
+                        this.classList.remove('btn-success');
+                        this.classList.add('btn-primary');
+                        this.disabled = false;
+                    }, 2000);
+                });
         });
     });
 }
 
-function updateCartCount() {
-    const cartCountElements = document.querySelectorAll('#cart-count, .cart-count');
-    cartCountElements.forEach(element => {
-        const currentCount = parseInt(element.textContent) || 0;
-        element.textContent = currentCount + 1;
+function changeCart(url, method, body) {
+    // Resolves with the cart summary, or rejects with the server's error message
+    return fetch(url, {
+        method: method,
+        headers: {'Content-Type': 'application/json'},
+        body: body ? JSON.stringify(body) : undefined
+    }).then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || 'Could not update the cart');
+        }
+        updateCartCount(data.count);
+        return data;
+    }));
+}
+
+function changeCartItem(medicineId, method, body) {
+    return changeCart(`/api/cart/items/${medicineId}`, method, body);
+}
+
+function updateCartCount(count) {
+    document.querySelectorAll('#cart-count, .cart-count').forEach(element => {
+        element.textContent = count;
     });
 }
 
@@ -334,8 +390,10 @@ function initializeAutoRefresh() {
     // Refresh dashboard data every 5 minutes if on dashboard page
     if (window.location.pathname.includes('dashboard')) {
         setInterval(() => {
-            // Refresh notification counts
-            updateNotificationCounts();
+            // Refresh notification counts unless the event stream keeps them live
+            if (!window.EventSource) {
+                updateNotificationCounts();
+            }
             
             // Refresh recent appointments and messages (in a real app, this would use AJAX)
             const lastUpdate = document.querySelector('#last-update');
@@ -346,6 +404,149 @@ function initializeAutoRefresh() {
     }
 }
 
+// Older history and record details are fetched on demand
+function initializeHistoryLoading() {
+    document.addEventListener('click', function(event) {
+        const loadMore = event.target.closest('[data-load-more]');
+        if (loadMore) {
+            loadOlderHistory(loadMore);
+            return;
+        }
+        
+        const details = event.target.closest('.record-details-btn');
+        if (details) {
+            loadRecordDetails(details);
+        }
+    });
+}
+
+function loadOlderHistory(button) {
+    const url = `${button.dataset.loadMore}?cursor=${encodeURIComponent(button.dataset.cursor)}`;
+    button.disabled = true;
+    
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            document.getElementById(button.dataset.target).insertAdjacentHTML('beforeend', data.html);
+            if (data.next) {
+                button.dataset.cursor = data.next;
+                button.disabled = false;
+            } else {
+                button.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading history:', error);
+            button.disabled = false;
+            showToast('Could not load older entries', 'danger');
+        });
+}
+
+function loadRecordDetails(button) {
+    button.disabled = true;
+    
+    fetch(`/api/medical-record/${button.dataset.recordId}`)
+        .then(response => response.json())
+        .then(data => {
+            const container = button.previousElementSibling;
+            ['symptoms', 'treatment'].forEach(field => {
+                if (data[field]) {
+                    const paragraph = document.createElement('p');
+                    paragraph.className = 'mb-1';
+                    paragraph.innerHTML = `<strong>${field.charAt(0).toUpperCase() + field.slice(1)}:</strong> `;
+                    paragraph.appendChild(document.createTextNode(data[field]));
+                    container.appendChild(paragraph);
+                }
+            });
+            button.remove();
+        })
+        .catch(error => {
+            console.error('Error loading record details:', error);
+            button.disabled = false;
+        });
+}
+
+// Chunked uploads: files are sent ahead of the form in small resumable pieces
+function initializeChunkedUploads() {
+    document.querySelectorAll('input[type="file"][data-chunked-upload]').forEach(input => {
+        const form = input.form;
+        const uploadId = form.querySelector(`input[name="${input.dataset.chunkedUpload}"]`);
+        const submitButton = form.querySelector('button[type="submit"], input[type="submit"]');
+        if (!uploadId || !window.fetch || !window.Blob || !Blob.prototype.slice) {
+            return;
+        }
+        
+        input.addEventListener('change', function() {
+            uploadId.value = '';
+            const file = input.files[0];
+            if (!file) {
+                return;
+            }
+            
+            if (submitButton) submitButton.disabled = true;
+            uploadInChunks(file)
+                .then(id => {
+                    uploadId.value = id;
+                })
+                .catch(error => {
+                    // The file is still attached to the form and goes up with it instead
+                    console.error('Chunked upload failed:', error);
+                    showToast('Upload was interrupted; the file will be sent with the form', 'warning');
+                })
+                .finally(() => {
+                    if (submitButton) submitButton.disabled = false;
+                });
+        });
+        
+        form.addEventListener('submit', function() {
+            // Already uploaded, so keep the file out of the form body
+            if (uploadId.value) {
+                input.disabled = true;
+            }
+        });
+    });
+}
+
+async function uploadInChunks(file) {
+    const started = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    const status = await started.json();
+    if (!started.ok) {
+        throw new Error(status.error);
+    }
+    
+    let failures = 0;
+    while (!status.complete) {
+        try {
+            const chunk = file.slice(status.offset, status.offset + status.chunk_size);
+            const response = await fetch(`/api/uploads/${status.upload_id}?offset=${status.offset}`, {
+                method: 'PUT',
+                headers: {'Content-Type': 'application/octet-stream'},
+                body: chunk
+            });
+            if (!response.ok) {
+                throw new Error(`Chunk rejected with status ${response.status}`);
+            }
+            Object.assign(status, await response.json());
+            failures = 0;
+        } catch (error) {
+            if (++failures > 3) {
+                throw error;
+            }
+            // Resume from however much the server actually received
+            const current = await fetch(`/api/uploads/${status.upload_id}`);
+            if (!current.ok) {
+                throw error;
+            }
+            Object.assign(status, await current.json());
+        }
+    }
+    return status.upload_id;
+}
+
 // Utility Functions
 function formatCurrency(amount) {
     return new Intl.NumberFormat('en-US', {
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+# The app reads its settings from the environment when it is imported, so
+# point it at a throwaway SQLite database first. TEST_DATABASE_URL runs the
+# suite against another database instead; every table in it is dropped.
+_scratch = tempfile.mkdtemp(prefix='health-web-tests-')
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite:///' + os.path.join(_scratch, 'test.db'))
+os.environ.setdefault('SESSION_SECRET', 'test-secret')
+for name in ('FLASK_RUN_FROM_CLI', 'ROUTE_AREAS', 'REDIS_URL', 'WORKER_CLASS', 'WORKER_THREADS', 'JOBS_EAGER'):
+    os.environ.pop(name, None)
+
+from sqlalchemy import text
+from app import app as flask_app, create_app, db
+from benchmark import ClientSession
+from models import User
+from seeding import seed_database
+
+create_app(cli=False)
+flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False,
+                        UPLOAD_FOLDER=os.path.join(_scratch, 'uploads'))
+os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+
+def reset_database():
+    """Drop and recreate every table, the search index included"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.execute(text('DELETE FROM search_index'))
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    return flask_app
+
+
+@pytest.fixture
+def database(app):
+    """Empty tables, with an app context pushed for the test"""
+    with app.app_context():
+        reset_database()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    """Synthetic data from the seeder, shared by a module's tests, which must not change it.
+
+    Large enough that every page has several screens of rows and related
+    users to load, so an N+1 pattern shows in the query counts.
+    """
+    with app.app_context():
+        reset_database()
+        seed_database(scale=0.002, batch_size=5000)
+    yield
+    with app.app_context():
+        db.session.remove()
+
+
+class Browser:
+    """A logged-in user's test client.
+
+    Each request runs on a thread of its own, so it gets its own app
+    context, g and database session as under gunicorn, instead of sharing
+    the test's (and with it a cached current_user).
+    """
+
+    def __init__(self, user):
+        self.client = ClientSession(user).client
+
+    def open(self, path, **kwargs):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(self.client.open, path, **kwargs).result()
+
+    def get(self, path, **kwargs):
+        return self.open(path, method='GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, method='POST', **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.open(path, method='PUT', **kwargs)
+
+
+@pytest.fixture
+def browser():
+    return Browser
+
+
+@pytest.fixture
+def make_user(database):
+    """Create and commit a user; keyword arguments override the defaults"""
+    created = []
+
+    def make_user(user_type='patient', **fields):
+        number = len(created) + 1
+        defaults = {'username': f'{user_type}{number}', 'email': f'{user_type}{number}@example.com',
+                    'first_name': user_type.title(), 'last_name': str(number)}
+        user = User(user_type=user_type, **dict(defaults, **fields))
+        user.password_hash = '-'
+        db.session.add(user)
+        db.session.commit()
+        created.append(user)
+        return user
+    return make_user
@@ -0,0 +1,70 @@
+import pytest
+import catalog
+from app import db
+from benchmark import count_queries
+from cart import add_item, cart_items, get_cart, place_order
+from catalog import CatalogCache, catalog_facets, catalog_page
+from models import Medicine
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A catalog cache of the test's own, so no other test's pages are served from it"""
+    test_cache = CatalogCache(str(tmp_path / 'catalog.generation'))
+    monkeypatch.setattr(catalog, 'catalog_cache', test_cache)
+    return test_cache
+
+
+@pytest.fixture
+def medicines(database):
+    rows = [Medicine(name=f'Medicine {i}', description='-', price=3, stock_quantity=10, category='Pain Relief',
+                     is_active=True)
+            for i in range(3)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def test_checkout_keeps_the_cache_but_pages_show_live_stock(cache, medicines, make_user):
+    patient = make_user()
+    first = catalog_page(Medicine)
+    generation = cache._current_generation()
+
+    add_item(patient.id, medicines[0].id, 4)
+    cart = get_cart(patient.id)
+    place_order(patient.id, cart, cart_items(cart), 'Test address')
+    db.session.commit()
+
+    with count_queries() as statements:
+        again = catalog_page(Medicine)
+    assert cache._current_generation() == generation
+    # Only the stock lookup; the facets and page come from the cache
+    assert len(statements) == 1
+    assert [item.stock_quantity for item in first.items] == [10, 10, 10]
+    assert [item.stock_quantity for item in again.items] == [6, 10, 10]
+
+
+def test_restocking_through_the_orm_keeps_the_cache(cache, medicines):
+    catalog_page(Medicine)
+    generation = cache._current_generation()
+    medicines[1].stock_quantity = 50
+    db.session.commit()
+    assert cache._current_generation() == generation
+    assert [item.stock_quantity for item in catalog_page(Medicine).items] == [10, 50, 10]
+
+
+def test_catalog_edits_invalidate_the_cache(cache, medicines):
+    assert catalog_facets(Medicine) == {'Pain Relief': 3}
+    medicines[2].category = 'Allergy'
+    medicines[0].name = 'Renamed'
+    db.session.commit()
+    assert catalog_facets(Medicine) == {'Pain Relief': 2, 'Allergy': 1}
+    assert catalog_page(Medicine).items[0].name == 'Renamed'
+
+
+def test_browse_page_renders_live_stock(cache, medicines, make_user, browser):
+    medicines[0].stock_quantity = 7
+    db.session.commit()
+    response = browser(make_user()).get('/buy-medicines')
+    assert response.status_code == 200
+    assert b'Stock: 7' in response.data
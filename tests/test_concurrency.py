@@ -0,0 +1,146 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert, update
+from app import db
+from cart import CartError, add_item, cart_items, get_cart, place_order
+from models import Appointment, Cart, CartItem, Medicine, MedicineOrder, MedicineOrderItem, User
+from utils import reserve_appointment
+
+THREADS = 16
+
+
+def test_concurrent_bookers_never_double_book_a_slot(app, make_user):
+    doctor = make_user('doctor')
+    patient_ids = [make_user().id for _ in range(THREADS)]
+    opening = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    times = [opening + timedelta(minutes=30 * i) for i in range(8)]
+
+    def book(patient_id):
+        booked = 0
+        with app.app_context():
+            for slot in random.sample(times, len(times)):
+                if reserve_appointment(patient_id=patient_id, doctor_id=doctor.id,
+                                       appointment_date=slot, status='scheduled'):
+                    db.session.commit()
+                    booked += 1
+        return booked
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        booked = sum(executor.map(book, patient_ids))
+
+    double_booked = db.session.query(Appointment.appointment_date).filter_by(doctor_id=doctor.id)\
+        .group_by(Appointment.appointment_date).having(db.func.count() > 1).count()
+    assert booked == len(times)
+    assert double_booked == 0
+
+
+@pytest.mark.parametrize('buyers, threads, stock', [(40, THREADS, 30), (300, 32, 200)], ids=['40 buyers', '300 buyers'])
+def test_concurrent_checkouts_never_oversell_or_lose_orders(app, database, buyers, threads, stock):
+    db.session.execute(insert(User), [
+        {'username': f'buyer{i}', 'email': f'buyer{i}@example.com', 'password_hash': '-',
+         'first_name': 'Buyer', 'last_name': str(i), 'user_type': 'patient'}
+        for i in range(buyers)
+    ])
+    db.session.execute(insert(Medicine), [
+        {'name': f'Scarce medicine {i}', 'price': 2 + i, 'stock_quantity': stock, 'category': 'Test', 'is_active': True}
+        for i in range(3)
+    ])
+    db.session.commit()
+    medicine_ids = [row.id for row in db.session.query(Medicine.id).order_by(Medicine.id)]
+    buyer_ids = [row.id for row in db.session.query(User.id)]
+    # Demand is about 1.5 units per buyer per medicine, about twice the stock
+    for user_id in buyer_ids:
+        for medicine_id in medicine_ids:
+            add_item(user_id, medicine_id, random.randint(1, 2))
+    db.session.commit()
+
+    def checkout(user_id):
+        with app.app_context():
+            cart = get_cart(user_id)
+            try:
+                place_order(user_id, cart, cart_items(cart), 'Test address')
+                db.session.commit()
+                return 'placed'
+            except CartError:
+                db.session.rollback()
+                return 'sold out'
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(checkout, buyer_ids))
+
+    orders = MedicineOrder.query.count()
+    assert outcomes.count('placed') == orders and 'sold out' in outcomes
+    assert db.session.query(db.func.count(db.distinct(MedicineOrder.order_number))).scalar() == orders
+    for medicine_id in medicine_ids:
+        left = db.session.get(Medicine, medicine_id).stock_quantity
+        sold = db.session.query(db.func.coalesce(db.func.sum(MedicineOrderItem.quantity), 0))\
+            .filter_by(medicine_id=medicine_id).scalar()
+        assert left >= 0 and left + sold == stock
+
+
+def test_concurrent_adds_of_one_medicine_all_count(app, make_user, browser):
+    patient = make_user()
+    medicine = Medicine(name='Aspirin', price=5, stock_quantity=50, category='Pain Relief', is_active=True)
+    db.session.add(medicine)
+    db.session.commit()
+    medicine_id = medicine.id
+    clients = [browser(patient) for _ in range(8)]
+    start = threading.Barrier(len(clients))
+
+    def add(client):
+        start.wait()
+        return client.post('/api/cart/items', json={'medicine_id': medicine_id, 'quantity': 1}).status_code
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        statuses = list(executor.map(add, clients))
+
+    db.session.expire_all()
+    cart = Cart.query.filter_by(user_id=patient.id).one()
+    assert statuses == [200] * len(clients)
+    assert [item.quantity for item in CartItem.query.filter_by(cart_id=cart.id)] == [len(clients)]
+    assert cart.item_count == len(clients)
+
+
+def test_add_starts_over_from_a_quantity_changed_elsewhere(make_user):
+    patient = make_user()
+    medicine = Medicine(name='Ibuprofen', price=4, stock_quantity=50, category='Pain Relief', is_active=True)
+    db.session.add(medicine)
+    db.session.commit()
+    add_item(patient.id, medicine.id, 1)
+    db.session.commit()
+    item = CartItem.query.one()
+    # Another request changes the item this session already holds
+    with db.engine.begin() as connection:
+        connection.execute(update(CartItem).where(CartItem.id == item.id).values(quantity=5))
+
+    add_item(patient.id, medicine.id, 1)
+    db.session.commit()
+    assert db.session.get(CartItem, item.id).quantity == 6
+
+
+def test_concurrent_adds_to_an_existing_item_all_count(app, make_user, browser):
+    patient = make_user()
+    medicine = Medicine(name='Paracetamol', price=3, stock_quantity=50, category='Pain Relief', is_active=True)
+    db.session.add(medicine)
+    db.session.commit()
+    medicine_id = medicine.id
+    add_item(patient.id, medicine_id, 1)
+    db.session.commit()
+    clients = [browser(patient) for _ in range(8)]
+    start = threading.Barrier(len(clients))
+
+    def add(client):
+        start.wait()
+        return client.post('/api/cart/items', json={'medicine_id': medicine_id, 'quantity': 1}).status_code
+
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        statuses = list(executor.map(add, clients))
+
+    db.session.expire_all()
+    cart = Cart.query.filter_by(user_id=patient.id).one()
+    assert statuses == [200] * len(clients)
+    assert [item.quantity for item in CartItem.query.filter_by(cart_id=cart.id)] == [len(clients) + 1]
+    assert cart.item_count == len(clients) + 1
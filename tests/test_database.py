@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app import db
+from database import InstrumentedNullPool, InstrumentedQueuePool, POOL_RECYCLE, engine_options, pool_capacity
+from metrics import registry
+
+SQLITE_URL = 'sqlite:////tmp/health.db'
+POSTGRES_URL = 'postgresql+psycopg://health@db.internal/health'
+
+
+@pytest.mark.parametrize('worker_class, threads, size, overflow', [
+    ('sync', 1, 1, 1),
+    ('gthread', 8, 8, 2),
+    ('gthread', 2, 2, 2),
+    ('gevent', 1, 10, 10),
+    ('', 1, 5, 10),
+])
+def test_pool_follows_the_worker_model(worker_class, threads, size, overflow):
+    options = engine_options(SQLITE_URL, {'WORKER_CLASS': worker_class, 'WORKER_THREADS': str(threads)})
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert (options['pool_size'], options['max_overflow']) == (size, overflow)
+    assert options['pool_use_lifo'] and not options['pool_pre_ping']
+    assert pool_capacity(options) == size + overflow
+
+
+def test_environment_overrides_the_pool():
+    options = engine_options(SQLITE_URL, {'WORKER_CLASS': 'sync', 'DB_POOL_SIZE': '3', 'DB_MAX_OVERFLOW': '0',
+                                          'DB_POOL_TIMEOUT': '2.5', 'DB_POOL_PRE_PING': 'true'})
+    assert (options['pool_size'], options['max_overflow'], options['pool_timeout']) == (3, 0, 2.5)
+    assert options['pool_pre_ping']
+
+
+def test_in_memory_sqlite_keeps_flask_sqlalchemy_defaults():
+    assert engine_options('sqlite://', {}) == {}
+    assert engine_options(None, {}) == {}
+
+
+def test_postgres_connections_are_recycled_and_kept_alive():
+    options = engine_options(POSTGRES_URL, {})
+    assert options['pool_recycle'] == POOL_RECYCLE
+    assert options['connect_args']['keepalives'] == 1
+    assert options['connect_args']['connect_timeout'] == 10
+
+
+def test_pgbouncer_leaves_pooling_to_it():
+    options = engine_options(POSTGRES_URL, {'DB_PGBOUNCER': 'true', 'WORKER_CLASS': 'gthread', 'WORKER_THREADS': '8'})
+    assert options['poolclass'] is InstrumentedNullPool
+    assert options['connect_args']['prepare_threshold'] is None
+    assert pool_capacity(options) is None
+
+
+def test_sqlite_connections_use_wal(database):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('SQLite only')
+    with db.engine.connect() as connection:
+        pragmas = {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                   for name in ('journal_mode', 'synchronous', 'busy_timeout')}
+    assert pragmas == {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000}
+
+
+def test_saturated_pool_times_out_and_is_counted(database):
+    # A sync worker's pool: one connection plus one overflow, here with a short timeout
+    url = db.engine.url
+    options = engine_options(url, {'WORKER_CLASS': 'sync', 'DB_POOL_TIMEOUT': '0.2'})
+    capacity = pool_capacity(options)
+    if capacity is None:
+        pytest.skip('the pool is left to the database or PgBouncer')
+    engine = create_engine(url, **options)
+    registry.reset()
+    try:
+        held = [engine.connect() for _ in range(capacity)]
+        assert engine.pool.checkedout() == capacity
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        for connection in held:
+            connection.close()
+        text_metrics = registry.render()
+    finally:
+        engine.dispose()
+        registry.reset()
+    assert f'health_db_pool_checkout_seconds_count {capacity + 1}' in text_metrics
+    assert 'health_db_pool_timeouts_total 1' in text_metrics
@@ -0,0 +1,33 @@
+from datetime import date, datetime
+import pytest
+from dates import date_window, to_utc
+
+
+@pytest.fixture
+def new_york(app):
+    original = app.config['CLINIC_TIMEZONE']
+    app.config['CLINIC_TIMEZONE'] = 'America/New_York'
+    yield
+    app.config['CLINIC_TIMEZONE'] = original
+
+
+def test_day_window_is_midnight_to_midnight(new_york):
+    assert date_window('day', date(2026, 3, 8)) == (datetime(2026, 3, 8), datetime(2026, 3, 9))
+
+
+def test_week_window_starts_on_monday(new_york):
+    assert date_window('week', date(2026, 10, 17)) == (datetime(2026, 10, 12), datetime(2026, 10, 19))
+
+
+def test_month_window_rolls_over_the_year(new_york):
+    assert date_window('month', date(2026, 12, 31), periods=2) == (datetime(2026, 12, 1), datetime(2027, 2, 1))
+
+
+def test_utc_bounds_of_the_spring_forward_day_are_23_hours_apart(new_york):
+    assert [to_utc(bound) for bound in date_window('day', date(2026, 3, 8))] \
+        == [datetime(2026, 3, 8, 5), datetime(2026, 3, 9, 4)]
+
+
+def test_unknown_period_is_rejected():
+    with pytest.raises(ValueError):
+        date_window('fortnight', date(2026, 1, 1))
@@ -0,0 +1,39 @@
+import pytest
+from events import StreamSlots, stream_limit, stream_slots
+
+
+@pytest.mark.parametrize('environ, limit', [
+    ({'WORKER_CLASS': 'gthread', 'WORKER_THREADS': '8'}, 4),
+    ({'WORKER_CLASS': 'sync'}, 0),
+    ({'WORKER_CLASS': 'gevent'}, 1000),
+    ({}, 16),
+    ({'WORKER_CLASS': 'gthread', 'WORKER_THREADS': '8', 'MAX_EVENT_STREAMS': '2'}, 2),
+])
+def test_stream_limit_leaves_threads_for_requests(environ, limit):
+    assert stream_limit(environ) == limit
+
+
+def test_slots_refuse_past_the_limit():
+    slots = StreamSlots(1)
+    assert slots.acquire() and not slots.acquire()
+    slots.release()
+    assert slots.acquire() and slots.refused == 1
+
+
+@pytest.fixture
+def one_stream(monkeypatch):
+    monkeypatch.setattr(stream_slots, 'limit', 1)
+    monkeypatch.setattr(stream_slots, 'open', 0)
+
+
+def test_stream_past_the_limit_answers_503_until_one_closes(one_stream, make_user, browser):
+    client = browser(make_user())
+    first = client.get('/api/stream', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/api/stream').status_code == 503
+
+    first.close()
+    second = client.get('/api/stream', buffered=False)
+    assert second.status_code == 200
+    second.close()
+    assert stream_slots.open == 0
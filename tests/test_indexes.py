@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import and_, text
+from app import db
+from dates import clinic_today, in_window
+from models import Appointment, LabTestBooking, MedicalRecord, Message, Notification, User
+
+
+USER_ID = 1
+
+# Queries issued on every dashboard, inbox and calendar request, built lazily
+# since a query needs an app context
+HOT_QUERIES = {
+    'patient appointments': lambda now: Appointment.query.filter_by(patient_id=USER_ID)
+        .order_by(Appointment.appointment_date.desc()),
+    'doctor calendar': lambda now: Appointment.query.filter_by(doctor_id=USER_ID),
+    'doctor appointments': lambda now: Appointment.query.filter_by(doctor_id=USER_ID)
+        .order_by(Appointment.appointment_date.desc()),
+    'slot check': lambda now: Appointment.query.filter(
+        and_(Appointment.doctor_id == USER_ID,
+             Appointment.appointment_date == now,
+             Appointment.status.in_(['scheduled', 'confirmed']))),
+    'pending payments': lambda now: Appointment.query.filter(
+        and_(Appointment.doctor_id == USER_ID,
+             Appointment.payment_status == 'pending')),
+    'reminder sweep': lambda now: Appointment.query.filter(
+        and_(Appointment.appointment_date >= now,
+             Appointment.status.in_(['scheduled', 'confirmed']))),
+    'inbox': lambda now: Message.query.filter_by(recipient_id=USER_ID)
+        .order_by(Message.created_at.desc()),
+    'unread messages': lambda now: Message.query.filter_by(recipient_id=USER_ID, is_read=False)
+        .order_by(Message.created_at.desc()),
+    'notifications': lambda now: Notification.query.filter_by(user_id=USER_ID)
+        .order_by(Notification.created_at.desc()),
+    'unread notifications': lambda now: Notification.query.filter_by(user_id=USER_ID, is_read=False),
+    'old read notifications': lambda now: Notification.query.filter(
+        and_(Notification.is_read == True,
+             Notification.created_at < now)),
+    'medical records': lambda now: MedicalRecord.query.filter_by(patient_id=USER_ID)
+        .order_by(MedicalRecord.created_at.desc()),
+    'pending lab results': lambda now: LabTestBooking.query.filter_by(user_id=USER_ID, status='in_progress'),
+    'active doctors': lambda now: User.query.filter_by(user_type='doctor', is_active=True),
+}
+
+# Calendar-window queries, with the column whose index they must range over (None: any index)
+WINDOWED_QUERIES = {
+    "today's appointments for a doctor": ('appointment_date', lambda tomorrow: Appointment.query.filter(
+        and_(Appointment.doctor_id == USER_ID, in_window(Appointment.appointment_date, 'day')))),
+    "tomorrow's reminders": ('appointment_date', lambda tomorrow: Appointment.query.filter(
+        and_(in_window(Appointment.appointment_date, 'day', tomorrow),
+             Appointment.status.in_(['scheduled', 'confirmed'])))),
+    'free slots for the coming week': ('appointment_date', lambda tomorrow: Appointment.query.filter(
+        and_(Appointment.doctor_id.in_([USER_ID, USER_ID + 1]),
+             in_window(Appointment.appointment_date, 'day', tomorrow, 7),
+             Appointment.status.in_(['scheduled', 'confirmed'])))),
+    'payments this month': (None, lambda tomorrow: Appointment.query.filter(
+        and_(Appointment.doctor_id == USER_ID, Appointment.payment_status == 'paid',
+             in_window(Appointment.updated_at, 'month', utc=True)))),
+}
+
+
+def explain(query):
+    """The query plan lines for a query on the current database"""
+    compiled = query.statement.compile(dialect=db.engine.dialect,
+                                       compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + str(compiled))).all()
+    return [str(row[-1]) for row in rows]
+
+
+def uses_index(plan):
+    """Whether no step of a query plan is a full table scan"""
+    if db.engine.dialect.name == 'sqlite':
+        return all('USING' in line for line in plan if line.startswith('SCAN'))
+    return 'Seq Scan' not in '\n'.join(plan)
+
+
+def range_scans(plan, column):
+    """Whether a query plan reaches `column` as an index range, not a per-row filter"""
+    if db.engine.dialect.name == 'sqlite':
+        return any('USING' in line and 'INDEX' in line and f'{column}>' in line for line in plan)
+    return any('Index Cond' in line and column in line for line in plan)
+
+
+@pytest.fixture
+def plans(database):
+    if db.engine.dialect.name == 'postgresql':
+        # Small tables would otherwise always be sequentially scanned
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    yield explain
+    db.session.rollback()
+
+
+@pytest.mark.parametrize('label', HOT_QUERIES)
+def test_hot_query_uses_an_index(plans, label):
+    plan = plans(HOT_QUERIES[label](datetime.utcnow()))
+    assert uses_index(plan), '\n'.join(plan)
+
+
+@pytest.mark.parametrize('label', WINDOWED_QUERIES)
+def test_windowed_query_range_scans_an_index(plans, label):
+    column, query = WINDOWED_QUERIES[label]
+    plan = plans(query(clinic_today() + timedelta(days=1)))
+    assert (range_scans(plan, column) if column else uses_index(plan)), '\n'.join(plan)
@@ -0,0 +1,153 @@
+import io
+import os
+import multiprocessing
+from datetime import datetime
+import pytest
+from PIL import Image
+from app import app as flask_app, db
+from jobs import JOB_HANDLERS, claim_job, enqueue, enqueue_periodic_jobs, job, requeue_stalled_jobs, run_job, work
+from models import Job, Notification
+from thumbnails import DERIVED_FOLDER
+from utils import create_notifications
+
+
+# Registered at import, so worker processes forked by the tests have it too
+@job('test_notify')
+def notify(notifications):
+    create_notifications(notifications)
+
+
+@pytest.fixture
+def handlers():
+    """Register test job handlers, removed again after the test"""
+    names = []
+
+    def register(name, max_attempts):
+        names.append(name)
+        return job(name, max_attempts=max_attempts)
+    yield register
+    for name in names:
+        JOB_HANDLERS.pop(name, None)
+
+
+def run_due():
+    # Retries are scheduled in the future; pull them forward instead of waiting
+    db.session.execute(Job.__table__.update().where(Job.status == 'queued').values(run_at=datetime(2000, 1, 1)))
+    db.session.commit()
+    claimed = claim_job('test')
+    return claimed and run_job(claimed)
+
+
+def test_rolled_back_enqueue_leaves_no_job(make_user):
+    enqueue('test_notify', notifications=[(make_user().id, 'Job', 'rolled back', 'system')])
+    db.session.rollback()
+    assert Job.query.count() == 0
+
+
+def test_idempotency_key_queues_once(database):
+    first = enqueue('test_notify', key='test-key', notifications=[])
+    second = enqueue('test_notify', key='test-key', notifications=[])
+    db.session.commit()
+    assert first and not second
+    assert Job.query.filter_by(idempotency_key='test-key').count() == 1
+
+
+def test_periodic_jobs_queue_once_per_slot(database):
+    assert enqueue_periodic_jobs() == 4
+    assert enqueue_periodic_jobs() == 0
+
+
+def test_failing_job_is_retried_until_it_succeeds(database, handlers):
+    calls = []
+
+    @handlers('test_flaky', max_attempts=3)
+    def flaky():
+        calls.append(True)
+        if len(calls) < 3:
+            raise RuntimeError('flaky job failed')
+
+    enqueue('test_flaky')
+    db.session.commit()
+    results = [run_due() for _ in range(3)]
+    flaky_job = Job.query.filter_by(name='test_flaky').one()
+    assert results == [False, False, True]
+    assert flaky_job.status == 'done' and flaky_job.attempts == 3
+
+
+def test_retry_is_delayed_then_job_fails_for_good(database, handlers):
+    calls = []
+
+    @handlers('test_broken', max_attempts=2)
+    def broken():
+        calls.append(True)
+        raise RuntimeError('broken job failed')
+
+    enqueue('test_broken')
+    db.session.commit()
+    start = datetime.utcnow()
+    run_due()
+    broken_job = Job.query.filter_by(name='test_broken').one()
+    assert broken_job.status == 'queued' and broken_job.run_at > start
+
+    run_due()
+    db.session.refresh(broken_job)
+    assert broken_job.status == 'failed' and len(calls) == 2
+    assert 'broken job failed' in broken_job.last_error
+
+
+def test_job_of_a_dead_worker_is_requeued(database):
+    enqueue('test_notify', notifications=[])
+    db.session.commit()
+    stalled = claim_job('dead-worker')
+    db.session.execute(Job.__table__.update().where(Job.id == stalled.id).values(locked_at=datetime(2000, 1, 1)))
+    db.session.commit()
+    assert requeue_stalled_jobs() == 1
+
+
+def _work_process():
+    with flask_app.app_context():
+        work(once=True)
+
+
+def test_jobs_run_exactly_once_across_worker_processes(make_user):
+    count, processes = 100, 4
+    user_id = make_user().id
+    for i in range(count):
+        enqueue('test_notify', notifications=[(user_id, f'Job race {i}', 'race', 'system')])
+    db.session.commit()
+    # Children must open their own connections rather than share the parent's
+    db.engine.dispose()
+
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_work_process) for _ in range(processes)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+
+    titles = [row.title for row in db.session.query(Notification.title).filter(Notification.title.like('Job race %'))]
+    assert all(child.exitcode == 0 for child in children)
+    assert len(titles) == count and len(set(titles)) == count
+    assert Job.query.filter(Job.status != 'done').count() == 0
+
+
+def test_profile_picture_thumbnails_are_made_by_the_worker(app, make_user, browser):
+    patient = make_user()
+    picture = io.BytesIO()
+    Image.new('RGB', (800, 600), 'teal').save(picture, 'PNG')
+    picture.seek(0)
+    response = browser(patient).post('/patient/settings', content_type='multipart/form-data', data={
+        'first_name': 'Pat', 'last_name': 'Ient', 'email': 'pat@example.com',
+        'profile_picture': (picture, 'me.png'),
+    })
+    assert response.status_code == 302
+
+    db.session.refresh(patient)
+    filename = patient.profile_picture
+    queued = Job.query.filter_by(name='pregenerate_thumbnails').one()
+    assert queued.idempotency_key == f'thumbnails:{filename}'
+    assert run_due()
+    derived = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'], DERIVED_FOLDER)
+    digest = filename.split('.', 1)[0]
+    assert sorted(name for name in os.listdir(derived) if name.startswith(digest)) == [
+        f'{digest}-320.jpg', f'{digest}-320.webp', f'{digest}-96.jpg', f'{digest}-96.webp']
@@ -0,0 +1,120 @@
+import base64
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app import db
+from models import Appointment, Message
+from pagination import decode_cursor, encode_cursor, keyset_paginate
+
+PER_PAGE = 10
+ROWS = 35
+START = datetime(2026, 1, 5, 9, 0)
+
+
+def walk(query, order, cursor=None):
+    """Every page from `cursor` on, following next_num, then back again following prev_num"""
+    pages = [keyset_paginate(query, order, cursor=cursor, per_page=PER_PAGE)]
+    while pages[-1].next_num:
+        pages.append(keyset_paginate(query, order, cursor=pages[-1].next_num, per_page=PER_PAGE))
+    backwards = [pages[-1]]
+    while backwards[-1].prev_num:
+        backwards.append(keyset_paginate(query, order, cursor=backwards[-1].prev_num, per_page=PER_PAGE))
+    return pages, backwards
+
+
+def ids(pages):
+    return [[row.id for row in page.items] for page in pages]
+
+
+@pytest.fixture
+def inbox(make_user):
+    """A patient with ROWS messages, several sharing a timestamp so the id breaks ties"""
+    doctor, patient = make_user('doctor'), make_user()
+    db.session.execute(insert(Message), [
+        {'sender_id': doctor.id, 'recipient_id': patient.id, 'subject': f'Message {i}', 'content': '-',
+         'is_read': False, 'created_at': START + timedelta(minutes=i // 3)}
+        for i in range(ROWS)
+    ])
+    db.session.commit()
+    return patient
+
+
+@pytest.fixture
+def diary(make_user):
+    """A doctor with ROWS past appointments, two at each time"""
+    doctor, patient = make_user('doctor'), make_user()
+    db.session.execute(insert(Appointment), [
+        {'patient_id': patient.id, 'doctor_id': doctor.id, 'status': 'completed',
+         'appointment_date': START + timedelta(hours=i // 2)}
+        for i in range(ROWS)
+    ])
+    db.session.commit()
+    return doctor
+
+
+@pytest.mark.parametrize('model, column, owner', [
+    (Message, Message.created_at, 'inbox'),
+    (Appointment, Appointment.appointment_date, 'diary'),
+])
+def test_cursors_walk_the_list_both_ways(request, model, column, owner):
+    user = request.getfixturevalue(owner)
+    owner_column = model.recipient_id if model is Message else model.doctor_id
+    query = model.query.filter(owner_column == user.id)
+    order = [(column, True), (model.id, True)]
+    expected = [row.id for row in query.order_by(column.desc(), model.id.desc())]
+
+    pages, backwards = walk(query, order)
+    assert [row_id for page in ids(pages) for row_id in page] == expected
+    assert [page.page for page in pages] == [1, 2, 3, 4]
+    assert [len(page.items) for page in pages] == [10, 10, 10, 5]
+    assert not pages[0].has_prev and not pages[-1].has_next
+    # Stepping back gives the same pages, down to the first with no way further back
+    assert ids(backwards) == ids(pages)[::-1]
+    assert [page.page for page in backwards] == [4, 3, 2, 1]
+
+
+def test_rows_added_while_paging_do_not_shift_later_pages(inbox):
+    query = Message.query.filter_by(recipient_id=inbox.id)
+    order = [(Message.created_at, True), (Message.id, True)]
+    first = keyset_paginate(query, order, per_page=PER_PAGE)
+    second = keyset_paginate(query, order, cursor=first.next_num, per_page=PER_PAGE)
+    db.session.add(Message(sender_id=inbox.id, recipient_id=inbox.id, content='-', created_at=START + timedelta(days=1)))
+    db.session.commit()
+    assert ids([keyset_paginate(query, order, cursor=first.next_num, per_page=PER_PAGE)]) == ids([second])
+
+
+def _token(page, direction, values):
+    raw = json.dumps([page, direction, values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('token', [
+    _token(2, 'next', [{'dt': '2026-01-05T09:05:00'}]),
+    _token(2, 'next', [{'dt': '2026-01-05T09:05:00'}, 3, 4]),
+    _token(2, 'next', [[1], {'x': 1}]),
+    _token(2, 'next', 'ab'),
+    _token(True, 'next', [{'dt': '2026-01-05T09:05:00'}, 3]),
+    _token(2, 'sideways', [{'dt': '2026-01-05T09:05:00'}, 3]),
+    'not a cursor',
+], ids=['short key', 'long key', 'nested values', 'values not a list', 'bool page', 'bad direction',
+      'not base64'])
+def test_tampered_cursor_falls_back_to_the_first_page(inbox, token):
+    query = Message.query.filter_by(recipient_id=inbox.id)
+    order = [(Message.created_at, True), (Message.id, True)]
+    page = keyset_paginate(query, order, cursor=token, per_page=PER_PAGE)
+    assert page.page == 1
+    assert ids([page]) == ids([keyset_paginate(query, order, per_page=PER_PAGE)])
+
+
+def test_cursor_round_trips_datetimes():
+    token = encode_cursor(3, 'prev', [START, 7])
+    assert decode_cursor(token) == (3, 'prev', [START, 7])
+    assert decode_cursor(_token(False, 'next', [7])) is None
+
+
+@pytest.mark.parametrize('owner, url', [('inbox', '/patient/messages'), ('diary', '/staff/appointments')])
+def test_pages_answer_a_tampered_cursor(request, browser, owner, url):
+    client = browser(request.getfixturevalue(owner))
+    assert client.get(url, query_string={'page': _token(2, 'next', [1, 2, 3])}).status_code == 200
+    assert client.get(url, query_string={'page': _token(True, 'next', [{'dt': 'x'}, 2])}).status_code == 200
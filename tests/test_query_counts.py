@@ -0,0 +1,86 @@
+import pytest
+from app import db
+from benchmark import count_queries
+from models import Appointment, Message, User
+from utils import get_available_slots, get_dashboard_stats, get_first_available_slot
+
+# Most SQL statements each page may issue for a user with plenty of data,
+# including the one that loads the logged-in user.  An N+1 regression
+# blows straight through these.  Before eager loading the list pages took
+# 12-42 statements and the calendar feed one per appointment (1,276 on a
+# 100k appointment database).  {patient_id}, {appointment_id} and
+# {message_id} are filled in from the busiest patient's rows.
+QUERY_BUDGETS = {
+    'patient': {
+        '/patient/dashboard': 5,
+        '/patient/appointments': 2,
+        '/patient/messages': 2,
+        '/patient/appointment/{appointment_id}': 2,
+        '/message/{message_id}': 2,
+        '/patient/profile': 1,
+        '/api/notifications': 2,
+        '/api/first-available': 3,
+    },
+    'doctor': {
+        '/staff/dashboard': 4,
+        '/staff/appointments': 2,
+        '/staff/payment-info': 5,
+        '/staff/messages': 2,
+        '/staff/notifications': 2,
+        '/staff/patients': 3,
+        '/staff/patient/{patient_id}': 4,
+        '/api/patient/{patient_id}/history/appointments': 2,
+        '/api/patient/{patient_id}/history/records': 2,
+        '/api/staff/calendar-events': 2,
+        '/api/staff/calendar-events?start=2020-01-01T00:00:00Z&end=2030-01-01T00:00:00Z': 2,
+    },
+}
+
+
+def busiest(user_type):
+    """The user of this type with the most appointments, who gives N+1 loads the best chance to show"""
+    column = Appointment.patient_id if user_type == 'patient' else Appointment.doctor_id
+    user_id = db.session.query(column).group_by(column).order_by(db.func.count().desc()).limit(1).scalar()
+    return db.session.get(User, user_id)
+
+
+def url_for_patient(url, patient):
+    # An already read message, so viewing it writes nothing the other tests would see
+    return url.format(
+        patient_id=patient.id,
+        appointment_id=db.session.query(Appointment.id).filter_by(patient_id=patient.id).limit(1).scalar(),
+        message_id=db.session.query(Message.id).filter_by(recipient_id=patient.id, is_read=True).limit(1).scalar(),
+    )
+
+
+@pytest.mark.parametrize('user_type, url', [(user_type, url) for user_type, budgets in QUERY_BUDGETS.items()
+                                            for url in budgets])
+def test_page_stays_within_its_query_budget(app, seeded, browser, user_type, url):
+    with app.app_context():
+        client = browser(busiest(user_type))
+        path = url_for_patient(url, busiest('patient'))
+        with count_queries() as statements:
+            response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) <= QUERY_BUDGETS[user_type][url], '\n'.join(statements)
+
+
+@pytest.mark.parametrize('user_type', ['patient', 'doctor', 'nurse'])
+def test_dashboard_stats_take_one_query(app, seeded, user_type):
+    # Each role took 4 queries before the stats became one aggregated SELECT
+    with app.app_context():
+        user = User.query.filter_by(user_type=user_type).first()
+        with count_queries() as statements:
+            get_dashboard_stats(user)
+    assert len(statements) == 1, '\n'.join(statements)
+
+
+def test_free_slots_of_every_doctor_take_one_query_per_lookup(app, seeded):
+    # One range query over all the doctors' appointments, not one per doctor and day
+    with app.app_context():
+        doctor_ids = [row.id for row in db.session.query(User.id).filter_by(user_type='doctor')]
+        with count_queries() as statements:
+            slots = get_available_slots(doctor_ids, days_ahead=14)
+            get_first_available_slot(doctor_ids, days_ahead=14)
+    assert set(slots) == set(doctor_ids)
+    assert len(statements) == 2, '\n'.join(statements)
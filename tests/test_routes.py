@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+from app import app as flask_app
+
+# Loads the app the way a gunicorn worker does, in a fresh interpreter so
+# ROUTE_AREAS is read at import, and reports what the areas answer.  It
+# shares the test database, whose tables the `database` fixture creates
+AREA_PROBE = '''
+import json, sys
+from flask import url_for
+from main import app
+client = app.test_client()
+with app.test_request_context():
+    links = [url_for(endpoint) for endpoint in ('pharmacy.buy_medicines', 'lab.tests', 'patient.dashboard')]
+print(json.dumps({
+    'status': {path: client.get(path).status_code
+               for path in ('/buy-medicines', '/lab-tests', '/patient/dashboard', '/login', '/home')},
+    'links': links,
+    'imported': sorted(name for name in ('pharmacy', 'lab', 'patient', 'auth') if name in sys.modules),
+}))
+'''
+
+
+def probe(areas):
+    env = dict(os.environ, ROUTE_AREAS=areas, AUTO_CREATE_TABLES='false')
+    return subprocess.run([sys.executable, '-c', AREA_PROBE], env=env, cwd=flask_app.root_path,
+                          capture_output=True, text=True)
+
+
+def test_areas_not_served_answer_404_but_their_links_build(database):
+    result = probe('auth,patient')
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.splitlines()[-1])
+    assert report['status'] == {'/buy-medicines': 404, '/lab-tests': 404,
+                                '/patient/dashboard': 302, '/login': 200, '/home': 200}
+    assert report['links'] == ['/buy-medicines', '/lab-tests', '/patient/dashboard']
+    # Views of the areas another pool serves are never imported
+    assert report['imported'] == ['auth', 'patient']
+
+
+def test_every_area_is_served_without_route_areas(database):
+    result = probe('')
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.splitlines()[-1])
+    assert 404 not in report['status'].values()
+    assert report['imported'] == ['auth', 'lab', 'patient', 'pharmacy']
+
+
+def test_unknown_area_fails_at_startup():
+    result = probe('patient,pharmcy')
+    assert result.returncode != 0
+    assert 'Unknown ROUTE_AREAS pharmcy' in result.stderr
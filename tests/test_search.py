@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import text
+from app import db
+from models import LabTest, Medicine, User
+from search import rebuild_search_index, search_all
+
+
+def indexed():
+    return sorted(db.session.execute(text('SELECT kind, ref_id, title, body FROM search_index')).all())
+
+
+def found(terms, kind):
+    return search_all(terms, kinds=[kind])[kind]
+
+
+def test_users_follow_inserts_updates_and_deletes(make_user):
+    patient = make_user(first_name='Amelia', last_name='Quartermaine')
+    doctor = make_user('doctor', first_name='Bartholomew', specialty='Cardiology')
+    assert found('amel quarter', 'patient') == [patient.id]
+    assert found('cardio', 'doctor') == [doctor.id]
+
+    patient.last_name = 'Winterbourne'
+    doctor.specialty = 'Dermatology'
+    db.session.commit()
+    assert found('quartermaine', 'patient') == [] and found('winterb', 'patient') == [patient.id]
+    assert found('cardiology', 'doctor') == [] and found('derma', 'doctor') == [doctor.id]
+
+    # A deactivated doctor drops out; a deleted patient goes entirely
+    doctor.is_active = False
+    db.session.delete(patient)
+    db.session.commit()
+    assert found('bartholomew', 'doctor') == [] and found('amelia', 'patient') == []
+
+
+def test_changing_user_type_moves_the_entry(make_user):
+    user = make_user(first_name='Cornelius')
+    user.user_type = 'doctor'
+    db.session.commit()
+    assert found('cornelius', 'patient') == [] and found('cornelius', 'doctor') == [user.id]
+
+
+@pytest.mark.parametrize('model, kind', [(Medicine, 'medicine'), (LabTest, 'lab_test')])
+def test_catalog_rows_follow_inserts_updates_and_deletes(database, model, kind):
+    row = model(name='Zolpidrex', description='Helps with sleeplessness', is_active=True)
+    db.session.add(row)
+    db.session.commit()
+    assert found('zolpi', kind) == [row.id] and found('sleepless', kind) == [row.id]
+
+    row.name = 'Somnavex'
+    db.session.commit()
+    assert found('zolpidrex', kind) == [] and found('somna', kind) == [row.id]
+
+    row.is_active = False
+    db.session.commit()
+    assert found('somnavex', kind) == []
+    row.is_active = True
+    db.session.commit()
+    assert found('somnavex', kind) == [row.id]
+
+    db.session.delete(row)
+    db.session.commit()
+    assert found('somnavex', kind) == []
+
+
+def test_unrelated_changes_leave_the_index_alone(make_user):
+    user = make_user(first_name='Dorothea')
+    before = indexed()
+    user.phone = '555-0100'
+    db.session.commit()
+    assert indexed() == before
+
+
+def test_rolled_back_write_leaves_no_entry(database):
+    db.session.add(Medicine(name='Phantomycin', is_active=True))
+    db.session.flush()
+    db.session.rollback()
+    assert found('phantomycin', 'medicine') == []
+
+
+def test_rebuild_gives_the_same_index_as_the_orm_hooks(make_user):
+    make_user(first_name='Evangeline')
+    make_user('doctor', first_name='Fitzgerald', specialty='Neurology')
+    make_user('doctor', first_name='Gwendolyn', is_active=False)
+    db.session.add_all([Medicine(name='Histamol', description='Allergy relief', is_active=True),
+                        Medicine(name='Retired', is_active=False),
+                        LabTest(name='Iron panel', is_active=True)])
+    db.session.commit()
+    maintained = indexed()
+    rebuild_search_index()
+    assert indexed() == maintained
+
+
+@pytest.mark.parametrize('terms', ['"*', '()', '*', '"', 'AND', 'NEAR(', 'a OR', 'NOT -x', "o'brien", 'x:y', '^',
+                                   '&|!', '{kind}', '   ', 'café'])
+def test_query_syntax_in_the_input_is_taken_literally(make_user, terms):
+    make_user(first_name='Obrien')
+    results = search_all(terms)
+    assert set(results) == {'patient', 'doctor', 'medicine', 'lab_test'}
+
+
+def test_punctuation_is_dropped_from_words(make_user):
+    user = make_user(first_name='Obrien', last_name='Nearly')
+    assert found('"obri*"', 'patient') == [user.id]
+    assert found('(nearly) AND', 'patient') == []
+    assert found('(nearly)', 'patient') == [user.id]
+
+
+@pytest.mark.parametrize('terms', ['"*', '()', 'NEAR(a', 'x" OR "y'])
+def test_search_page_answers_odd_syntax(make_user, browser, terms):
+    client = browser(make_user('doctor'))
+    assert client.get('/search', query_string={'query': terms}).status_code == 200
@@ -0,0 +1,42 @@
+import io
+import logging
+import pytest
+from PIL import Image
+from uploads import store_file
+
+
+@pytest.fixture
+def staff(make_user, browser):
+    return browser(make_user('doctor'))
+
+
+def picture(size=(640, 480)):
+    data = io.BytesIO()
+    Image.new('RGB', size, 'navy').save(data, 'PNG')
+    return data.getvalue()
+
+
+def test_image_is_served_resized_in_the_accepted_format(staff):
+    name = store_file(io.BytesIO(picture()), 'avatar.png')
+    response = staff.get(f'/uploads/{name}/thumb/sm', headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200 and response.mimetype == 'image/webp'
+    assert 'Accept' in response.vary
+    with Image.open(io.BytesIO(response.data)) as thumbnail:
+        assert max(thumbnail.size) == 96
+
+
+def test_other_uploads_have_no_thumbnail(staff, caplog):
+    name = store_file(io.BytesIO(b'%PDF-1.4 lab results'), 'results.pdf')
+    with caplog.at_level(logging.ERROR):
+        assert staff.get(f'/uploads/{name}/thumb/sm').status_code == 404
+    assert not caplog.records
+
+
+def test_broken_image_is_logged_once_and_served_as_is(staff, caplog):
+    content = b'not really a png'
+    name = store_file(io.BytesIO(content), 'broken.png')
+    with caplog.at_level(logging.ERROR):
+        responses = [staff.get(f'/uploads/{name}/thumb/md') for _ in range(3)]
+    assert [response.status_code for response in responses] == [200] * 3
+    assert all(response.data == content for response in responses)
+    assert len([record for record in caplog.records if 'thumbnail' in record.getMessage()]) == 1
@@ -0,0 +1,205 @@
+import io
+import os
+from urllib.parse import unquote
+import pytest
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from werkzeug.wrappers import Response
+from uploads import UploadError, claim_upload, nginx_etag, store_file
+
+CONTENT = os.urandom(256 * 1024)
+
+
+class AccelRedirectEmulator:
+    """WSGI wrapper that answers X-Accel-Redirect the way an nginx internal location would"""
+
+    def __init__(self, wsgi_app, prefix, folder):
+        self.wsgi_app = wsgi_app
+        self.prefix = prefix
+        self.folder = folder
+
+    def __call__(self, environ, start_response):
+        upstream = Response.from_app(self.wsgi_app, environ)
+        target = upstream.headers.get('X-Accel-Redirect')
+        if not target or not target.startswith(self.prefix):
+            return upstream(environ, start_response)
+
+        path = safe_join(self.folder, unquote(target[len(self.prefix):]))
+        if path is None or not os.path.isfile(path):
+            return Response(status=404)(environ, start_response)
+        served = send_file(path, environ, conditional=True, etag=nginx_etag(os.stat(path)))
+        # nginx keeps the upstream's caching headers and Content-Type
+        for header in ('Cache-Control', 'Content-Type'):
+            if header in upstream.headers:
+                served.headers[header] = upstream.headers[header]
+        return served(environ, start_response)
+
+
+@pytest.fixture
+def upload(app, database):
+    """URL of a stored attachment, served in the given UPLOAD_OFFLOAD mode"""
+    name = store_file(io.BytesIO(CONTENT), 'serving-check.pdf')
+    folder = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+    original_wsgi_app, original_mode = app.wsgi_app, app.config['UPLOAD_OFFLOAD']
+
+    def serve(mode, emulate_nginx=True):
+        app.config['UPLOAD_OFFLOAD'] = mode
+        app.wsgi_app = original_wsgi_app
+        if mode == 'x-accel' and emulate_nginx:
+            app.wsgi_app = AccelRedirectEmulator(original_wsgi_app, app.config['UPLOAD_ACCEL_PREFIX'], folder)
+        return f'/uploads/{name}'
+
+    serve.name = name
+    serve.path = os.path.abspath(os.path.join(folder, name))
+    yield serve
+    app.wsgi_app, app.config['UPLOAD_OFFLOAD'] = original_wsgi_app, original_mode
+    os.remove(serve.path)
+
+
+@pytest.fixture
+def staff(make_user, browser):
+    return browser(make_user('doctor'))
+
+
+@pytest.mark.parametrize('mode', ['', 'x-sendfile', 'x-accel'])
+def test_full_response_has_validators_and_long_private_caching(upload, staff, mode):
+    response = staff.get(upload(mode))
+    cache = response.headers.get('Cache-Control', '')
+    assert response.status_code == 200
+    assert 'ETag' in response.headers and 'Last-Modified' in response.headers
+    assert 'private' in cache and 'immutable' in cache and 'max-age=31536000' in cache
+    if mode == 'x-sendfile':
+        assert response.headers.get('X-Sendfile') == upload.path
+    else:
+        assert response.data == CONTENT
+
+
+@pytest.mark.parametrize('mode', ['', 'x-accel'])
+def test_revalidation_gives_304(upload, staff, mode):
+    url = upload(mode)
+    full = staff.get(url)
+    cached = staff.get(url, headers={'If-None-Match': full.headers['ETag']})
+    since = staff.get(url, headers={'If-Modified-Since': full.headers['Last-Modified']})
+    assert cached.status_code == 304 and not cached.data
+    assert 'X-Accel-Redirect' not in cached.headers
+    assert since.status_code == 304
+
+
+@pytest.mark.parametrize('mode', ['', 'x-accel'])
+def test_range_gives_206_with_the_requested_bytes(upload, staff, mode):
+    ranged = staff.get(upload(mode), headers={'Range': 'bytes=1000-1999'})
+    assert ranged.status_code == 206
+    assert ranged.data == CONTENT[1000:2000]
+    assert ranged.headers.get('Content-Range') == f'bytes 1000-1999/{len(CONTENT)}'
+
+
+def test_x_accel_app_only_hands_the_file_off(app, upload, staff):
+    url = upload('x-accel', emulate_nginx=False)
+    offloaded = staff.get(url)
+    assert offloaded.headers.get('X-Accel-Redirect') == app.config['UPLOAD_ACCEL_PREFIX'] + upload.name
+    assert not offloaded.data
+
+    # The app answers revalidation with the proxy's ETag itself
+    revalidated = staff.get(url, headers={'If-None-Match': offloaded.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert 'X-Accel-Redirect' not in revalidated.headers
+
+
+def test_patient_without_the_record_gets_404(upload, make_user, browser):
+    assert browser(make_user()).get(upload('')).status_code == 404
+
+
+def start(client, content, filename='scan.pdf'):
+    response = client.post('/api/uploads', json={'filename': filename, 'size': len(content)})
+    assert response.status_code == 201
+    return response.get_json()['upload_id']
+
+
+def put(client, upload_id, offset, chunk):
+    return client.put(f'/api/uploads/{upload_id}', query_string={'offset': offset}, data=chunk)
+
+
+@pytest.fixture
+def patient(make_user, browser):
+    user = make_user()
+    user.client = browser(user)
+    return user
+
+
+def test_interrupted_upload_resumes_from_the_stored_offset(app, patient):
+    upload_id = start(patient.client, CONTENT)
+    assert put(patient.client, upload_id, 0, CONTENT[:100000]).status_code == 200
+
+    # The connection dropped; the browser asks how far the upload got and carries on from there
+    status = patient.client.get(f'/api/uploads/{upload_id}').get_json()
+    assert status == {'upload_id': upload_id, 'offset': 100000, 'size': len(CONTENT), 'complete': False}
+    finished = put(patient.client, upload_id, status['offset'], CONTENT[status['offset']:]).get_json()
+    assert finished['complete'] and finished['offset'] == len(CONTENT)
+
+    with app.app_context():
+        stored_name, filename = claim_upload(upload_id, patient.id)
+    assert filename == 'scan.pdf'
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], stored_name), 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_chunk_at_the_wrong_offset_is_refused(patient):
+    upload_id = start(patient.client, CONTENT)
+    put(patient.client, upload_id, 0, CONTENT[:1000])
+    for offset in (0, 500, 2000):
+        refused = put(patient.client, upload_id, offset, CONTENT[offset:offset + 1000])
+        assert refused.status_code == 409 and refused.get_json()['offset'] == 1000
+    assert patient.client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 1000
+
+
+def test_chunk_past_the_declared_size_is_refused_and_rolled_back(patient):
+    upload_id = start(patient.client, CONTENT[:1000])
+    put(patient.client, upload_id, 0, CONTENT[:400])
+    assert put(patient.client, upload_id, 400, CONTENT[400:2000]).status_code == 413
+    assert patient.client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == 400
+
+
+def test_identical_content_is_stored_once(app, make_user, browser):
+    content = os.urandom(4096)
+    names, upload_ids = [], []
+    for user in (make_user(), make_user()):
+        client = browser(user)
+        upload_id = start(client, content, 'same.png')
+        upload_ids.append(upload_id)
+        put(client, upload_id, 0, content)
+        with app.app_context():
+            names.append(claim_upload(upload_id, user.id)[0])
+    assert names[0] == names[1]
+    stored = [name for name in os.listdir(app.config['UPLOAD_FOLDER']) if name == names[0]]
+    assert len(stored) == 1
+    # Nothing is left behind for the duplicate
+    partial = os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], '.partial'))
+    assert not [name for name in partial if name.split('.', 1)[0] in upload_ids]
+
+
+def test_uploads_belong_to_the_user_who_started_them(app, patient, make_user, browser):
+    upload_id = start(patient.client, CONTENT[:1000])
+    intruder = make_user()
+    other = browser(intruder)
+    assert other.get(f'/api/uploads/{upload_id}').status_code == 404
+    assert put(other, upload_id, 0, CONTENT[:1000]).status_code == 404
+    assert other.get('/api/uploads/not-an-upload-id').status_code == 404
+
+    with app.app_context():
+        with pytest.raises(UploadError) as incomplete:
+            claim_upload(upload_id, patient.id)
+        assert incomplete.value.status == 409
+        put(patient.client, upload_id, 0, CONTENT[:1000])
+        with pytest.raises(UploadError) as foreign:
+            claim_upload(upload_id, intruder.id)
+        assert foreign.value.status == 404
+        claim_upload(upload_id, patient.id)
+        # A claimed upload cannot be claimed again, by its owner or anyone else
+        with pytest.raises(UploadError) as again:
+            claim_upload(upload_id, patient.id)
+        assert again.value.status == 404
+
+
+def test_disallowed_file_type_is_refused(patient):
+    response = patient.client.post('/api/uploads', json={'filename': 'run.exe', 'size': 10})
+    assert response.status_code == 400
@@ -0,0 +1,115 @@
+import os
+import logging
+import threading
+from flask import abort, request, url_for
+from app import app
+from uploads import CONTENT_ADDRESSED_NAME, _hash_file, serve_upload, upload_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional, without it avatars are served at full size
+    Image = None
+
+# Longest edge in pixels of each avatar variant, about 2x the largest display size
+THUMBNAIL_SIZES = {'sm': 96, 'md': 320}
+# Extension -> (Pillow format, save options)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVED_FOLDER = '.derived'
+# Uploads that can be resized; other attachments, such as PDF records, have no thumbnails
+THUMBNAIL_SOURCE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Digests of uploads saved before names were content addresses, keyed by
+# (filename, mtime, size) so a replaced file is hashed again
+_digests = {}
+_digests_lock = threading.Lock()
+# (digest, size, extension) of variants that could not be made, so a broken upload is not retried
+# and logged on every request
+_failed = set()
+
+
+def source_digest(path, filename):
+    """SHA-256 of an upload's bytes, read from its name where possible"""
+    if CONTENT_ADDRESSED_NAME.match(filename):
+        return filename.split('.', 1)[0]
+    stat = os.stat(path)
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        digest = _hash_file(path).hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def _generate(source, target, pixels, extension):
+    """Resize an image to fit in a pixels x pixels box and write it atomically"""
+    image_format, options = THUMBNAIL_FORMATS[extension]
+    temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((pixels, pixels), Image.Resampling.LANCZOS)
+        if extension == 'jpg' or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        image.save(temporary, image_format, **options)
+    os.replace(temporary, target)
+
+
+def has_thumbnails(filename):
+    """Whether an upload is an image the thumbnail route can resize"""
+    return filename.rsplit('.', 1)[-1].lower() in THUMBNAIL_SOURCE_EXTENSIONS
+
+
+def ensure_thumbnail(filename, size, extension):
+    """Upload-relative name of a cached derivative, generated on first use; None if it cannot be made"""
+    if Image is None or not has_thumbnails(filename):
+        return None
+    source = upload_path(filename)
+    digest = source_digest(source, filename)
+    variant = (digest, size, extension)
+    if variant in _failed:
+        return None
+    name = f'{DERIVED_FOLDER}/{digest}-{THUMBNAIL_SIZES[size]}.{extension}'
+    target = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'], name)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            _generate(source, target, THUMBNAIL_SIZES[size], extension)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logging.exception(f'Could not create {size} thumbnail for {filename}')
+            with _digests_lock:
+                _failed.add(variant)
+            return None
+    return name
+
+
+def pregenerate_thumbnails(filename):
+    """Create every variant of a freshly uploaded picture so the first page view is fast"""
+    for size in THUMBNAIL_SIZES:
+        for extension in THUMBNAIL_FORMATS:
+            ensure_thumbnail(filename, size, extension)
+
+
+def serve_thumbnail(filename, size):
+    """Send a resized variant of an image upload, falling back to the original; 404 for other uploads"""
+    if not has_thumbnails(filename):
+        abort(404)
+    # Match the literal type: older browsers accept image/* without decoding WebP
+    extension = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+    name = ensure_thumbnail(filename, size, extension)
+    if name is None:
+        return serve_upload(filename)
+    response = serve_upload(name, immutable=bool(CONTENT_ADDRESSED_NAME.match(filename)))
+    response.vary.add('Accept')
+    return response
+
+
+@app.template_global()
+def avatar_url(user, size='sm'):
+    """URL of a user's resized profile picture, or None if they have none"""
+    if not user.profile_picture:
+        return None
+    return url_for('upload_thumbnail', filename=user.profile_picture, size=size)
@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+from flask import abort, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+from app import app
+from utils import allowed_file
+
+# Bytes the browser sends per request, so no single request holds a worker for long
+CHUNK_SIZE = 1024 * 1024
+# Bytes held in memory while copying a stream to disk
+BUFFER_SIZE = 64 * 1024
+# A chunk lock older than this is left over from a crashed request
+LOCK_TIMEOUT_SECONDS = 60
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# Names written by store_file; their content can never change
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Running hashes of in-progress uploads, so consecutive chunks reaching this
+# worker are not re-read from disk.  Other workers rebuild the hash from the file.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+MAX_CACHED_HASHERS = 256
+
+
+class UploadError(Exception):
+    """An upload request that cannot be accepted, with the HTTP status to answer"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _partial_folder():
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _paths(upload_id):
+    base = os.path.join(_partial_folder(), upload_id)
+    return base + '.part', base + '.json', base + '.lock'
+
+
+def _copy(stream, out, hasher, limit):
+    """Copy stream to out through a bounded buffer, hashing as it goes; returns bytes written"""
+    written = 0
+    while True:
+        block = stream.read(BUFFER_SIZE)
+        if not block:
+            return written
+        written += len(block)
+        if written > limit:
+            raise UploadError('Upload is larger than declared', 413)
+        hasher.update(block)
+        out.write(block)
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BUFFER_SIZE), b''):
+            hasher.update(block)
+    return hasher
+
+
+def _publish(temp_path, digest, filename):
+    """Move a complete file to its content address; returns (stored name, was duplicate)"""
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+    stored_name = f'{digest}.{extension}'
+    target = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+    if os.path.exists(target):
+        os.remove(temp_path)
+        return stored_name, True
+    # Identical concurrent uploads replace each other with the same bytes
+    os.replace(temp_path, target)
+    return stored_name, False
+
+
+def store_file(stream, filename):
+    """Save a file-like object under its content hash and return the stored name"""
+    temp_path = os.path.join(_partial_folder(), uuid.uuid4().hex + '.tmp')
+    hasher = hashlib.sha256()
+    try:
+        with open(temp_path, 'wb') as out:
+            _copy(stream, out, hasher, app.config['MAX_CONTENT_LENGTH'])
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return _publish(temp_path, hasher.hexdigest(), filename)[0]
+
+
+def _read_meta(upload_id, user_id):
+    if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+        raise UploadError('Unknown upload', 404)
+    try:
+        with open(_paths(upload_id)[1]) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload', 404)
+    if meta['user_id'] != user_id:
+        raise UploadError('Unknown upload', 404)
+    return meta
+
+
+def _write_meta(upload_id, meta):
+    meta_path = _paths(upload_id)[1]
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def start_upload(user_id, filename, size):
+    """Open a resumable upload and return its id"""
+    if not allowed_file(filename):
+        raise UploadError('File type not allowed')
+    if size < 0 or size > app.config['MAX_CONTENT_LENGTH']:
+        raise UploadError('File is too large', 413)
+
+    upload_id = uuid.uuid4().hex
+    part_path = _paths(upload_id)[0]
+    open(part_path, 'wb').close()
+    _write_meta(upload_id, {'user_id': user_id, 'filename': filename, 'size': size, 'stored_name': None})
+    if size == 0:
+        _finish(upload_id, _read_meta(upload_id, user_id), hashlib.sha256())
+    return upload_id
+
+
+def upload_status(upload_id, user_id):
+    """How far an upload has got, for resuming after a dropped connection"""
+    meta = _read_meta(upload_id, user_id)
+    if meta['stored_name']:
+        offset = meta['size']
+    else:
+        offset = os.path.getsize(_paths(upload_id)[0])
+    return {'upload_id': upload_id, 'offset': offset, 'size': meta['size'],
+            'complete': meta['stored_name'] is not None}
+
+
+def _finish(upload_id, meta, hasher):
+    part_path = _paths(upload_id)[0]
+    meta['stored_name'], meta['duplicate'] = _publish(part_path, hasher.hexdigest(), meta['filename'])
+    _write_meta(upload_id, meta)
+
+
+def append_chunk(upload_id, user_id, offset, stream):
+    """Write one chunk at `offset`; the upload is stored once its last byte arrives"""
+    meta = _read_meta(upload_id, user_id)
+    if meta['stored_name']:
+        raise UploadError('Upload already complete', 409, offset=meta['size'])
+
+    part_path, _, lock_path = _paths(upload_id)
+    try:
+        lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            stale = time.time() - os.path.getmtime(lock_path) >= LOCK_TIMEOUT_SECONDS
+        except FileNotFoundError:
+            stale = True
+        if not stale:
+            raise UploadError('Another chunk is being written', 409)
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        return append_chunk(upload_id, user_id, offset, stream)
+
+    try:
+        current = os.path.getsize(part_path)
+        if offset != current:
+            raise UploadError('Offset does not match the upload', 409, offset=current)
+
+        with _hashers_lock:
+            cached = _hashers.pop(upload_id, None)
+        hasher = cached[1] if cached and cached[0] == current else _hash_file(part_path)
+
+        with open(part_path, 'r+b') as out:
+            out.seek(current)
+            try:
+                current += _copy(stream, out, hasher, meta['size'] - current)
+            except BaseException:
+                # Leave the upload resumable from the last complete chunk
+                out.truncate(offset)
+                raise
+
+        if current == meta['size']:
+            _finish(upload_id, meta, hasher)
+        else:
+            with _hashers_lock:
+                _hashers[upload_id] = (current, hasher)
+                while len(_hashers) > MAX_CACHED_HASHERS:
+                    _hashers.popitem(last=False)
+    finally:
+        os.close(lock)
+        os.remove(lock_path)
+
+    return upload_status(upload_id, user_id)
+
+
+def claim_upload(upload_id, user_id):
+    """Take a finished upload for a record; returns (stored name, original filename)"""
+    meta = _read_meta(upload_id, user_id)
+    if not meta['stored_name']:
+        raise UploadError('Upload is not complete', 409)
+    os.remove(_paths(upload_id)[1])
+    return meta['stored_name'], meta['filename']
+
+
+def cleanup_stale_uploads(max_age_hours=24):
+    """Delete partial and unclaimed uploads older than max_age_hours; returns how many"""
+    cutoff = time.time() - max_age_hours * 3600
+    folder = _partial_folder()
+    removed = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += name.endswith('.json')
+    return removed
+
+
+def upload_path(filename):
+    """Absolute path of a stored upload, or 404 if there is no such file"""
+    folder = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return path
+
+
+def nginx_etag(stat):
+    """The ETag nginx generates for a static file, so app and proxy validators agree"""
+    return f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+
+
+def _accel_redirect(path, filename):
+    # nginx streams the file from an internal location; the app only answers
+    # revalidations itself so those never reach the disk
+    stat = os.stat(path)
+    response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.set_etag(nginx_etag(stat))
+    response.last_modified = stat.st_mtime
+    response.make_conditional(request.environ)
+    if response.status_code != 304:
+        response.headers['X-Accel-Redirect'] = app.config['UPLOAD_ACCEL_PREFIX'] + quote(filename)
+    return response
+
+
+def serve_upload(filename, immutable=None):
+    """Send an upload with validators and cache headers, offloading to the web server if configured.
+
+    UPLOAD_OFFLOAD is '' (stream from Python), 'x-accel' (nginx) or
+    'x-sendfile' (Apache/lighttpd).  Range requests and If-None-Match /
+    If-Modified-Since are answered in every mode.  `immutable` defaults to
+    whether the name is a content address.
+    """
+    path = upload_path(filename)
+    mode = app.config.get('UPLOAD_OFFLOAD')
+    if mode == 'x-accel':
+        response = _accel_redirect(path, filename)
+    else:
+        response = send_file(path, request.environ, conditional=True,
+                             use_x_sendfile=mode == 'x-sendfile',
+                             response_class=app.response_class)
+
+    # Uploads are medical data behind a login, so never in shared caches
+    response.cache_control.private = True
+    if immutable is None:
+        immutable = bool(CONTENT_ADDRESSED_NAME.match(filename))
+    if immutable:
+        # send_file marks every response no-cache unless told otherwise
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
@@ -1,8 +1,16 @@
-from datetime import datetime, timedelta
-from flask import current_app
-from sqlalchemy import and_, func
+import gzip
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from flask import current_app, request
+from sqlalchemy import and_, bindparam, case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, defer, joinedload
 from app import db
-from models import Notification, Appointment, Message, User, MedicalRecord
+from dates import clinic_now, clinic_today, in_window
+from events import queue_notification, queue_unread_counts
+from models import Notification, Appointment, Message, User, MedicalRecord, LabTestBooking
+from pagination import keyset_paginate
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
 
@@ -11,61 +19,148 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_notification(user_id, title, message, notification_type='system'):
-    """Create a new notification for a user"""
-    notification = Notification(
-        user_id=user_id,
-        title=title,
-        message=message,
-        notification_type=notification_type
+def adjust_unread_counts(user_id, messages=0, notifications=0):
+    """Shift a user's unread counters inside the current transaction"""
+    values = {}
+    if messages:
+        values[User.unread_messages_count] = User.unread_messages_count + messages
+    if notifications:
+        values[User.unread_notifications_count] = User.unread_notifications_count + notifications
+    if values:
+        db.session.execute(update(User).where(User.id == user_id).values(values))
+        queue_unread_counts(user_id)
+
+def mark_read(item, user_id, **counts):
+    """Mark a message or notification read and lower the user's counter by `counts`, without committing.
+
+    The conditional UPDATE lets only one of several concurrent requests flip
+    the flag, and only that one touches the counter; returns whether it did.
+    """
+    model = type(item)
+    result = db.session.execute(
+        update(model).where(model.id == item.id, model.is_read == False)
+        .values(is_read=True, read_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        return False
+    adjust_unread_counts(user_id, **counts)
+    return True
+
+def reconcile_unread_counts():
+    """Rebuild every user's unread counters from the messages and notifications tables"""
+    unread_messages = select(func.count()).select_from(Message).where(
+        and_(Message.recipient_id == User.id, Message.is_read == False)
+    ).scalar_subquery()
+    unread_notifications = select(func.count()).select_from(Notification).where(
+        and_(Notification.user_id == User.id, Notification.is_read == False)
+    ).scalar_subquery()
+
+    result = db.session.execute(
+        update(User).where(
+            (User.unread_messages_count != unread_messages) |
+            (User.unread_notifications_count != unread_notifications)
+        ).values(
+            unread_messages_count=unread_messages,
+            unread_notifications_count=unread_notifications
+        ).execution_options(synchronize_session=False)
     )
-    db.session.add(notification)
     db.session.commit()
-    return notification
+    return result.rowcount
+
+def create_notifications(notifications):
+    """Add (user_id, title, message, notification_type) tuples with one INSERT, without committing"""
+    rows = [
+        {'user_id': user_id, 'title': title, 'message': message, 'notification_type': notification_type}
+        for user_id, title, message, notification_type in notifications
+    ]
+    if not rows:
+        return 0
+    
+    db.session.execute(insert(Notification), rows)
+    
+    # Bump every recipient's unread counter in one executemany
+    added = Counter(row['user_id'] for row in rows)
+    users = User.__table__
+    db.session.execute(
+        users.update()
+        .where(users.c.id == bindparam('recipient_id'))
+        .values(unread_notifications_count=users.c.unread_notifications_count + bindparam('added')),
+        [{'recipient_id': user_id, 'added': count} for user_id, count in added.items()]
+    )
+    
+    for row in rows:
+        queue_notification(row)
+    for user_id in added:
+        queue_unread_counts(user_id)
+    return len(rows)
+
+def _count_where(condition):
+    """Conditional COUNT that works on both SQLite and PostgreSQL"""
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def _sum_where(column, condition):
+    """Conditional SUM that works on both SQLite and PostgreSQL"""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
 
 def get_dashboard_stats(user):
-    """Get dashboard statistics for a user"""
+    """Get dashboard statistics for a user in a single query"""
+    # appointment_date is clinic wall-clock time
+    now = clinic_now()
+    unread_messages = select(func.count()).select_from(Message).where(
+        and_(Message.recipient_id == user.id, Message.is_read == False)
+    ).scalar_subquery()
+
     if not user.is_staff():
         # Patient stats
-        stats = {
-            'total_appointments': Appointment.query.filter_by(patient_id=user.id).count(),
-            'upcoming_appointments': Appointment.query.filter(
-                and_(Appointment.patient_id == user.id,
-                     Appointment.appointment_date > datetime.utcnow(),
-                     Appointment.status.in_(['scheduled', 'confirmed']))
-            ).count(),
-            'unread_messages': Message.query.filter_by(recipient_id=user.id, is_read=False).count(),
-            'medical_records': MedicalRecord.query.filter_by(patient_id=user.id).count()
-        }
+        appointments = select(
+            func.count().label('total_appointments'),
+            _count_where(and_(Appointment.appointment_date > now,
+                              Appointment.status.in_(['scheduled', 'confirmed']))).label('upcoming_appointments')
+        ).where(Appointment.patient_id == user.id).subquery()
+
+        query = select(
+            appointments.c.total_appointments,
+            appointments.c.upcoming_appointments,
+            unread_messages.label('unread_messages'),
+            select(func.count()).select_from(LabTestBooking).where(
+                and_(LabTestBooking.user_id == user.id,
+                     LabTestBooking.status == 'in_progress')
+            ).scalar_subquery().label('pending_lab_results'),
+            select(func.count()).select_from(MedicalRecord).where(
+                MedicalRecord.patient_id == user.id
+            ).scalar_subquery().label('medical_records')
+        )
+    elif user.user_type == 'doctor':
+        appointments = select(
+            func.count(Appointment.patient_id.distinct()).label('total_patients'),
+            _sum_where(Appointment.fee_amount, Appointment.payment_status == 'pending').label('pending_payments')
+        ).where(Appointment.doctor_id == user.id).subquery()
+
+        query = select(
+            # Its own subquery so the day range is an index range, not a per-row test
+            select(func.count()).select_from(Appointment).where(
+                and_(Appointment.doctor_id == user.id,
+                     in_window(Appointment.appointment_date, 'day'))
+            ).scalar_subquery().label('todays_appointments'),
+            appointments.c.total_patients,
+            unread_messages.label('unread_messages'),
+            appointments.c.pending_payments
+        )
     else:
-        # Staff stats
-        today = datetime.utcnow().date()
-        
-        if user.user_type == 'doctor':
-            stats = {
-                'todays_appointments': Appointment.query.filter(
-                    and_(Appointment.doctor_id == user.id,
-                         func.date(Appointment.appointment_date) == today)
-                ).count(),
-                'total_patients': db.session.query(User.id).join(
-                    Appointment, User.id == Appointment.patient_id
-                ).filter(Appointment.doctor_id == user.id).distinct().count(),
-                'unread_messages': Message.query.filter_by(recipient_id=user.id, is_read=False).count(),
-                'pending_payments': db.session.query(func.sum(Appointment.fee_amount)).filter(
-                    and_(Appointment.doctor_id == user.id,
-                         Appointment.payment_status == 'pending')
-                ).scalar() or 0
-            }
-        else:
-            # General staff stats
-            stats = {
-                'total_appointments': Appointment.query.count(),
-                'total_patients': User.query.filter_by(user_type='patient').count(),
-                'unread_messages': Message.query.filter_by(recipient_id=user.id, is_read=False).count(),
-                'total_staff': User.query.filter(User.user_type.in_(['doctor', 'nurse'])).count()
-            }
-    
-    return stats
+        # General staff stats
+        users = select(
+            _count_where(User.user_type == 'patient').label('total_patients'),
+            _count_where(User.user_type.in_(['doctor', 'nurse'])).label('total_staff')
+        ).subquery()
+
+        query = select(
+            select(func.count()).select_from(Appointment).scalar_subquery().label('total_appointments'),
+            users.c.total_patients,
+            unread_messages.label('unread_messages'),
+            users.c.total_staff
+        )
+
+    return dict(db.session.execute(query).one()._mapping)
 
 def format_currency(amount):
     """Format amount as currency"""
@@ -94,12 +189,49 @@ def get_payment_status_color(status):
     }
     return color_map.get(status, 'secondary')
 
+def parse_datetime_arg(name):
+    """Parse an ISO 8601 query string argument as a naive datetime, or None"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        # FullCalendar sends local wall-clock times with an offset; appointments are stored naive
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+# Rows shown per window of profile history; older rows are loaded on demand
+HISTORY_PAGE_SIZE = 20
+
+def appointment_history(patient_id, cursor=None, per_page=HISTORY_PAGE_SIZE):
+    """A window of a patient's appointments, newest first, without the notes text"""
+    query = Appointment.query.filter_by(patient_id=patient_id)\
+        .options(defer(Appointment.notes, raiseload=True))
+    return keyset_paginate(query, [(Appointment.appointment_date, True), (Appointment.id, True)],
+                           cursor=cursor, per_page=per_page)
+
+def medical_record_history(patient_id, cursor=None, per_page=HISTORY_PAGE_SIZE):
+    """A window of a patient's medical records, newest first, without symptoms and treatment"""
+    query = MedicalRecord.query.filter_by(patient_id=patient_id).options(
+        defer(MedicalRecord.symptoms, raiseload=True),
+        defer(MedicalRecord.treatment, raiseload=True),
+        joinedload(MedicalRecord.doctor).load_only(User.first_name, User.last_name)
+    )
+    return keyset_paginate(query, [(MedicalRecord.created_at, True), (MedicalRecord.id, True)],
+                           cursor=cursor, per_page=per_page)
+
+def notification_history(user_id, cursor=None, per_page=HISTORY_PAGE_SIZE):
+    """A window of a user's notifications, newest first"""
+    query = Notification.query.filter_by(user_id=user_id)
+    return keyset_paginate(query, [(Notification.created_at, True), (Notification.id, True)],
+                           cursor=cursor, per_page=per_page)
+
 def calculate_age(birth_date):
     """Calculate age from birth date"""
     if not birth_date:
         return None
     
-    today = datetime.utcnow().date()
+    today = clinic_today()
     age = today.year - birth_date.year
     
     if today.month < birth_date.month or (today.month == birth_date.month and today.day < birth_date.day):
@@ -107,78 +239,167 @@ def calculate_age(birth_date):
     
     return age
 
-def get_next_available_slots(doctor_id, days_ahead=7):
-    """Get next available appointment slots for a doctor"""
-    slots = []
-    start_date = datetime.utcnow().date() + timedelta(days=1)  # Start from tomorrow
-    
-    # Working hours: 9 AM to 5 PM, 30-minute slots
-    working_hours = list(range(9, 17))  # 9 AM to 4:30 PM (last slot)
+# Working hours: 9 AM to 5 PM in 30-minute slots (last slot 4:30 PM)
+WORK_DAY_START = time(9, 0)
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 16
+FULL_DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+ACTIVE_APPOINTMENT_STATUSES = ['scheduled', 'confirmed']
+
+def _busy_mask(start_offset, duration):
+    """Bitmap of the day's slots overlapped by an appointment starting start_offset minutes after opening"""
+    first = max(start_offset // SLOT_MINUTES, 0)
+    last = min(-(-(start_offset + duration) // SLOT_MINUTES), SLOTS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def get_available_slots(doctor_ids, days_ahead=7, start_date=None):
+    """Map each doctor to their free slots over the coming weekdays, using one range query"""
+    if start_date is None:
+        start_date = clinic_today() + timedelta(days=1)  # Start from tomorrow
+    days = [start_date + timedelta(days=offset) for offset in range(days_ahead)]
+    days = [day for day in days if day.weekday() < 5]  # Skip weekends
     
-    for day_offset in range(days_ahead):
-        current_date = start_date + timedelta(days=day_offset)
-        
-        # Skip weekends (assuming Monday=0, Sunday=6)
-        if current_date.weekday() >= 5:  # Saturday and Sunday
-            continue
-        
-        # Check existing appointments for this day
-        existing_appointments = Appointment.query.filter(
-            and_(Appointment.doctor_id == doctor_id,
-                 func.date(Appointment.appointment_date) == current_date,
-                 Appointment.status.in_(['scheduled', 'confirmed']))
-        ).all()
-        
-        existing_times = [apt.appointment_date.time() for apt in existing_appointments]
-        
-        # Generate available slots
-        for hour in working_hours:
-            for minute in [0, 30]:  # 30-minute intervals
-                slot_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                
-                if slot_time.time() not in existing_times:
-                    slots.append(slot_time)
+    # One bitmap per (doctor, day), bit n set when slot n is taken
+    busy = defaultdict(int)
+    appointments = db.session.query(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.duration_minutes
+    ).filter(
+        and_(Appointment.doctor_id.in_(doctor_ids),
+             in_window(Appointment.appointment_date, 'day', start_date, days_ahead),
+             Appointment.status.in_(ACTIVE_APPOINTMENT_STATUSES))
+    )
+    for doctor_id, appointment_date, duration in appointments:
+        opening = datetime.combine(appointment_date.date(), WORK_DAY_START)
+        offset = int((appointment_date - opening).total_seconds() // 60)
+        busy[doctor_id, appointment_date.date()] |= _busy_mask(offset, duration or SLOT_MINUTES)
     
-    return slots[:20]  # Return first 20 available slots
+    available = {}
+    for doctor_id in doctor_ids:
+        slots = []
+        for day in days:
+            free = ~busy[doctor_id, day] & FULL_DAY_MASK
+            opening = datetime.combine(day, WORK_DAY_START)
+            while free:
+                slot = (free & -free).bit_length() - 1  # Lowest free slot
+                slots.append(opening + timedelta(minutes=slot * SLOT_MINUTES))
+                free &= free - 1
+        available[doctor_id] = slots
+    return available
+
+def get_next_available_slots(doctor_id, days_ahead=7):
+    """Get next available appointment slots for a doctor"""
+    return get_available_slots([doctor_id], days_ahead)[doctor_id][:20]  # Return first 20 available slots
+
+def get_first_available_slot(doctor_ids, days_ahead=7):
+    """Earliest free (slot, doctor_id) across many doctors, or None"""
+    candidates = [(slots[0], doctor_id)
+                  for doctor_id, slots in get_available_slots(doctor_ids, days_ahead).items() if slots]
+    return min(candidates) if candidates else None
+
+def reserve_appointment(**fields):
+    """Insert an appointment, or return None if the doctor's slot is already taken"""
+    # The uq_appointments_doctor_active_slot index decides, so concurrent workers
+    # cannot both pass a check-then-insert. A conflict rolls back the whole session.
+    appointment = Appointment(**fields)
+    db.session.add(appointment)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return appointment
 
 def send_appointment_reminder():
-    """Send appointment reminders (to be called by a scheduled task)"""
+    """Send appointment reminders (run daily by the send_appointment_reminders job)"""
     # Get appointments for tomorrow
-    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    tomorrow = clinic_today() + timedelta(days=1)
     
-    appointments = Appointment.query.filter(
-        and_(func.date(Appointment.appointment_date) == tomorrow,
-             Appointment.status.in_(['scheduled', 'confirmed']))
-    ).all()
+    Patient = aliased(User)
+    Doctor = aliased(User)
+    appointments = db.session.query(
+        Appointment.patient_id,
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Patient.first_name.label('patient_first_name'),
+        Patient.last_name.label('patient_last_name'),
+        Doctor.first_name.label('doctor_first_name'),
+        Doctor.last_name.label('doctor_last_name')
+    ).join(Patient, Patient.id == Appointment.patient_id)\
+     .join(Doctor, Doctor.id == Appointment.doctor_id)\
+     .filter(and_(in_window(Appointment.appointment_date, 'day', tomorrow),
+                  Appointment.status.in_(['scheduled', 'confirmed'])))
     
+    notifications = []
     for appointment in appointments:
-        # Create reminder notification for patient
-        create_notification(
+        time_str = appointment.appointment_date.strftime("%I:%M %p")
+        # Reminder for patient
+        notifications.append((
             appointment.patient_id,
             'Appointment Reminder',
-            f'You have an appointment with Dr. {appointment.doctor.full_name} tomorrow at {appointment.appointment_date.strftime("%I:%M %p")}',
+            f'You have an appointment with Dr. {appointment.doctor_first_name} {appointment.doctor_last_name} tomorrow at {time_str}',
             'appointment'
-        )
-        
-        # Create reminder notification for doctor
-        create_notification(
+        ))
+        # Reminder for doctor
+        notifications.append((
             appointment.doctor_id,
             'Appointment Reminder',
-            f'You have an appointment with {appointment.patient.full_name} tomorrow at {appointment.appointment_date.strftime("%I:%M %p")}',
+            f'You have an appointment with {appointment.patient_first_name} {appointment.patient_last_name} tomorrow at {time_str}',
             'appointment'
-        )
-
-def cleanup_old_notifications(days_old=30):
-    """Clean up old read notifications"""
-    cutoff_date = datetime.utcnow() - timedelta(days=days_old)
-    
-    old_notifications = Notification.query.filter(
-        and_(Notification.is_read == True,
-             Notification.created_at < cutoff_date)
-    ).all()
-    
-    for notification in old_notifications:
-        db.session.delete(notification)
+        ))
     
+    created = create_notifications(notifications)
     db.session.commit()
-    return len(old_notifications)
+    return created
+
+# Rows removed per DELETE when purging notifications; every batch commits on
+# its own so locks are held briefly and memory stays flat
+NOTIFICATION_PURGE_BATCH_SIZE = 5000
+
+def _archive_notifications(rows, archive_path):
+    # Each call appends a gzip member, and the concatenation is still one valid stream
+    with gzip.open(archive_path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps({key: value.isoformat() if isinstance(value, datetime) else value
+                                      for key, value in row._mapping.items()}) + '\n')
+
+def cleanup_old_notifications(days_old=30, batch_size=NOTIFICATION_PURGE_BATCH_SIZE, archive_path=None, progress=None):
+    """Delete old read notifications in batches (run daily by the cleanup_old_notifications job).
+
+    With archive_path each batch is appended to a gzipped JSON-lines file
+    before it is deleted.  progress(removed) is called after every batch.
+    Returns the number of notifications removed.
+    """
+    cutoff_date = datetime.utcnow() - timedelta(days=days_old)
+    notifications = Notification.__table__
+    old_read = select(notifications.c.id).where(
+        and_(notifications.c.is_read == True,
+             notifications.c.created_at < cutoff_date)
+    ).order_by(notifications.c.created_at).limit(batch_size)
+
+    removed = 0
+    while True:
+        if archive_path:
+            rows = db.session.execute(
+                select(*notifications.c).where(notifications.c.id.in_(old_read.scalar_subquery()))
+            ).all()
+            if not rows:
+                break
+            _archive_notifications(rows, archive_path)
+            deleted = db.session.execute(
+                notifications.delete().where(notifications.c.id.in_([row.id for row in rows]))
+            ).rowcount
+        else:
+            deleted = db.session.execute(
+                notifications.delete().where(notifications.c.id.in_(old_read.scalar_subquery()))
+            ).rowcount
+        db.session.commit()
+        if not deleted:
+            break
+        removed += deleted
+        if progress:
+            progress(removed)
+    return removed